@@ -0,0 +1,367 @@
+"""
+Approximate nearest-neighbour search
+------------------------------------
+An inverted-file (IVF) vector store for corpora that are too large to scan
+exhaustively. Vectors are assigned to the nearest of `nlist` k-means
+centroids; a query only scans the `nprobe` lists whose centroids are closest
+to it, so `nprobe` trades recall for latency.
+
+Partitions stay exact (a flat scan) until they reach `train_threshold`
+vectors, then the coarse quantizer is trained and retrained whenever the
+partition has grown `retrain_factor` times since the last training.
+
+Training runs in a background thread on a snapshot of the partition, so
+queries and upserts carry on against the current lists meanwhile. The new
+lists are swapped in under the store lock, replaying the writes made since
+the snapshot.
+"""
+
+import math
+import threading
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+
+from metafilter import parse_filter
+from vectorstore import DEFAULT_NAMESPACE, VectorStore, _Partition, cosine_scores, filtered_search, top_k_indices
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _assign(data: np.ndarray, centroids: np.ndarray, chunk: int = 65536) -> np.ndarray:
+    """Index of the most similar centroid for every row of `data`."""
+    assignment = np.empty(len(data), dtype=np.int64)
+    for start in range(0, len(data), chunk):
+        assignment[start : start + chunk] = np.argmax(data[start : start + chunk] @ centroids.T, axis=1)
+    return assignment
+
+
+def train_centroids(
+    vectors: np.ndarray,
+    nlist: int,
+    iterations: int = 10,
+    sample_size: Optional[int] = None,
+    seed: int = 0,
+) -> np.ndarray:
+    """Spherical k-means over (a sample of) `vectors`, returning unit-norm centroids."""
+    rng = np.random.default_rng(seed)
+    sample_size = sample_size or 64 * nlist
+    if len(vectors) > sample_size:
+        vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    data = _normalize(np.asarray(vectors, dtype=np.float32))
+    nlist = min(nlist, len(data))
+    centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _assign(data, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, data)
+        counts = np.bincount(assignment, minlength=nlist)
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty clusters with random points so no list is wasted.
+            sums[empty] = data[rng.choice(len(data), int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+    return centroids
+
+
+def default_nlist(size: int) -> int:
+    """Number of inverted lists for a partition of `size` vectors."""
+    return max(1, min(int(4 * math.sqrt(size)), size // 32))
+
+
+class _IVFPartition:
+    """One namespace: a flat partition until trained, inverted lists afterwards."""
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self.flat: Optional[_Partition] = _Partition(dimension)
+        self.centroids: Optional[np.ndarray] = None
+        self.lists: List[_Partition] = []
+        self.assignment: Dict[str, int] = {}
+        self.trained_size = 0
+        # ids written since the snapshot a training is running on
+        self.changes: Optional[Set[str]] = None
+
+    def __len__(self):
+        if self.flat is not None:
+            return len(self.flat)
+        return len(self.assignment)
+
+    def snapshot(self):
+        """(ids, vectors, metadata, changes) to train on; writes from now on are recorded in `changes`."""
+        partitions = [self.flat] if self.flat is not None else self.lists
+        ids = [id for partition in partitions for id in partition.ids]
+        if not ids:
+            return None
+        vectors = np.concatenate([partition.matrix[: len(partition)] for partition in partitions])
+        metadata = [entry for partition in partitions for entry in partition.metadata]
+        self.changes = set()
+        return ids, vectors, metadata, self.changes
+
+    def build(self, ids, vectors, metadata, nlist: Optional[int] = None, iterations: int = 10):
+        """Centroids, inverted lists and assignment for a snapshot; touches no state of the partition."""
+        centroids = train_centroids(vectors, nlist or default_nlist(len(ids)), iterations)
+        lists = [_Partition(self.dimension, capacity=64) for _ in range(len(centroids))]
+        assignment = {}
+        for id, vector, entry, list_no in zip(ids, vectors, metadata, _assign(_normalize(vectors), centroids)):
+            lists[list_no].put(id, vector, entry)
+            assignment[id] = int(list_no)
+        return centroids, lists, assignment
+
+    def install(self, centroids, lists, assignment, trained_size: int, changes: Set[str]) -> bool:
+        """Swap in lists built from the snapshot that started `changes`, then replay those writes."""
+        if self.changes is not changes:
+            return False
+        current = {}
+        for id in changes:
+            located = self.locate(id)
+            if located is not None:
+                owner, row = located
+                current[id] = (owner.matrix[row].copy(), owner.metadata[row])
+        self.centroids, self.lists, self.assignment = centroids, lists, assignment
+        self.flat = None
+        self.trained_size = trained_size
+        self.changes = None
+        for id in changes:
+            if id in current:
+                self.put(id, *current[id])
+            else:
+                self.remove(id)
+        return True
+
+    def put(self, id: str, vector: np.ndarray, metadata):
+        if self.changes is not None:
+            self.changes.add(id)
+        if self.flat is not None:
+            self.flat.put(id, vector, metadata)
+            return
+        norm = np.linalg.norm(vector)
+        list_no = int(np.argmax(self.centroids @ (vector / norm if norm > 0 else vector)))
+        previous = self.assignment.get(id)
+        if previous is not None and previous != list_no:
+            self.lists[previous].remove(id)
+        self.lists[list_no].put(id, vector, metadata)
+        self.assignment[id] = list_no
+
+    def remove(self, id: str) -> bool:
+        if self.changes is not None:
+            self.changes.add(id)
+        if self.flat is not None:
+            return self.flat.remove(id)
+        list_no = self.assignment.pop(id, None)
+        return list_no is not None and self.lists[list_no].remove(id)
+
+    def locate(self, id: str):
+        if self.flat is not None:
+            row = self.flat.rows.get(id)
+            return (self.flat, row) if row is not None else None
+        list_no = self.assignment.get(id)
+        if list_no is None:
+            return None
+        partition = self.lists[list_no]
+        return partition, partition.rows[id]
+
+    def search(self, query: np.ndarray, top_k: int, nprobe: int):
+        """Return [(score, partition, row)] for the best top_k candidates."""
+        query_norm = np.linalg.norm(query)
+        if self.flat is not None:
+            probed = [self.flat]
+        else:
+            unit = query / query_norm if query_norm > 0 else query
+            probed = [self.lists[i] for i in top_k_indices(self.centroids @ unit, nprobe)]
+        scores, owners, rows = [], [], []
+        for partition in probed:
+            size = len(partition)
+            if size == 0:
+                continue
+            list_scores = cosine_scores(partition.matrix[:size], partition.norms[:size], query)
+            best = top_k_indices(list_scores, top_k)
+            scores.append(list_scores[best])
+            owners.extend([partition] * len(best))
+            rows.append(best)
+        if not scores:
+            return []
+        scores = np.concatenate(scores)
+        rows = np.concatenate(rows)
+        return [(float(scores[i]), owners[i], int(rows[i])) for i in top_k_indices(scores, top_k)]
+
+    def search_filtered(self, parsed, query: np.ndarray, top_k: int):
+        """Exact search over the rows matching a parsed filter in every list.
+
+        Probing only `nprobe` lists could miss matches of a selective
+        filter, and the matching rows are few enough to score them all.
+        """
+        partitions = [self.flat] if self.flat is not None else self.lists
+        results = []
+        for partition in partitions:
+            rows, scores = filtered_search(partition, parsed, query, top_k)
+            results.extend((float(score), partition, int(row)) for row, score in zip(rows, scores))
+        results.sort(key=lambda result: -result[0])
+        return results[:top_k]
+
+
+class IVFStore(VectorStore):
+    """Vector store backed by an inverted-file index with tunable `nprobe`."""
+
+    def __init__(
+        self,
+        dimension: Optional[int] = None,
+        nlist: Optional[int] = None,
+        nprobe: int = 16,
+        train_threshold: int = 20000,
+        retrain_factor: float = 4.0,
+    ):
+        self.dimension = dimension
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_threshold = train_threshold
+        self.retrain_factor = retrain_factor
+        self._partitions: Dict[str, _IVFPartition] = {}
+        self._training: Dict[str, threading.Thread] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return sum(len(partition) for partition in self._partitions.values())
+
+    def _as_vector(self, vector) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32).reshape(-1)
+        if self.dimension is None:
+            self.dimension = array.shape[0]
+        elif array.shape[0] != self.dimension:
+            raise ValueError(f"Vector dimension {array.shape[0]} does not match store dimension {self.dimension}")
+        return array
+
+    def _maybe_train(self, namespace: str, partition: _IVFPartition):
+        size = len(partition)
+        if partition.flat is not None:
+            if size >= self.train_threshold:
+                self._train(namespace, partition)
+        elif size >= partition.trained_size * self.retrain_factor:
+            self._train(namespace, partition)
+
+    def _train(self, namespace: str, partition: _IVFPartition) -> Optional[threading.Thread]:
+        """Start training `namespace` in the background unless it already is; call with the lock held."""
+        running = self._training.get(namespace)
+        if running is not None and running.is_alive():
+            return running
+        snapshot = partition.snapshot()
+        if snapshot is None:
+            return None
+        thread = threading.Thread(
+            target=self._train_snapshot, args=(partition, snapshot), name=f"ivf-train-{namespace}", daemon=True
+        )
+        self._training[namespace] = thread
+        thread.start()
+        return thread
+
+    def _train_snapshot(self, partition: _IVFPartition, snapshot):
+        ids, vectors, metadata, changes = snapshot
+        try:
+            trained = partition.build(ids, vectors, metadata, self.nlist)
+        except Exception:
+            with self._lock:
+                if partition.changes is changes:
+                    partition.changes = None
+            raise
+        with self._lock:
+            partition.install(*trained, len(ids), changes)
+
+    def wait_for_training(self, namespace: Optional[str] = None):
+        """Block until background training of `namespace` (default: every namespace) has finished."""
+        with self._lock:
+            threads = [
+                thread for name, thread in self._training.items() if namespace is None or name == namespace
+            ]
+        for thread in threads:
+            thread.join()
+
+    def rebuild(self, namespace: str = DEFAULT_NAMESPACE):
+        """Retrain the coarse quantizer of `namespace` from its current vectors and wait for it.
+
+        Queries keep being served from the current lists while it trains.
+        """
+        self.wait_for_training(namespace)
+        with self._lock:
+            partition = self._partitions.get(namespace)
+            thread = self._train(namespace, partition) if partition is not None else None
+        if thread is not None:
+            thread.join()
+
+    def upsert(self, items, namespace=DEFAULT_NAMESPACE):
+        count = 0
+        with self._lock:
+            for id, vector, metadata in items:
+                array = self._as_vector(vector)
+                partition = self._partitions.get(namespace)
+                if partition is None:
+                    partition = self._partitions[namespace] = _IVFPartition(self.dimension)
+                partition.put(str(id), array, dict(metadata or {}))
+                count += 1
+            if namespace in self._partitions:
+                self._maybe_train(namespace, self._partitions[namespace])
+        return count
+
+    def query(
+        self,
+        vector,
+        top_k=5,
+        namespace=DEFAULT_NAMESPACE,
+        include_values=False,
+        include_metadata=True,
+        quantization=None,
+        filter=None,
+        nprobe: Optional[int] = None,
+    ):
+        parsed = parse_filter(filter)
+        with self._lock:
+            partition = self._partitions.get(namespace)
+            if partition is None or len(partition) == 0 or top_k <= 0:
+                return {"matches": [], "namespace": namespace}
+            if parsed:
+                results = partition.search_filtered(parsed, self._as_vector(vector), top_k)
+            else:
+                results = partition.search(self._as_vector(vector), top_k, nprobe or self.nprobe)
+            matches = []
+            for score, owner, row in results:
+                match = {"id": owner.ids[row], "score": score}
+                if include_values:
+                    match["values"] = owner.matrix[row].copy()
+                if include_metadata:
+                    match["metadata"] = owner.metadata[row]
+                matches.append(match)
+        return {"matches": matches, "namespace": namespace}
+
+    def fetch(self, ids, namespace=DEFAULT_NAMESPACE):
+        result = {}
+        with self._lock:
+            partition = self._partitions.get(namespace)
+            if partition is None:
+                return result
+            for id in ids:
+                located = partition.locate(str(id))
+                if located is not None:
+                    owner, row = located
+                    result[str(id)] = {
+                        "id": str(id),
+                        "values": owner.matrix[row].tolist(),
+                        "metadata": owner.metadata[row],
+                    }
+        return result
+
+    def exists(self, ids, namespace=DEFAULT_NAMESPACE):
+        with self._lock:
+            partition = self._partitions.get(namespace)
+            if partition is None:
+                return []
+            return [str(id) for id in ids if partition.locate(str(id)) is not None]
+
+    def delete(self, ids, namespace=DEFAULT_NAMESPACE):
+        with self._lock:
+            partition = self._partitions.get(namespace)
+            if partition is None:
+                return 0
+            return sum(partition.remove(str(id)) for id in ids)
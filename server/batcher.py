@@ -0,0 +1,84 @@
+"""
+Micro-batching
+--------------
+Coalesces items submitted concurrently from many callers into batches, so
+providers that accept batches (Cohere embed, vector upserts) are called once
+per batch instead of once per item. A batch is flushed when it reaches
+`max_batch_size` items or `max_wait` seconds after its first item arrived.
+
+An item whose result is an exception fails only that caller, so `process`
+can reject one bad item without failing the others in its batch; an
+exception raised by `process` itself fails the whole batch.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List
+
+
+class MicroBatcher:
+    """Runs `process(items) -> results` over batches of submitted items.
+
+    `process` returns one result per item, in order; an Exception instance
+    as a result is raised to that item's caller only.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 96,
+        max_wait: float = 0.01,
+        name: str = "micro-batcher",
+    ):
+        self.process = process
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.name = name
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, item: Any) -> Future:
+        """Queue one item; the returned future resolves to its result."""
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._thread.start()
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Callers may have cancelled while their item was queued.
+            pending = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not pending:
+                continue
+            try:
+                results = self.process([item for item, _ in pending])
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+            else:
+                for (_, future), result in zip(pending, results):
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite
+-----------------------
+Runs the server tools against deterministic local stand-ins for Cohere and
+the vector store, so results are repeatable and need no network:
+
+    upload         UploadFragment (single paragraphs, micro-batched)
+    upload_bulk    UploadFragments
+    query          QueryFragment
+    suggest        SuggestFragments (top 50 re-ranked by MMR to 5)
+    contribution   CalculateContribution
+    citations      generate-citations over --sources sources, after one edit per call
+    mcp_tools      SynthiaMcpServer.handle_call_tool for every tool
+
+Every call gets its own prompt or fragment, so searches are not answered
+from the query cache after the first one. The caches and stores the server
+opens live in a temporary directory that is removed afterwards.
+
+Each benchmark reports throughput and p50/p95/p99 latency; --output saves the
+results (with the git commit) as JSON for comparison across runs.
+
+    python bench.py --corpus 20000 --dimension 1024 --concurrency 8
+    python bench.py --only query contribution --backend mmap --output run.json
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+
+BENCHMARKS = ("upload", "upload_bulk", "query", "suggest", "contribution", "citations", "mcp_tools")
+
+
+class FakeCohere:
+    """Deterministic stand-in for cohere.Client: the same text always embeds the same."""
+
+    def __init__(self, dimension=1024, latency=0.0):
+        self.dimension = dimension
+        self.latency = latency
+        self.calls = 0
+
+    def embed(self, texts, model=None, input_type=None):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        embeddings = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+            embeddings.append(np.random.default_rng(seed).standard_normal(self.dimension).astype(np.float32).tolist())
+        return SimpleNamespace(embeddings=embeddings)
+
+
+def corpus(size, seed=0):
+    """Reproducible pseudo-paragraphs."""
+    rng = np.random.default_rng(seed)
+    words = ["model", "protocol", "fragment", "citation", "genome", "quantum", "energy", "network", "theory",
+             "data", "analysis", "learning", "cell", "carbon", "signal", "paper", "method", "result"]
+    return [
+        f"Paragraph {i}: " + " ".join(rng.choice(words, size=int(rng.integers(30, 120))))
+        for i in range(size)
+    ]
+
+
+def summarize(name, latencies, wall, operations=None):
+    latencies = np.asarray(latencies) * 1000.0
+    operations = operations or len(latencies)
+    return {
+        "benchmark": name,
+        "operations": operations,
+        "seconds": round(wall, 4),
+        "throughput_per_s": round(operations / wall, 2) if wall > 0 else None,
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+    }
+
+
+def run_threaded(name, function, arguments, concurrency):
+    """Call function(*args) for every args tuple on `concurrency` threads."""
+
+    def timed(args):
+        started = time.perf_counter()
+        function(*args)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(timed, arguments))
+    return summarize(name, latencies, time.perf_counter() - started)
+
+
+def run_async(name, handler, requests, concurrency):
+    """Await handler(request) for every request with at most `concurrency` in flight."""
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def timed(request):
+            async with semaphore:
+                started = time.perf_counter()
+                await handler(request)
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(timed(request) for request in requests))
+        return latencies, time.perf_counter() - started
+
+    latencies, wall = asyncio.run(main())
+    return summarize(name, latencies, wall)
+
+
+def tool_request(name, arguments):
+    """CallTool request usable by both main.py (request.params) and testmain.py (request)."""
+    return SimpleNamespace(name=name, arguments=arguments, params=SimpleNamespace(name=name, arguments=arguments))
+
+
+def load_mcp_server():
+    try:
+        from main import SynthiaMcpServer
+
+        return SynthiaMcpServer()
+    except ImportError:
+        from testmain import SynthiaMcpServer
+
+        return SynthiaMcpServer(mock=False)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True, cwd=os.path.dirname(__file__) or "."
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=int, default=5000, help="fragments preloaded before query benchmarks")
+    parser.add_argument("--dimension", type=int, default=1024)
+    parser.add_argument("--operations", type=int, default=500, help="calls per benchmark")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--fragments", type=int, default=200, help="fragment ids per CalculateContribution call")
+    parser.add_argument("--sources", type=int, default=5000, help="sources in the citations benchmark's project")
+    parser.add_argument("--backend", default="local", choices=["local", "ivf", "mmap"])
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="simulated provider latency")
+    parser.add_argument("--embed-cache", action="store_true", help="keep the in-memory embedding cache enabled")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--output", help="write the results as JSON to this path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # server opens its caches on import; keep them out of the working directory
+        os.environ["VECTOR_BACKEND"] = args.backend
+        os.environ["FRAGMENT_STORE_PATH"] = os.path.join(directory, "fragments")
+        os.environ["EMBED_CACHE_PATH"] = os.path.join(directory, "embedding_cache.sqlite3")
+        os.environ["DEDUPE_INDEX_PATH"] = os.path.join(directory, "dedupe_index.sqlite3")
+        os.environ["PROJECT_DB_PATH"] = os.path.join(directory, "projects.sqlite3")
+
+        import projectstore
+        import server
+        from embedcache import EmbeddingCache
+        from vectorstore import create_store
+
+        logging.getLogger("synthia_mcp_server").setLevel(logging.WARNING)
+        server.co = FakeCohere(args.dimension, args.embed_latency_ms / 1000.0)
+        server.store = create_store(args.backend, path=os.path.join(directory, "fragments"))
+        server.embed_cache = EmbeddingCache(None, max_bytes=(1 << 30) if args.embed_cache else 0)
+        projectstore._default_store = projectstore.ProjectStore(os.path.join(directory, "projects.sqlite3"))
+
+        paragraphs = corpus(args.corpus + args.operations)
+        preload, fresh = paragraphs[: args.corpus], paragraphs[args.corpus :]
+        started = time.perf_counter()
+        server.UploadFragments(preload)
+        preload_seconds = time.perf_counter() - started
+        ids = [str(server.uuid.uuid5(server.uuid.NAMESPACE_DNS, paragraph)) for paragraph in preload]
+        rng = np.random.default_rng(1)
+
+        results = []
+        if "upload" in args.only:
+            results.append(run_threaded("upload", server.UploadFragment, [(p,) for p in fresh], args.concurrency))
+        if "upload_bulk" in args.only:
+            batch = 96
+            bulk = corpus(args.operations * 4, seed=2)
+            chunks = [(bulk[i : i + batch],) for i in range(0, len(bulk), batch)]
+            result = run_threaded("upload_bulk", server.UploadFragments, chunks, args.concurrency)
+            result["paragraphs_per_s"] = round(len(bulk) / result["seconds"], 2)
+            results.append(result)
+        if "query" in args.only:
+            prompts = [(f"query {i} " + preload[int(rng.integers(len(preload)))][:200],) for i in range(args.operations)]
+            results.append(run_threaded("query", server.QueryFragment, prompts, args.concurrency))
+        if "suggest" in args.only:
+            prompts = [(f"suggest {i} " + preload[int(rng.integers(len(preload)))][:200],) for i in range(args.operations)]
+            results.append(run_threaded("suggest", server.SuggestFragments, prompts, args.concurrency))
+        if "contribution" in args.only:
+            calls = [
+                (f"paper {i} " + " ".join(preload[:3]), list(rng.choice(ids, min(args.fragments, len(ids)), replace=False)))
+                for i in range(max(1, args.operations // 5))
+            ]
+            results.append(run_threaded("contribution", server.CalculateContribution, calls, args.concurrency))
+        if "citations" in args.only:
+            mcp_server = load_mcp_server()
+            store = projectstore.default_store()
+            sources = [
+                {"title": paragraph[:60], "authors": [f"Author{i % 97} Given", "Second Author"], "year": 1990 + i % 30,
+                 "journal": "Journal of Benchmarks", "volume": i % 40, "pages": f"{i}-{i + 9}"}
+                for i, paragraph in enumerate(corpus(args.sources, seed=3))
+            ]
+            store.add_sources("proj_bench_citations", sources)
+            arguments = {"project_id": "proj_bench_citations", "format": "apa", "limit": 100}
+            started = time.perf_counter()
+            asyncio.run(mcp_server.handle_call_tool(tool_request("generate-citations", arguments)))
+            first_ms = (time.perf_counter() - started) * 1000
+
+            edits = iter(range(args.operations))
+
+            async def edit_and_cite(request):
+                # One changed source per call, so each call re-formats exactly one reference
+                i = next(edits)
+                edited = {**sources[i % len(sources)], "issue": i + 1}
+                await asyncio.to_thread(store.add_sources, "proj_bench_citations", [edited])
+                return await mcp_server.handle_call_tool(request)
+
+            requests = [tool_request("generate-citations", arguments) for _ in range(args.operations)]
+            result = run_async("citations", edit_and_cite, requests, 1)
+            result["first_call_ms"] = round(first_ms, 3)
+            results.append(result)
+        if "mcp_tools" in args.only:
+            mcp_server = load_mcp_server()
+            asyncio.run(mcp_server.handle_call_tool(tool_request("project-init", {"project_name": "Bench Project"})))
+            fragments = corpus(args.operations, seed=4)
+            contexts = [f"context {i} " + preload[i % len(preload)][:200] for i in range(args.operations)]
+            tools = [
+                ("project-init", lambda i: {"project_name": f"Bench Project {i}"}),
+                ("suggest-fragment", lambda i: {"project_id": "proj_bench_project", "context": contexts[i]}),
+                ("save-fragment", lambda i: {"project_id": "proj_bench_project", "fragment": fragments[i]}),
+                ("generate-citations", lambda i: {"project_id": "proj_bench_project", "format": "apa"}),
+            ]
+            for name, arguments in tools:
+                requests = [tool_request(name, arguments(i)) for i in range(args.operations)]
+                results.append(run_async(f"mcp_tools:{name}", mcp_server.handle_call_tool, requests, args.concurrency))
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "config": vars(args),
+        "preload_seconds": round(preload_seconds, 4),
+        "results": results,
+    }
+    print(f"{'benchmark':<32} {'ops/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for result in results:
+        print(
+            f"{result['benchmark']:<32} {result['throughput_per_s']:>10} "
+            f"{result['p50_ms']:>9} {result['p95_ms']:>9} {result['p99_ms']:>9}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
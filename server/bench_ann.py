@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Recall vs latency report for the IVF index
+------------------------------------------
+Builds an exact NumpyStore and an IVFStore over the same vectors and reports,
+for each nprobe setting, recall@k against exact search together with query
+latency percentiles. The last row is measured while the index retrains in
+the background. Use it to pick ANN_NLIST / ANN_NPROBE per deployment.
+
+    python bench_ann.py --size 1000000 --dimension 1024 --nprobe 4 8 16 32 64
+    python bench_ann.py --vectors corpus.npy --queries 500
+"""
+
+import argparse
+import json
+import threading
+import time
+
+import numpy as np
+
+from ann import IVFStore
+from vectorstore import NumpyStore
+
+
+def synthetic_vectors(size, dimension, clusters, seed=0):
+    """Clustered Gaussian vectors, closer to real embeddings than pure noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    labels = rng.integers(0, clusters, size)
+    vectors = np.empty((size, dimension), dtype=np.float32)
+    for start in range(0, size, 65536):
+        stop = min(start + 65536, size)
+        noise = rng.standard_normal((stop - start, dimension)).astype(np.float32)
+        vectors[start:stop] = centers[labels[start:stop]] + 0.75 * noise
+    return vectors
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", help=".npy file of float32 vectors to index instead of synthetic data")
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dimension", type=int, default=1024)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64])
+    parser.add_argument("--output", help="write the report as JSON to this path")
+    args = parser.parse_args()
+
+    if args.vectors:
+        vectors = np.load(args.vectors, mmap_mode="r").astype(np.float32)
+    else:
+        vectors = synthetic_vectors(args.size, args.dimension, args.clusters)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), args.queries, replace=False)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+    ids = [str(i) for i in range(len(vectors))]
+
+    exact = NumpyStore()
+    ivf = IVFStore(nlist=args.nlist, train_threshold=len(vectors))
+    started = time.perf_counter()
+    exact.upsert(zip(ids, vectors, [None] * len(ids)))
+    print(f"exact build: {time.perf_counter() - started:.2f}s")
+    started = time.perf_counter()
+    ivf.upsert(zip(ids, vectors, [None] * len(ids)))
+    ivf.wait_for_training()
+    print(f"ivf build:   {time.perf_counter() - started:.2f}s")
+
+    truth, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        matches = exact.query(query, top_k=args.top_k, include_metadata=False)["matches"]
+        latencies.append(time.perf_counter() - started)
+        truth.append({match["id"] for match in matches})
+
+    rows = [
+        {
+            "nprobe": None,
+            "recall": 1.0,
+            "p50_ms": percentile_ms(latencies, 50),
+            "p99_ms": percentile_ms(latencies, 99),
+        }
+    ]
+
+    def measure(nprobe, until=None):
+        found, latencies, searched = 0, [], 0
+        while True:
+            for query, expected in zip(queries, truth):
+                started = time.perf_counter()
+                matches = ivf.query(query, top_k=args.top_k, include_metadata=False, nprobe=nprobe)["matches"]
+                latencies.append(time.perf_counter() - started)
+                found += len(expected & {match["id"] for match in matches})
+                searched += 1
+                if until is not None and not until.is_alive():
+                    break
+            if until is None or not until.is_alive():
+                break
+        return {
+            "nprobe": nprobe,
+            "recall": found / (searched * args.top_k),
+            "p50_ms": percentile_ms(latencies, 50),
+            "p99_ms": percentile_ms(latencies, 99),
+        }
+
+    for nprobe in args.nprobe:
+        rows.append(measure(nprobe))
+
+    # Queries keep running against the old lists while a retrain is in progress
+    retrain = threading.Thread(target=ivf.rebuild)
+    started = time.perf_counter()
+    retrain.start()
+    row = measure(ivf.nprobe, until=retrain)
+    retrain.join()
+    row["retrain"] = True
+    rows.append(row)
+    print(f"retrain:     {time.perf_counter() - started:.2f}s")
+
+    print(f"\n{len(vectors)} vectors, dimension {vectors.shape[1]}, recall@{args.top_k}")
+    print(f"{'nprobe':>13} {'recall':>8} {'p50 ms':>9} {'p99 ms':>9}")
+    for row in rows:
+        label = "exact" if row["nprobe"] is None else str(row["nprobe"])
+        if row.get("retrain"):
+            label += " (retrain)"
+        print(f"{label:>13} {row['recall']:>8.3f} {row['p50_ms']:>9.3f} {row['p99_ms']:>9.3f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"size": len(vectors), "dimension": int(vectors.shape[1]), "top_k": args.top_k, "rows": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
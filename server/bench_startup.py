@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Cold start benchmark for the MCP stdio server
+---------------------------------------------
+Spawns `python server.py` the way an MCP client does, sends `initialize`
+followed by `tools/list`, and measures the time from process start to each
+response. Exits non-zero when the median time to the first `tools/list`
+answer exceeds --max-ms, so it can guard against startup regressions.
+
+    python bench_startup.py --runs 5 --max-ms 1500
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _request(id, method, params=None):
+    message = {"jsonrpc": "2.0", "id": id, "method": method}
+    if params is not None:
+        message["params"] = params
+    return (json.dumps(message) + "\n").encode("utf-8")
+
+
+def _read_response(process, id):
+    while True:
+        line = process.stdout.readline()
+        if not line:
+            raise RuntimeError(f"server exited before answering request {id}: {process.stderr.read().decode()}")
+        try:
+            message = json.loads(line)
+        except ValueError:
+            continue  # not a protocol line
+        if message.get("id") == id:
+            return message
+
+
+def measure(script, env):
+    """Seconds from spawn to the initialize and tools/list responses."""
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, script],
+        cwd=os.path.dirname(script),
+        env=env,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    try:
+        process.stdin.write(
+            _request(
+                1,
+                "initialize",
+                {
+                    "protocolVersion": "2024-11-05",
+                    "capabilities": {},
+                    "clientInfo": {"name": "bench_startup", "version": "0"},
+                },
+            )
+        )
+        process.stdin.flush()
+        _read_response(process, 1)
+        initialized = time.perf_counter() - started
+        process.stdin.write(b'{"jsonrpc": "2.0", "method": "notifications/initialized"}\n')
+        process.stdin.write(_request(2, "tools/list"))
+        process.stdin.flush()
+        tools = _read_response(process, 2)
+        listed = time.perf_counter() - started
+    finally:
+        process.kill()
+        process.wait()
+    return initialized, listed, len(tools.get("result", {}).get("tools", []))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--script", default=os.path.join(HERE, "server.py"))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, help="fail if the median tools/list time exceeds this")
+    parser.add_argument("--output", help="write the results as JSON to this path")
+    args = parser.parse_args()
+
+    # No credentials and no network: startup must not depend on either.
+    env = dict(os.environ)
+    env.pop("COHERE_API_KEY", None)
+    env.pop("PINECONE_API_KEY", None)
+
+    runs = [measure(os.path.abspath(args.script), env) for _ in range(args.runs)]
+    initialize_ms = [run[0] * 1000 for run in runs]
+    tools_list_ms = [run[1] * 1000 for run in runs]
+    result = {
+        "runs": args.runs,
+        "tools": runs[0][2],
+        "initialize_ms": {"median": statistics.median(initialize_ms), "min": min(initialize_ms)},
+        "tools_list_ms": {"median": statistics.median(tools_list_ms), "min": min(tools_list_ms)},
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.max_ms is not None and result["tools_list_ms"]["median"] > args.max_ms:
+        print(f"tools/list took {result['tools_list_ms']['median']:.0f} ms, limit is {args.max_ms:.0f} ms", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
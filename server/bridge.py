@@ -1,10 +1,102 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
+import base64
+import io
+import json
+import os
+import uuid
 import numpy as np
 import server as MCP  # Import your existing server module
+from serialize import dumpb
 
 app = Flask(__name__)
 CORS(app)
+# Largest accepted request body; a batch of 10,000 1024-d float32 vectors is 40 MB
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('BRIDGE_MAX_UPLOAD_MB', 256)) * 1024 * 1024
+
+NPY_MAGIC = b'\x93NUMPY'
+RAW_TYPES = ('application/octet-stream', 'application/x-npy')
+
+
+def _response(payload, status=200):
+    return app.response_class(dumpb(payload), status=status, mimetype='application/json')
+
+
+def decode_vectors(buffer, dimension=None):
+    """(n, dimension) float32 matrix from raw little-endian float32 or .npy bytes.
+
+    The matrix is a read-only view of `buffer` (np.frombuffer), not a copy,
+    unless the .npy data has another dtype or Fortran order.
+    """
+    if buffer[:len(NPY_MAGIC)] == NPY_MAGIC:
+        stream = io.BytesIO(buffer)
+        version = np.lib.format.read_magic(stream)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+        elif version == (2, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+        else:
+            raise ValueError(f"Unsupported .npy version {version}")
+        if dtype.kind != 'f' or len(shape) not in (1, 2):
+            raise ValueError(f"Expected a 1-d or 2-d float array, got {dtype} {shape}")
+        count = int(np.prod(shape))
+        vectors = np.frombuffer(buffer, dtype=dtype, count=count, offset=stream.tell())
+        vectors = vectors.reshape(shape, order='F' if fortran_order else 'C').astype('<f4', copy=False)
+        vectors = vectors.reshape(1, -1) if vectors.ndim == 1 else vectors
+    else:
+        if not dimension:
+            raise ValueError("dimension is required for raw float32 vectors")
+        if len(buffer) % (4 * dimension):
+            raise ValueError(f"{len(buffer)} bytes is not a whole number of {dimension}-d float32 vectors")
+        vectors = np.frombuffer(buffer, dtype='<f4').reshape(-1, dimension)
+    if dimension and vectors.shape[1] != dimension:
+        raise ValueError(f"Expected {dimension}-d vectors, got {vectors.shape[1]}-d")
+    return vectors
+
+
+def _batch_request():
+    """(vectors, options) of a batch request.
+
+    Vectors come as a raw float32 or .npy body (application/octet-stream or
+    application/x-npy, options in the query string), as a "vectors" file in a
+    multipart form (options as form fields), or in a JSON body as base64 or
+    as nested float lists.
+    """
+    options = request.args.to_dict()
+    if request.mimetype in RAW_TYPES:
+        payload = request.get_data(cache=False)
+    elif request.mimetype == 'multipart/form-data':
+        options.update(request.form.to_dict())
+        if 'vectors' not in request.files:
+            raise ValueError("vectors file is required")
+        payload = request.files['vectors'].read()
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or data.get('vectors') is None:
+            raise ValueError("vectors are required")
+        options.update(data)
+        payload = data['vectors']
+        if not isinstance(payload, str):
+            vectors = np.asarray(payload, dtype=np.float32)
+            return (vectors.reshape(1, -1) if vectors.ndim == 1 else vectors), options
+        payload = base64.b64decode(payload, validate=True)
+    dimension = int(options['dimension']) if options.get('dimension') else None
+    return decode_vectors(payload, dimension), options
+
+
+def _list_option(options, name):
+    """A list option given as a JSON list or, in query strings and forms, as JSON or comma-separated."""
+    value = options.get(name)
+    if value is None or isinstance(value, list):
+        return value
+    value = str(value)
+    return json.loads(value) if value.lstrip().startswith('[') else value.split(',')
+
+
+def _json_option(options, name):
+    value = options.get(name)
+    return json.loads(value) if isinstance(value, str) else value
+
 
 @app.route('/upsert', methods=['POST'])
 def upsert():
@@ -15,8 +107,73 @@ def upsert():
     if vector is None or metadata is None:
         return jsonify({"error": "vector and metadata are required"}), 400
     
-    MCP.PineconeUpsert(vector, metadata)
-    return jsonify({"status": "success"}), 200
+    # Like uploaded paragraphs, the id defaults to one derived from the text
+    id = data.get('id') or str(uuid.uuid5(uuid.NAMESPACE_DNS, str(metadata.get('text', metadata))))
+    result = MCP.PineconeUpsert(id, vector, metadata, MCP.project_namespace(data.get('project_id')))
+    return jsonify({"status": "success", "id": result["id"]}), 200
+
+@app.route('/upsert_batch', methods=['POST'])
+def upsert_batch():
+    """Upserts many precomputed vectors with ids and optional metadata, one result per item."""
+    try:
+        vectors, options = _batch_request()
+        ids = _list_option(options, 'ids')
+        metadata = _json_option(options, 'metadata')
+    except ValueError as e:
+        return _response({"error": str(e)}, 400)
+    if vectors.ndim != 2 or ids is None or len(ids) != len(vectors):
+        return _response({"error": "one id is required per vector"}, 400)
+    if metadata is not None and (not isinstance(metadata, list) or len(metadata) != len(vectors)):
+        return _response({"error": "metadata must be a list with one entry per vector"}, 400)
+
+    namespace = MCP.project_namespace(options.get('project_id'))
+    dimension = getattr(MCP.get_store(), 'dimension', None)
+    finite = np.isfinite(vectors).all(axis=1)
+    pending, results = [], []
+    for row, id in enumerate(ids):
+        entry = (metadata[row] if metadata else None) or {}
+        error = None
+        if not id:
+            error = "id is empty"
+        elif dimension and vectors.shape[1] != dimension:
+            error = f"Vector dimension {vectors.shape[1]} does not match store dimension {dimension}"
+        elif not finite[row]:
+            error = "vector has non-finite values"
+        else:
+            try:
+                MCP._check_metadata(entry)
+            except (ValueError, TypeError) as e:
+                error = str(e)
+        if error is None:
+            pending.append((len(results), (str(id), vectors[row], entry)))
+            results.append({"id": str(id), "status": "pending"})
+        else:
+            results.append({"id": id, "status": "error", "error": error})
+
+    # Written a chunk at a time, so a store error reports exactly which items landed
+    store_error, status = None, 400
+    for start in range(0, len(pending), MCP.UPSERT_BATCH_SIZE):
+        chunk = pending[start:start + MCP.UPSERT_BATCH_SIZE]
+        try:
+            MCP.PineconeUpsertBatch([item for _, item in chunk], namespace)
+        except Exception as e:
+            store_error = store_error or f"Vector store error: {e}"
+            # The store rejects bad input (such as a dimension mismatch) with ValueError
+            status = status if isinstance(e, ValueError) else 500
+            for index, _ in chunk:
+                results[index] = {**results[index], "status": "error", "error": f"Vector store error: {e}"}
+        else:
+            for index, _ in chunk:
+                results[index]["status"] = "success"
+    upserted_count = sum(result["status"] == "success" for result in results)
+    payload = {
+        "upserted_count": upserted_count,
+        "error_count": len(results) - upserted_count,
+        "results": results,
+    }
+    if store_error is not None:
+        return _response({"error": store_error, **payload}, status)
+    return _response(payload)
 
 @app.route('/query', methods=['POST'])
 def query():
@@ -30,6 +187,35 @@ def query():
     result = MCP.PineconeQuery(vector, top_k)
     return jsonify(result), 200
 
+@app.route('/query_batch', methods=['POST'])
+def query_batch():
+    """Runs one search per vector of the batch, one result per vector."""
+    try:
+        vectors, options = _batch_request()
+        filters = _json_option(options, 'filters')
+    except ValueError as e:
+        return _response({"error": str(e)}, 400)
+    try:
+        top_k = int(options.get('top_k', 5))
+    except (ValueError, TypeError):
+        return _response({"error": "top_k must be an integer"}, 400)
+    include_metadata = str(options.get('include_metadata', '')).lower() in ('1', 'true', 'yes')
+    namespace = MCP.project_namespace(options.get('project_id'))
+
+    finite = np.isfinite(vectors).all(axis=1)
+    results = []
+    for row, vector in enumerate(vectors):
+        if not finite[row]:
+            results.append({"status": "error", "error": "vector has non-finite values"})
+            continue
+        try:
+            matches = MCP.PineconeQuery(vector, top_k, None, namespace, filters, include_metadata)["matches"]
+        except ValueError as e:
+            results.append({"status": "error", "error": str(e)})
+            continue
+        results.append({"status": "success", "matches": matches})
+    return _response({"namespace": namespace, "results": results})
+
 @app.route('/upload_fragment', methods=['POST'])
 def upload_fragment():
     data = request.json
@@ -65,4 +251,4 @@ def calculate_contribution():
     return jsonify(result), 200
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000)
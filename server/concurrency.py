@@ -0,0 +1,157 @@
+"""
+Async helpers for blocking provider clients
+-------------------------------------------
+The Cohere and Pinecone clients are synchronous. BlockingExecutor runs them
+on a bounded thread pool so the event loop stays free, with a per-call
+timeout, and run_until_disconnected stops waiting for work whose HTTP client
+has gone away. SingleFlight lets concurrent identical calls share one
+provider round trip.
+
+A provider request already in flight cannot be interrupted. When the caller
+gives up, a call still queued for a thread is dropped, and a running call is
+flagged so that the next check_cancelled() between its provider round trips
+raises Cancelled. Until it returns, it keeps its thread and its slot, so
+abandoned work still counts against `max_pending`.
+"""
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+_DEFAULT_TIMEOUT = object()
+
+# Set while a BlockingExecutor.run call executes; signalled once its caller gives up
+_cancel_event: ContextVar[Optional[threading.Event]] = ContextVar("cancel_event", default=None)
+
+
+class ClientDisconnected(Exception):
+    """The HTTP client closed the connection before the response was ready."""
+
+
+class ExecutorBusy(Exception):
+    """Every slot of the executor is taken by a running or queued call."""
+
+
+class Cancelled(Exception):
+    """The caller of a BlockingExecutor.run call timed out or disconnected."""
+
+
+def check_cancelled():
+    """Raise Cancelled if the BlockingExecutor.run call running on this thread was abandoned.
+
+    Does nothing outside such a call.
+    """
+    event = _cancel_event.get()
+    if event is not None and event.is_set():
+        raise Cancelled("The caller gave up on this call")
+
+
+def _run_cancellable(event: threading.Event, fn: Callable[[], Any]) -> Any:
+    token = _cancel_event.set(event)
+    try:
+        return fn()
+    finally:
+        _cancel_event.reset(token)
+
+
+class BlockingExecutor:
+    """Bounded thread pool for blocking calls, awaitable from the event loop."""
+
+    def __init__(self, max_workers: int = 16, max_pending: Optional[int] = None, timeout: Optional[float] = 30.0):
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="provider")
+        # Bounds running plus queued calls; a slot is only freed when the
+        # thread finishes, even if the awaiting coroutine was cancelled.
+        self._slots = threading.BoundedSemaphore(max_pending or 4 * max_workers)
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        if not self._slots.acquire(blocking=False):
+            raise ExecutorBusy("Too many pending provider calls")
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    async def run(self, fn: Callable[..., Any], *args, timeout: Any = _DEFAULT_TIMEOUT, **kwargs) -> Any:
+        """Run `fn(*args, **kwargs)` on the pool, raising asyncio.TimeoutError after `timeout` seconds.
+
+        `timeout` defaults to the executor's timeout; pass None to wait indefinitely.
+        If the wait ends early (timeout or cancellation), a call that has not
+        started is dropped and a running one sees check_cancelled() raise.
+        """
+        event = threading.Event()
+        future = self.submit(_run_cancellable, event, functools.partial(fn, *args, **kwargs))
+        try:
+            return await asyncio.wait_for(
+                asyncio.wrap_future(future), self.timeout if timeout is _DEFAULT_TIMEOUT else timeout
+            )
+        finally:
+            if not future.done():
+                event.set()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers with the
+    same key wait for it and receive its result or exception."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"calls": 0, "shared": 0}
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.stats["calls"] += 1
+            else:
+                self.stats["shared"] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._forget(key)
+            future.set_exception(e)
+            raise
+        self._forget(key)
+        future.set_result(result)
+        return result
+
+    def _forget(self, key: Hashable):
+        # Callers arriving after this start a fresh call instead of reusing
+        # a result that is already complete.
+        with self._lock:
+            self._calls.pop(key, None)
+
+
+async def run_until_disconnected(request, awaitable: Awaitable, poll_interval: float = 0.1) -> Any:
+    """Await `awaitable`, cancelling it if the Starlette `request` disconnects first.
+
+    Cancelling a BlockingExecutor.run awaitable flags its thread; see check_cancelled().
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
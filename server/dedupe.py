@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate detection
+------------------------
+MinHash signatures of word shingles plus an LSH banding index. Fragments
+whose estimated Jaccard similarity reaches `threshold` are near-duplicates,
+even when they differ in whitespace, case, citation markers or a few edited
+words. A lookup only touches the fragments that share at least one band
+bucket with the query, so its cost does not grow with the corpus.
+
+    python dedupe.py references.md notes.tex --threshold 0.8
+"""
+
+import argparse
+import json
+import re
+import sqlite3
+import threading
+import zlib
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+# [12], [3, 4], [5-7] and (Smith et al., 2020) style citation markers
+_CITATION = re.compile(r"\[\s*\d+(?:\s*[,\-–]\s*\d+)*\s*\]|\([^()]*\b(?:19|20)\d{2}[a-z]?\)")
+_WORD = re.compile(r"\w+")
+
+
+def shingles(text: str, size: int = 3) -> Set[str]:
+    """Word `size`-grams of `text` after dropping case, punctuation and citation markers."""
+    words = _WORD.findall(_CITATION.sub(" ", text).lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+def candidate_probability(similarity, bands: int, rows: int):
+    """Probability that a pair with this Jaccard similarity shares at least one band."""
+    return 1.0 - (1.0 - np.asarray(similarity, dtype=np.float64) ** rows) ** bands
+
+
+@lru_cache(maxsize=None)
+def optimal_bands(
+    threshold: float, num_perm: int, false_positive_weight: float = 0.1, false_negative_weight: float = 0.9
+) -> Tuple[int, int]:
+    """(bands, rows) with bands * rows <= num_perm minimizing the weighted
+    false positive plus false negative probability mass around `threshold`.
+
+    False negatives weigh more by default: a missed pair is never seen again,
+    while a false candidate only costs one signature comparison in query().
+    """
+    grid_low = np.linspace(0.0, threshold, 200)
+    grid_high = np.linspace(threshold, 1.0, 200)
+    best, best_error = (1, num_perm), float("inf")
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            # Riemann sums over the evenly spaced grids
+            false_positive = candidate_probability(grid_low, bands, rows).mean() * threshold
+            false_negative = (1.0 - candidate_probability(grid_high, bands, rows)).mean() * (1.0 - threshold)
+            error = false_positive_weight * false_positive + false_negative_weight * false_negative
+            if error < best_error:
+                best, best_error = (bands, rows), error
+    return best
+
+
+class MinHasher:
+    """Computes fixed-length MinHash signatures with seeded multiply-shift hashes."""
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 3, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        # h -> (a * h + b mod 2**64) >> 32 with odd a; the products wrap in
+        # uint64, which avoids a much slower modulo by a prime
+        self._a = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """The text's signature, or None if it has no words to compare (e.g. only "[1]")."""
+        grams = shingles(text, self.shingle_size)
+        if not grams:
+            return None
+        hashes = np.fromiter((zlib.crc32(gram.encode("utf-8")) for gram in grams), dtype=np.uint64, count=len(grams))
+        # One small (shingles x num_perm) block per text stays in cache;
+        # hashing a whole batch at once was measurably slower
+        permuted = (hashes[:, None] * self._a + self._b) >> np.uint64(32)
+        return permuted.min(axis=0).astype(np.uint32)
+
+
+def jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+class MinHashIndex:
+    """LSH index over MinHash signatures, optionally persisted to SQLite.
+
+    `path` keeps signatures in a SQLite table so the index survives restarts;
+    several namespaces (`name`) can share one file.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        num_perm: int = 128,
+        shingle_size: int = 3,
+        path: Optional[str] = None,
+        name: str = "default",
+    ):
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm, shingle_size)
+        self.bands, self.rows = optimal_bands(threshold, num_perm)
+        self.name = name
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._buckets: List[Dict[bytes, Set[str]]] = [defaultdict(set) for _ in range(self.bands)]
+        self._lock = threading.RLock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS signatures "
+                "(name TEXT NOT NULL, id TEXT NOT NULL, signature BLOB NOT NULL, PRIMARY KEY (name, id))"
+            )
+            self._db.commit()
+            for id, blob in self._db.execute("SELECT id, signature FROM signatures WHERE name = ?", (name,)):
+                signature = np.frombuffer(blob, dtype=np.uint32)
+                if len(signature) == num_perm:
+                    self._insert(id, signature)
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def __contains__(self, id: str):
+        return id in self._signatures
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[band * self.rows : (band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def _insert(self, id: str, signature: np.ndarray):
+        self._signatures[id] = signature
+        for buckets, key in zip(self._buckets, self._band_keys(signature)):
+            buckets[key].add(id)
+
+    def _discard(self, id: str) -> bool:
+        signature = self._signatures.pop(id, None)
+        if signature is None:
+            return False
+        for buckets, key in zip(self._buckets, self._band_keys(signature)):
+            bucket = buckets.get(key)
+            if bucket is not None:
+                bucket.discard(id)
+                if not bucket:
+                    del buckets[key]
+        return True
+
+    def add(self, id: str, text: str, signature: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """Index `text` under `id`; texts without words are not indexed (None is returned)."""
+        signature = self.hasher.signature(text) if signature is None else signature
+        if signature is None:
+            return None
+        with self._lock:
+            self._discard(id)
+            self._insert(id, signature)
+            self._persist([(id, signature)])
+        return signature
+
+    def _persist(self, entries: List[Tuple[str, np.ndarray]]):
+        """Write (id, signature) pairs to the SQLite table in one transaction."""
+        if self._db is None or not entries:
+            return
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO signatures (name, id, signature) VALUES (?, ?, ?)",
+                [(self.name, id, signature.tobytes()) for id, signature in entries],
+            )
+
+    def remove(self, ids: Iterable[str]) -> int:
+        with self._lock:
+            removed = [id for id in ids if self._discard(id)]
+            if self._db is not None and removed:
+                with self._db:
+                    self._db.executemany(
+                        "DELETE FROM signatures WHERE name = ? AND id = ?", [(self.name, id) for id in removed]
+                    )
+        return len(removed)
+
+    def query(
+        self, text: Optional[str] = None, signature: Optional[np.ndarray] = None, exclude: Optional[str] = None
+    ) -> List[Tuple[str, float]]:
+        """[(id, similarity)] of indexed fragments at or above the threshold, most similar first."""
+        signature = self.hasher.signature(text) if signature is None else signature
+        if signature is None:
+            return []
+        with self._lock:
+            candidates: Set[str] = set()
+            for buckets, key in zip(self._buckets, self._band_keys(signature)):
+                candidates.update(buckets.get(key, ()))
+            candidates.discard(exclude)
+            scored = [(id, jaccard(signature, self._signatures[id])) for id in candidates]
+        return sorted(((id, score) for id, score in scored if score >= self.threshold), key=lambda item: -item[1])
+
+    def screen(self, id: str, text: str, keep_duplicates: bool = True) -> List[Tuple[str, float]]:
+        """Near-duplicates of `text`, then index it under `id` unless it has
+        some and `keep_duplicates` is false. Atomic, so two concurrent copies
+        cannot both pass as originals. Texts without words are not screened."""
+        signature = self.hasher.signature(text)
+        if signature is None:
+            return []
+        with self._lock:
+            matches = self.query(signature=signature, exclude=id)
+            if keep_duplicates or not matches:
+                self.add(id, text, signature)
+        return matches
+
+    def screen_many(self, texts: Dict[str, str], keep_duplicates: bool = True) -> Dict[str, List[Tuple[str, float]]]:
+        """screen() for every {id: text} in order, so a text also matches those
+        before it in the batch; the batch's signatures are written to disk in
+        one transaction."""
+        signatures = {id: self.hasher.signature(text) for id, text in texts.items()}
+        results: Dict[str, List[Tuple[str, float]]] = {}
+        indexed = []
+        with self._lock:
+            for id, signature in signatures.items():
+                if signature is None:
+                    results[id] = []
+                    continue
+                results[id] = self.query(signature=signature, exclude=id)
+                if keep_duplicates or not results[id]:
+                    self._discard(id)
+                    self._insert(id, signature)
+                    indexed.append((id, signature))
+            self._persist(indexed)
+        return results
+
+    def groups(self) -> List[List[str]]:
+        """Clusters of indexed ids that are (transitively) near-duplicates of each other."""
+        with self._lock:
+            parent = {id: id for id in self._signatures}
+
+            def find(id):
+                while parent[id] != id:
+                    parent[id] = parent[parent[id]]
+                    id = parent[id]
+                return id
+
+            for id, signature in self._signatures.items():
+                for other, _ in self.query(signature=signature, exclude=id):
+                    parent[find(other)] = find(id)
+            clusters: Dict[str, List[str]] = defaultdict(list)
+            for id in self._signatures:
+                clusters[find(id)].append(id)
+        return sorted((sorted(ids) for ids in clusters.values() if len(ids) > 1), key=len, reverse=True)
+
+    def report(self) -> Dict[str, object]:
+        """Summary of the near-duplicate groups in the index."""
+        groups = self.groups()
+        return {
+            "threshold": self.threshold,
+            "fragments": len(self),
+            "duplicate_groups": len(groups),
+            "redundant_fragments": sum(len(group) - 1 for group in groups),
+            "groups": groups,
+        }
+
+
+def dedupe_report(
+    texts: Sequence[Tuple[str, str]],
+    threshold: float = 0.8,
+    num_perm: int = 128,
+    shingle_size: int = 3,
+) -> Dict[str, object]:
+    """Near-duplicate groups among (id, text) pairs."""
+    index = MinHashIndex(threshold, num_perm, shingle_size)
+    for id, text in texts:
+        index.add(id, text)
+    return index.report()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="documents to check")
+    parser.add_argument("--threshold", type=float, default=0.8, help="Jaccard similarity of near-duplicates")
+    parser.add_argument("--max-chars", type=int, default=1500)
+    parser.add_argument("--overlap", type=int, default=0)
+    args = parser.parse_args()
+
+    from ingest import chunk_document, detect_format
+
+    texts = []
+    for path in args.paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for chunk in chunk_document(f, format=detect_format(path), max_chars=args.max_chars, overlap=args.overlap):
+                texts.append((f"{path}#{chunk['index']}", chunk["text"]))
+    print(json.dumps(dedupe_report(texts, threshold=args.threshold), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from server import UploadFragment, QueryFragment, CalculateContribution
+from server import UploadFragments, QueryFragment, CalculateContribution
 
 # Upload a fragment
 paragraphs = ["Photosynthesis is the process by which green plants, algae, and some bacteria convert light energy into chemical energy. Using chlorophyll, they absorb sunlight and use it to transform carbon dioxide and water into glucose and oxygen, playing a critical role in Earth's carbon cycle.",
@@ -8,24 +8,17 @@ paragraphs = ["Photosynthesis is the process by which green plants, algae, and s
 "Claude 3.5 Sonnet is adept at quickly building MCP server implementations, making it easy for organizations and individuals to rapidly connect their most important datasets with a range of AI-powered tools. To help developers start exploring, we’re sharing pre-built MCP servers for popular enterprise systems like Google Drive, Slack, GitHub, Git, Postgres, and Puppeteer.",
 "As AI assistants gain mainstream adoption, the industry has invested heavily in model capabilities, achieving rapid advances in reasoning and quality. Yet even the most sophisticated models are constrained by their isolation from data—trapped behind information silos and legacy systems. Every new data source requires its own custom implementation, making truly connected systems difficult to scale."            
 ]
-for p in paragraphs:
-    UploadFragment({"text": p})
+UploadFragments(paragraphs)
 
 
 
 #Retrieve similar fragments
 prompt = "Tell me about Model Context Protocol"
 QueryFragment(prompt) # returns something like the following:
-# {'matches': [{'id': 'id1',
-#               'metadata': {'metadata_key': p1},
-#               'score': 1.00039208,
-#               'values': []},
-#              {'id': 'id2',
-#               'metadata': {'metadata_key': p2},
-#               'score': 0.410071,
-#               'values': []}],
+# {'matches': [{'id': 'id1', 'score': 1.00039208},
+#              {'id': 'id2', 'score': 0.410071}],
 #  'namespace': 'mcp-namespace',
-#  'usage': {'read_units': 6}} YOU WILL NEED TO RETURN THE IDS LATER FOR CONTRIBUTION CALCULATION
+#  'cached': False} YOU WILL NEED TO RETURN THE IDS LATER FOR CONTRIBUTION CALCULATION
 
 
 
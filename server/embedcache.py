@@ -0,0 +1,125 @@
+"""
+Embedding cache
+---------------
+Content-addressed cache for embedding vectors, keyed by a hash of
+(model, input_type, text). A bounded in-memory LRU sits in front of an
+on-disk SQLite table so cached embeddings survive restarts.
+
+Vectors are held as read-only float32 arrays, 4 bytes per value rather than
+a Python float object each, and the memory tier is bounded by their total
+size in bytes. The SQLite tier keeps at most `max_rows` rows, dropping the
+least recently written ones.
+"""
+
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+
+def cache_key(model: str, input_type: str, text: str) -> str:
+    """Stable key for one embedding request."""
+    digest = hashlib.sha256()
+    for part in (model, input_type, text):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """Two-tier (memory LRU + SQLite) embedding cache with hit/miss counters."""
+
+    def __init__(self, path: Optional[str] = None, max_bytes: int = 64 << 20, max_rows: int = 100000):
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self._memory: "OrderedDict[str, numpy.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self._rows = 0  # upper bound on the rows on disk; recounted before trimming
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            self._db.commit()
+            self._rows = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self.stats: Dict[str, int] = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "disk_evictions": 0}
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes of vector data held in memory."""
+        return self._bytes
+
+    def _remember(self, key: str, vector: "numpy.ndarray"):
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous.nbytes
+        self._memory[key] = vector
+        self._bytes += vector.nbytes
+        while self._bytes > self.max_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._bytes -= evicted.nbytes
+            self.stats["evictions"] += 1
+
+    def _trim_disk(self):
+        # INSERT OR REPLACE gives a rewritten key a new rowid, so the lowest
+        # rowids are the least recently written rows
+        self._rows = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = self._rows - self.max_rows
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY rowid LIMIT ?)",
+                (excess,),
+            )
+            self._rows -= excess
+            self.stats["disk_evictions"] += excess
+
+    def get(self, model: str, input_type: str, text: str) -> Optional["numpy.ndarray"]:
+        key = cache_key(model, input_type, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.stats["hits"] += 1
+                return vector
+            if self._db is not None:
+                row = self._db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    import numpy as np
+
+                    vector = np.frombuffer(row[0], dtype=np.float32)  # read-only view of the blob
+                    self._remember(key, vector)
+                    self.stats["disk_hits"] += 1
+                    return vector
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, model: str, input_type: str, text: str, vector) -> None:
+        self.put_many(model, input_type, [(text, vector)])
+
+    def put_many(self, model: str, input_type: str, entries: Iterable[Tuple[str, Sequence[float]]]) -> None:
+        """Cache (text, vector) pairs, writing them to disk in one transaction."""
+        import numpy as np  # loaded on first use, like the server's other heavy modules
+
+        rows = []
+        for text, vector in entries:
+            vector = np.array(vector, dtype=np.float32).reshape(-1)
+            vector.flags.writeable = False  # shared by every caller that hits this entry
+            rows.append((cache_key(model, input_type, text), vector))
+        if not rows:
+            return
+        with self._lock:
+            for key, vector in rows:
+                self._remember(key, vector)
+            if self._db is not None:
+                with self._db:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                        [(key, vector.tobytes()) for key, vector in rows],
+                    )
+                    self._rows += len(rows)
+                    if self._rows > self.max_rows:
+                        self._trim_disk()
+
+    def __len__(self):
+        return len(self._memory)
@@ -0,0 +1,465 @@
+"""
+Memory-mapped fragment store
+----------------------------
+A persistent vector store whose files are memory-mapped rather than loaded,
+so opening it costs a manifest read and every worker process shares the
+same pages through the OS page cache.
+
+Each namespace is a directory holding a manifest and immutable segments.
+A segment is written once per upsert and consists of:
+
+    <segment>.f32         float32 vectors, row-major (count x dimension)
+    <segment>.norms.npy   precomputed L2 norms
+    <segment>.ids.npy     fixed-width utf-8 ids
+    <segment>.order.npy   rows in id order, for binary-searching the ids
+    <segment>.meta.jsonl  one JSON metadata object per row
+    <segment>.meta.npy    byte offsets of each metadata row
+    <segment>.live        one byte per row, cleared when the row is deleted
+    <segment>.int8.npy    int8 codes and their norms (.int8norms.npy)
+    <segment>.binary.npy  packed sign-bit codes
+
+Segments under `small_segment_rows` skip the code files (their codes are
+encoded in memory when queried), and every `max_small_segments` of them are
+merged into one, so a stream of single-fragment upserts keeps the segment
+count low.
+
+Quantized queries scan the small code files and only touch the float32
+matrix for the rescored candidates, so those rows need not stay in memory. Filtered queries score only the rows
+selected by a per-segment metadata index, built on first use. Looking up an
+id is a binary search of each segment's order file, so opening a namespace
+reads nothing but the manifest.
+
+Overwrites and deletes only clear `live` bytes; every write also rewrites the
+manifest, whose version tells other processes that the namespace changed. An overwrite first makes the
+new segment durable and records the superseded rows in the manifest, then
+clears them; if the process dies in between, the next writer finishes the
+job. When the number of segments exceeds `max_segments` the smallest ones
+are merged, dropping dead rows. Writers serialize on a lock file, so several
+processes may write safely.
+"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+from urllib.parse import quote
+
+import numpy as np
+
+from metafilter import MetadataIndex, parse_filter
+from quantize import MODES, QuantizedCodes, check_mode
+from vectorstore import DEFAULT_NAMESPACE, VectorStore, cosine_scores, rescore, top_k_indices
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+MANIFEST = "manifest.json"
+
+
+class _Segment:
+    """Read-only memory maps over one segment's files."""
+
+    def __init__(self, directory: str, name: str, count: int, dimension: int):
+        self.name = name
+        self.count = count
+        base = os.path.join(directory, name)
+        self.live_path = base + ".live"
+        self.vectors = np.memmap(base + ".f32", dtype=np.float32, mode="r", shape=(count, dimension))
+        self.norms = np.load(base + ".norms.npy", mmap_mode="r")
+        self.ids = np.load(base + ".ids.npy", mmap_mode="r")
+        try:
+            self.order = np.load(base + ".order.npy", mmap_mode="r")
+        except FileNotFoundError:
+            self.order = np.argsort(self.ids, kind="stable")
+        self.live = np.memmap(self.live_path, dtype=np.uint8, mode="r", shape=(count,))
+        self._metadata = np.memmap(base + ".meta.jsonl", dtype=np.uint8, mode="r")
+        self._offsets = np.load(base + ".meta.npy", mmap_mode="r")
+        self._base = base
+        self._dimension = dimension
+        self._codes: Dict[str, QuantizedCodes] = {}
+        self._index: Optional[MetadataIndex] = None
+
+    def id(self, row: int) -> str:
+        return self.ids[row].decode("utf-8")
+
+    def find(self, ids: List[str]) -> np.ndarray:
+        """The row holding each of `ids`, or -1; a binary search through `order`, dead rows included."""
+        rows = np.full(len(ids), -1, dtype=np.int64)
+        if not ids or not self.count:
+            return rows
+        keys = [id.encode("utf-8") for id in ids]
+        # Longer keys cannot be present, and casting the ids up to their width would copy the whole column
+        fits = np.array([len(key) <= self.ids.dtype.itemsize for key in keys])
+        probe = np.array(keys, dtype=self.ids.dtype)
+        positions = np.minimum(np.searchsorted(self.ids, probe, sorter=self.order), self.count - 1)
+        candidates = np.asarray(self.order[positions], dtype=np.int64)
+        hit = fits & (self.ids[candidates] == probe)
+        rows[hit] = candidates[hit]
+        return rows
+
+    def metadata(self, row: int) -> Dict[str, Any]:
+        return json.loads(self._metadata[self._offsets[row] : self._offsets[row + 1]].tobytes())
+
+    def index(self) -> MetadataIndex:
+        """Posting lists over this segment's metadata; segments never change, so it is built once."""
+        if self._index is None:
+            index = MetadataIndex(self.count)
+            for row in range(self.count):
+                index.add(row, self.metadata(row))
+            self._index = index
+        return self._index
+
+    def codes(self, mode: str) -> QuantizedCodes:
+        """Memory-mapped codes for `mode`, encoded in memory if the files are missing."""
+        codes = self._codes.get(mode)
+        if codes is None:
+            try:
+                data = np.load(f"{self._base}.{mode}.npy", mmap_mode="r")
+                norms = np.load(f"{self._base}.{mode}norms.npy", mmap_mode="r") if mode == "int8" else None
+                codes = QuantizedCodes(mode, self._dimension, data, norms)
+            except FileNotFoundError:
+                codes = QuantizedCodes.encode(mode, self.vectors)
+            self._codes[mode] = codes
+        return codes
+
+    @staticmethod
+    def write(
+        directory: str,
+        name: str,
+        ids: List[str],
+        vectors: np.ndarray,
+        metadata: List[Dict[str, Any]],
+        quantize: bool = True,
+    ):
+        base = os.path.join(directory, name)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        vectors.tofile(base + ".f32")
+        np.save(base + ".norms.npy", np.linalg.norm(vectors, axis=1).astype(np.float32))
+        encoded = np.array([id.encode("utf-8") for id in ids])
+        np.save(base + ".ids.npy", encoded)
+        np.save(base + ".order.npy", np.argsort(encoded, kind="stable").astype(np.int64))
+        offsets = [0]
+        with open(base + ".meta.jsonl", "wb") as f:
+            for entry in metadata:
+                line = json.dumps(entry, separators=(",", ":")).encode("utf-8") + b"\n"
+                f.write(line)
+                offsets.append(offsets[-1] + len(line))
+        np.save(base + ".meta.npy", np.asarray(offsets, dtype=np.uint64))
+        np.ones(len(ids), dtype=np.uint8).tofile(base + ".live")
+        for mode in MODES if quantize else ():
+            codes = QuantizedCodes.encode(mode, vectors)
+            np.save(f"{base}.{mode}.npy", codes.data)
+            if codes.norms is not None:
+                np.save(f"{base}.{mode}norms.npy", codes.norms)
+
+    @staticmethod
+    def remove(directory: str, name: str):
+        suffixes = [".f32", ".norms.npy", ".ids.npy", ".order.npy", ".meta.jsonl", ".meta.npy", ".live"]
+        suffixes += [f".{mode}.npy" for mode in MODES] + [".int8norms.npy"]
+        for suffix in suffixes:
+            try:
+                os.remove(os.path.join(directory, name + suffix))
+            except FileNotFoundError:
+                pass
+
+
+class _Namespace:
+    """Segments of one namespace, reopened whenever another process rewrites the manifest."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.dimension: Optional[int] = None
+        self.segments: List[_Segment] = []
+        self.next_segment = 0
+        self.version = 0  # bumped by every manifest write, so also by deletes
+        # segment name -> rows superseded by a durable overwrite but possibly still live
+        self.superseded: Dict[str, List[int]] = {}
+        self._stamp = None
+
+    def refresh(self):
+        path = os.path.join(self.directory, MANIFEST)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        if stamp == self._stamp:
+            return
+        with open(path) as f:
+            manifest = json.load(f)
+        self.dimension = manifest["dimension"]
+        self.next_segment = manifest["next_segment"]
+        self.version = manifest.get("version", 0)
+        self.superseded = manifest.get("superseded", {})
+        opened = {segment.name: segment for segment in self.segments}
+        self.segments = [
+            opened.get(entry["name"]) or _Segment(self.directory, entry["name"], entry["count"], self.dimension)
+            for entry in manifest["segments"]
+        ]
+        self._stamp = stamp
+
+    def write_manifest(self):
+        self.version += 1
+        manifest = {
+            "version": self.version,
+            "dimension": self.dimension,
+            "next_segment": self.next_segment,
+            "segments": [{"name": segment.name, "count": segment.count} for segment in self.segments],
+        }
+        if self.superseded:
+            manifest["superseded"] = self.superseded
+        temporary = os.path.join(self.directory, MANIFEST + ".tmp")
+        with open(temporary, "w") as f:
+            json.dump(manifest, f)
+        path = os.path.join(self.directory, MANIFEST)
+        os.replace(temporary, path)
+        # Our own write needs no reload
+        stat = os.stat(path)
+        self._stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def locate(self, ids) -> Dict[str, tuple]:
+        """id -> (segment, row) of the live row of each of `ids` that exists.
+
+        Newer segments win, in case an overwrite has not cleared the old row yet.
+        """
+        ids = list(dict.fromkeys(str(id) for id in ids))
+        located: Dict[str, tuple] = {}
+        for segment in reversed(self.segments):
+            pending = [id for id in ids if id not in located]
+            if not pending:
+                break
+            rows = segment.find(pending)
+            for id, row in zip(pending, rows):
+                if row >= 0 and segment.live[row]:
+                    located[id] = (segment, int(row))
+        return {id: located[id] for id in ids if id in located}
+
+    def __len__(self):
+        return int(sum(int(np.count_nonzero(segment.live)) for segment in self.segments))
+
+
+class MmapStore(VectorStore):
+    """Persistent vector store over memory-mapped, append-only segments."""
+
+    def __init__(
+        self,
+        path: str,
+        dimension: Optional[int] = None,
+        max_segments: int = 16,
+        small_segment_rows: int = 1024,
+        max_small_segments: int = 4,
+    ):
+        self.path = path
+        self.dimension = dimension
+        self.max_segments = max_segments
+        self.small_segment_rows = small_segment_rows
+        self.max_small_segments = max_small_segments
+        self._namespaces: Dict[str, _Namespace] = {}
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+
+    def __len__(self):
+        with self._lock:
+            names = [name for name in os.listdir(self.path) if os.path.isdir(os.path.join(self.path, name))]
+            return sum(len(self._namespace_at(name)) for name in names)
+
+    def _namespace_at(self, directory_name: str) -> _Namespace:
+        namespace = self._namespaces.get(directory_name)
+        if namespace is None:
+            namespace = self._namespaces[directory_name] = _Namespace(os.path.join(self.path, directory_name))
+        namespace.refresh()
+        return namespace
+
+    def _namespace(self, namespace: str) -> _Namespace:
+        return self._namespace_at(quote(namespace, safe=""))
+
+    @contextmanager
+    def _writing(self, namespace: str):
+        """Hold the in-process and cross-process write locks for `namespace`."""
+        with self._lock:
+            state = self._namespace(namespace)
+            os.makedirs(state.directory, exist_ok=True)
+            with open(os.path.join(state.directory, ".lock"), "w") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    state.refresh()
+                    # A writer died between recording superseded rows and clearing them
+                    self._clear_superseded(state)
+                    yield state
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _kill(locations: List[tuple]):
+        by_segment: Dict[str, tuple] = {}
+        for segment, row in locations:
+            by_segment.setdefault(segment.name, (segment, []))[1].append(row)
+        for segment, rows in by_segment.values():
+            live = np.memmap(segment.live_path, dtype=np.uint8, mode="r+", shape=(segment.count,))
+            live[rows] = 0
+            live.flush()
+            del live
+
+    def _clear_superseded(self, state: _Namespace):
+        if not state.superseded:
+            return
+        segments = {segment.name: segment for segment in state.segments}
+        self._kill(
+            [(segments[name], row) for name, rows in state.superseded.items() if name in segments for row in rows]
+        )
+        state.superseded = {}
+        state.write_manifest()
+
+    def _append(self, state: _Namespace, ids, vectors, metadata) -> _Segment:
+        name = f"seg-{state.next_segment:06d}"
+        _Segment.write(state.directory, name, ids, vectors, metadata, quantize=len(ids) >= self.small_segment_rows)
+        state.next_segment += 1
+        segment = _Segment(state.directory, name, len(ids), state.dimension)
+        state.segments.append(segment)
+        return segment
+
+    def upsert(self, items, namespace=DEFAULT_NAMESPACE):
+        latest = {str(id): (vector, dict(metadata or {})) for id, vector, metadata in items}
+        if not latest:
+            return 0
+        ids = list(latest)
+        vectors = np.asarray([latest[id][0] for id in ids], dtype=np.float32).reshape(len(ids), -1)
+        with self._writing(namespace) as state:
+            dimension = state.dimension or self.dimension or vectors.shape[1]
+            if vectors.shape[1] != dimension:
+                raise ValueError(f"Vector dimension {vectors.shape[1]} does not match store dimension {dimension}")
+            state.dimension = dimension
+            superseded: Dict[str, List[int]] = {}
+            for segment, row in state.locate(ids).values():
+                superseded.setdefault(segment.name, []).append(row)
+            self._append(state, ids, vectors, [latest[id][1] for id in ids])
+            # The new rows are durable before the old ones die
+            state.superseded = superseded
+            state.write_manifest()
+            self._clear_superseded(state)
+            small = [segment for segment in state.segments if segment.count < self.small_segment_rows]
+            if len(small) >= max(2, self.max_small_segments):
+                self._merge(state, small)
+            elif len(state.segments) > self.max_segments:
+                self._merge(state)
+        return len(ids)
+
+    def _merge(self, state: _Namespace, segments: Optional[List[_Segment]] = None):
+        """Rewrite `segments` (default: the smaller half) into one segment of live rows."""
+        if segments is None:
+            segments = sorted(state.segments, key=lambda segment: segment.count)[: max(2, len(state.segments) // 2)]
+        ids, vectors, metadata = [], [], []
+        for segment in segments:
+            rows = np.flatnonzero(segment.live)
+            ids.extend(segment.id(row) for row in rows)
+            vectors.append(np.asarray(segment.vectors[rows]))
+            metadata.extend(segment.metadata(row) for row in rows)
+        merged = {segment.name for segment in segments}
+        state.segments = [segment for segment in state.segments if segment.name not in merged]
+        if ids:
+            self._append(state, ids, np.concatenate(vectors), metadata)
+        state.write_manifest()
+        for name in merged:
+            _Segment.remove(state.directory, name)
+
+    def compact(self, namespace: str = DEFAULT_NAMESPACE):
+        """Merge every segment of `namespace` into one, dropping deleted rows."""
+        with self._writing(namespace) as state:
+            if state.segments:
+                self._merge(state, list(state.segments))
+
+    def query(
+        self,
+        vector,
+        top_k=5,
+        namespace=DEFAULT_NAMESPACE,
+        include_values=False,
+        include_metadata=True,
+        quantization=None,
+        filter=None,
+        oversample: Optional[int] = None,
+    ):
+        mode = check_mode(quantization)
+        parsed = parse_filter(filter)
+        with self._lock:
+            state = self._namespace(namespace)
+            if not state.segments or top_k <= 0:
+                return {"matches": [], "namespace": namespace}
+            query = np.asarray(vector, dtype=np.float32).reshape(-1)
+            scores, owners, rows = [], [], []
+            for segment in state.segments:
+                if parsed:
+                    candidates = segment.index().rows(parsed, segment.count)
+                    candidates = candidates[segment.live[candidates] != 0]
+                    candidate_scores = cosine_scores(segment.vectors[candidates], segment.norms[candidates], query)
+                    top = top_k_indices(candidate_scores, top_k)
+                    best, best_scores = candidates[top], candidate_scores[top]
+                elif mode is None:
+                    segment_scores = cosine_scores(segment.vectors, segment.norms, query)
+                    segment_scores[segment.live == 0] = -np.inf
+                    best = top_k_indices(segment_scores, top_k)
+                    best = best[np.isfinite(segment_scores[best])]
+                    best_scores = segment_scores[best]
+                else:
+                    best, best_scores = rescore(
+                        segment.vectors,
+                        segment.norms,
+                        segment.codes(mode),
+                        query,
+                        segment.count,
+                        top_k,
+                        oversample,
+                        live=segment.live,
+                    )
+                scores.append(best_scores)
+                owners.extend([segment] * len(best))
+                rows.append(best)
+            scores = np.concatenate(scores)
+            rows = np.concatenate(rows)
+            matches = []
+            for i in top_k_indices(scores, top_k):
+                segment, row = owners[i], int(rows[i])
+                match = {"id": segment.id(row), "score": float(scores[i])}
+                if include_values:
+                    match["values"] = np.array(segment.vectors[row])
+                if include_metadata:
+                    match["metadata"] = segment.metadata(row)
+                matches.append(match)
+        return {"matches": matches, "namespace": namespace}
+
+    def fetch(self, ids, namespace=DEFAULT_NAMESPACE):
+        result = {}
+        with self._lock:
+            for id, (segment, row) in self._namespace(namespace).locate(ids).items():
+                result[id] = {"id": id, "values": segment.vectors[row].tolist(), "metadata": segment.metadata(row)}
+        return result
+
+    def fetch_vectors(self, ids, namespace=DEFAULT_NAMESPACE):
+        with self._lock:
+            state = self._namespace(namespace)
+            located = state.locate(ids)
+            if not located:
+                return [], np.empty((0, state.dimension or 0), dtype=np.float32)
+            return list(located), np.stack([segment.vectors[row] for segment, row in located.values()])
+
+    def exists(self, ids, namespace=DEFAULT_NAMESPACE):
+        with self._lock:
+            return list(self._namespace(namespace).locate(ids))
+
+    def delete(self, ids, namespace=DEFAULT_NAMESPACE):
+        with self._writing(namespace) as state:
+            doomed = list(state.locate(ids).values())
+            self._kill(doomed)
+            if doomed:
+                state.write_manifest()
+            return len(doomed)
+
+    def version(self, namespace=DEFAULT_NAMESPACE):
+        """The namespace's manifest version, shared by every process using the files."""
+        with self._lock:
+            return self._namespace(namespace).version
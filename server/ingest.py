@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Document ingestion
+------------------
+Streams a text, markdown or LaTeX document into the fragment index. The
+document is read line by line and split into overlapping, section-aware
+chunks; chunks are embedded and upserted in batches by separate stages
+connected through bounded queues, so memory stays flat however large the
+input is and a slow stage applies backpressure to the ones before it.
+
+    python ingest.py thesis.tex --max-chars 1500 --overlap 200
+"""
+
+import argparse
+import json
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+_DONE = object()
+
+_MARKDOWN_HEADING = re.compile(r"^\s{0,3}#{1,6}\s+(.*?)\s*#*\s*$")
+_LATEX_HEADING = re.compile(r"^\s*\\(?:part|chapter|section|subsection|subsubsection|paragraph)\*?\{(.*)\}")
+_LATEX_COMMENT = re.compile(r"(?<!\\)%.*$")
+# Structural LaTeX lines that carry no prose
+_LATEX_SKIP = re.compile(
+    r"^\s*\\(?:documentclass|usepackage|begin\{document\}|end\{document\}|maketitle|tableofcontents"
+    r"|bibliography|bibliographystyle|label|input|include)(?![A-Za-z])"
+)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def detect_format(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".tex", ".latex"):
+        return "latex"
+    if extension in (".md", ".markdown"):
+        return "markdown"
+    return "text"
+
+
+def iter_paragraphs(lines: Iterable[str], format: str = "text") -> Iterator[Dict[str, Any]]:
+    """Yield {"text", "section"} paragraphs, and {"section"} markers at headings."""
+    buffer: List[str] = []
+    for line in lines:
+        if format == "latex":
+            line = _LATEX_COMMENT.sub("", line)
+            if _LATEX_SKIP.match(line):
+                continue
+        heading = None
+        if format == "markdown":
+            match = _MARKDOWN_HEADING.match(line)
+            heading = match.group(1) if match else None
+        elif format == "latex":
+            match = _LATEX_HEADING.match(line)
+            heading = match.group(1) if match else None
+
+        if heading is not None or not line.strip():
+            if buffer:
+                yield {"text": " ".join(buffer)}
+                buffer = []
+            if heading is not None:
+                yield {"section": heading.strip()}
+            continue
+        buffer.append(line.strip())
+    if buffer:
+        yield {"text": " ".join(buffer)}
+
+
+def _split_long(text: str, max_chars: int) -> Iterator[str]:
+    """Split an oversized paragraph at sentence, then word, boundaries."""
+    piece = ""
+    for sentence in _SENTENCE_END.split(text):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if piece:
+                yield piece
+                piece = ""
+            yield sentence[:cut]
+            sentence = sentence[cut:].lstrip()
+        if piece and len(piece) + 1 + len(sentence) > max_chars:
+            yield piece
+            piece = sentence
+        else:
+            piece = f"{piece} {sentence}" if piece else sentence
+    if piece:
+        yield piece
+
+
+def _tail(text: str, overlap: int) -> str:
+    if overlap <= 0 or len(text) <= overlap:
+        return text if overlap > 0 else ""
+    tail = text[-overlap:]
+    space = tail.find(" ")
+    return tail[space + 1 :] if space >= 0 else tail
+
+
+def chunk_document(
+    lines: Iterable[str],
+    format: str = "text",
+    max_chars: int = 1500,
+    overlap: int = 200,
+) -> Iterator[Dict[str, Any]]:
+    """Yield {"text", "section", "index"} chunks of at most about `max_chars` characters.
+
+    Chunks are built from whole paragraphs, never span a section heading, and
+    start with the last `overlap` characters of the previous chunk in the
+    same section.
+    """
+    section = None
+    parts: List[str] = []
+    size = 0
+    fresh = False  # whether `parts` holds text beyond the carried-over overlap
+    index = 0
+
+    def flush(carry: bool):
+        nonlocal parts, size, fresh, index
+        if not fresh:
+            parts, size = [], 0
+            return None
+        text = " ".join(parts)
+        chunk = {"text": text, "section": section, "index": index}
+        index += 1
+        tail = _tail(text, overlap) if carry else ""
+        parts, size, fresh = ([tail], len(tail), False) if tail else ([], 0, False)
+        return chunk
+
+    for item in iter_paragraphs(lines, format):
+        if "section" in item:
+            chunk = flush(carry=False)
+            if chunk:
+                yield chunk
+            section = item["section"]
+            continue
+        for piece in _split_long(item["text"], max_chars):
+            if fresh and size + 1 + len(piece) > max_chars:
+                chunk = flush(carry=True)
+                if chunk:
+                    yield chunk
+            parts.append(piece)
+            size += len(piece) + 1
+            fresh = True
+    chunk = flush(carry=False)
+    if chunk:
+        yield chunk
+
+
+def split_passages(text: str, granularity: str = "paragraph", max_chars: int = 1500) -> List[str]:
+    """Split `text` into paragraphs (at most `max_chars` long) or sentences."""
+    if granularity not in ("paragraph", "sentence"):
+        raise ValueError(f"Unknown granularity {granularity!r}; expected 'paragraph' or 'sentence'")
+    passages = []
+    for item in iter_paragraphs(text.splitlines()):
+        if "text" not in item:
+            continue
+        if granularity == "sentence":
+            passages.extend(sentence.strip() for sentence in _SENTENCE_END.split(item["text"]) if sentence.strip())
+        else:
+            passages.extend(_split_long(item["text"], max_chars))
+    return passages
+
+
+class StageStats:
+    """Items processed and busy time of one pipeline stage."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.batches = 0
+        self.seconds = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "stage": self.name,
+            "items": self.items,
+            "batches": self.batches,
+            "seconds": round(self.seconds, 4),
+            "items_per_second": round(self.items / self.seconds, 2) if self.seconds > 0 else None,
+        }
+
+
+class IngestPipeline:
+    """Chunk -> embed -> upsert, each stage in its own thread behind a bounded queue."""
+
+    def __init__(
+        self,
+        embed: Callable[[List[str]], List[Any]],
+        upsert: Callable[[List[tuple]], Any],
+        batch_size: int = 96,
+        queue_size: int = 4,
+        screen: Optional[Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]] = None,
+    ):
+        self.embed = embed
+        self.upsert = upsert
+        # Called on every chunk before it is embedded; returns the chunk
+        # (possibly annotated) or None to drop it, e.g. as a near-duplicate
+        self.screen = screen
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+
+    def _stage(self, stats: StageStats, work, inbox: queue.Queue, outbox: Optional[queue.Queue], errors: list):
+        while True:
+            batch = inbox.get()
+            if batch is _DONE:
+                break
+            if errors:
+                continue  # keep draining so upstream stages never block
+            started = time.perf_counter()
+            try:
+                result = work(batch)
+            except BaseException as e:
+                errors.append(e)
+                continue
+            stats.seconds += time.perf_counter() - started
+            stats.items += len(batch)
+            stats.batches += 1
+            if outbox is not None:
+                outbox.put(result)
+        if outbox is not None:
+            outbox.put(_DONE)
+
+    def _embed_batch(self, chunks):
+        return list(zip(chunks, self.embed([chunk["text"] for chunk in chunks])))
+
+    def _upsert_batch(self, embedded):
+        items = []
+        for chunk, embedding in embedded:
+            # Same deterministic id as UploadFragment
+            id = str(uuid.uuid5(uuid.NAMESPACE_DNS, chunk["text"]))
+            items.append((id, embedding, {key: value for key, value in chunk.items() if value is not None}))
+        self.upsert(items)
+        return items
+
+    def run(self, chunks: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """Push `chunks` through the embed and upsert stages and return per-stage stats."""
+        chunk_stats, embed_stats, upsert_stats = StageStats("chunk"), StageStats("embed"), StageStats("upsert")
+        to_embed: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        to_upsert: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        upserted: queue.Queue = queue.Queue()
+        errors: list = []
+        workers = [
+            threading.Thread(target=self._stage, args=(embed_stats, self._embed_batch, to_embed, to_upsert, errors), daemon=True),
+            threading.Thread(target=self._stage, args=(upsert_stats, self._upsert_batch, to_upsert, None, errors), daemon=True),
+        ]
+        for worker in workers:
+            worker.start()
+
+        started = time.perf_counter()
+        iterator = iter(chunks)
+        batch: List[Dict[str, Any]] = []
+        dropped = 0
+        try:
+            while not errors:
+                tick = time.perf_counter()
+                chunk = next(iterator, None)
+                chunk_stats.seconds += time.perf_counter() - tick
+                if chunk is None:
+                    break
+                chunk_stats.items += 1
+                if self.screen is not None:
+                    chunk = self.screen(chunk)
+                    if chunk is None:
+                        dropped += 1
+                        continue
+                batch.append(chunk)
+                if len(batch) >= self.batch_size:
+                    chunk_stats.batches += 1
+                    to_embed.put(batch)  # blocks while downstream is saturated
+                    batch = []
+            if batch and not errors:
+                chunk_stats.batches += 1
+                to_embed.put(batch)
+        finally:
+            to_embed.put(_DONE)
+            for worker in workers:
+                worker.join()
+        if errors:
+            raise errors[0]
+
+        return {
+            "status": "success",
+            "chunks": chunk_stats.items,
+            "dropped": dropped,
+            "seconds": round(time.perf_counter() - started, 4),
+            "stages": [stats.as_dict() for stats in (chunk_stats, embed_stats, upsert_stats)],
+        }
+
+
+def ingest_file(
+    path: str,
+    embed: Callable[[List[str]], List[Any]],
+    upsert: Callable[[List[tuple]], Any],
+    format: Optional[str] = None,
+    max_chars: int = 1500,
+    overlap: int = 200,
+    batch_size: int = 96,
+    queue_size: int = 4,
+    screen: Optional[Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]] = None,
+) -> Dict[str, Any]:
+    """Chunk, embed and upsert the document at `path`."""
+    format = format or detect_format(path)
+    source = os.path.basename(path)
+    with open(path, encoding="utf-8", errors="replace") as f:
+        chunks = (
+            dict(chunk, source=source)
+            for chunk in chunk_document(f, format=format, max_chars=max_chars, overlap=overlap)
+        )
+        report = IngestPipeline(embed, upsert, batch_size=batch_size, queue_size=queue_size, screen=screen).run(chunks)
+    report["source"] = source
+    report["format"] = format
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="documents to ingest")
+    parser.add_argument("--format", choices=["text", "markdown", "latex"], help="override format detection")
+    parser.add_argument("--max-chars", type=int, default=1500)
+    parser.add_argument("--overlap", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=96)
+    parser.add_argument("--queue-size", type=int, default=4)
+    parser.add_argument("--project", help="project whose partition receives the chunks")
+    args = parser.parse_args()
+
+    import server
+
+    namespace = server.project_namespace(args.project)
+    for path in args.paths:
+        report = server.ingest_document(
+            path,
+            namespace,
+            format=args.format,
+            max_chars=args.max_chars,
+            overlap=args.overlap,
+            batch_size=args.batch_size,
+            queue_size=args.queue_size,
+        )
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
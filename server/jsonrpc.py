@@ -0,0 +1,279 @@
+"""
+JSON-RPC stdio transport
+------------------------
+A self-contained MCP server loop: JSON-RPC 2.0 messages over stdin/stdout,
+newline-delimited (or with Content-Length headers, which are then used for
+the replies as well). Each request runs as its own task and its response is
+written as soon as it completes, so slow tool calls do not hold up fast
+ones. Batch arrays, `notifications/cancelled` and an in-flight limit
+(MCP_MAX_IN_FLIGHT) are supported.
+
+    server = Server({"name": "synthia", "version": "0.1.0"}, {"capabilities": {"tools": {}}})
+    server.set_request_handler(CallToolRequestSchema, handle_call_tool)
+    await server.connect(StdioServerTransport())
+"""
+
+import asyncio
+import logging
+import os
+import sys
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+
+from serialize import dumpb, loads
+
+logger = logging.getLogger("synthia_mcp_server")
+
+PROTOCOL_VERSION = "2024-11-05"
+# Requests whose handlers run at the same time; further requests wait
+MAX_IN_FLIGHT = int(os.getenv("MCP_MAX_IN_FLIGHT", 16))
+MAX_MESSAGE_BYTES = int(os.getenv("MCP_MAX_MESSAGE_BYTES", 64 * 1024 * 1024))
+
+
+class ErrorCode:
+    ParseError = -32700
+    InvalidRequest = -32600
+    MethodNotFound = -32601
+    InvalidParams = -32602
+    InternalError = -32603
+
+
+class McpError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class ListToolsRequestSchema:
+    method = "tools/list"
+
+    def __init__(self, params=None):
+        self.params = params or {}
+
+
+class CallToolRequestSchema:
+    """A tools/call request; `request.name` and `request.params.name` both work."""
+
+    method = "tools/call"
+
+    def __init__(self, params=None):
+        params = params or {}
+        if not isinstance(params.get("name"), str):
+            raise McpError(ErrorCode.InvalidParams, "Tool name is required")
+        self.name = params["name"]
+        self.arguments = params.get("arguments") or {}
+        self.params = self
+
+
+class StdioServerTransport:
+    """Reads framed messages from stdin and writes them to stdout without blocking the loop."""
+
+    def __init__(self, stdin=None, stdout=None):
+        self.stdin = stdin or sys.stdin.buffer
+        self.stdout = stdout or sys.stdout.buffer
+        self.content_length = False  # reply with headers once the client uses them
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._write_lock = asyncio.Lock()
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        try:
+            self._reader = asyncio.StreamReader(limit=MAX_MESSAGE_BYTES)
+            await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(self._reader), self.stdin)
+        except (OSError, ValueError, NotImplementedError):
+            # Regular files and some consoles cannot be watched; read them on a thread
+            self._reader = None
+        try:
+            transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, self.stdout)
+            self._writer = asyncio.StreamWriter(transport, protocol, None, loop)
+        except (OSError, ValueError, NotImplementedError):
+            self._writer = None
+
+    async def _readline(self) -> bytes:
+        if self._reader is not None:
+            return await self._reader.readline()
+        return await asyncio.to_thread(self.stdin.readline)
+
+    async def _readexactly(self, size: int) -> bytes:
+        if self._reader is not None:
+            return await self._reader.readexactly(size)
+        return await asyncio.to_thread(self.stdin.read, size)
+
+    async def read(self) -> Optional[bytes]:
+        """The next message, or None at end of input."""
+        while True:
+            line = await self._readline()
+            if not line:
+                return None
+            if line.strip():
+                break
+        if line[:15].lower() != b"content-length:":
+            return line
+        self.content_length = True
+        size = int(line.split(b":", 1)[1])
+        while (await self._readline()).strip():
+            pass  # other headers end with a blank line
+        return await self._readexactly(size)
+
+    async def write(self, body: bytes):
+        frame = b"Content-Length: %d\r\n\r\n%s" % (len(body), body) if self.content_length else body + b"\n"
+        async with self._write_lock:
+            if self._writer is not None:
+                self._writer.write(frame)
+                await self._writer.drain()
+            else:
+                await asyncio.to_thread(self._write_blocking, frame)
+
+    def _write_blocking(self, frame: bytes):
+        self.stdout.write(frame)
+        self.stdout.flush()
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def _error(id, code, message) -> Dict[str, Any]:
+    return {"jsonrpc": "2.0", "id": id, "error": {"code": code, "message": message}}
+
+
+def _valid_id(id) -> bool:
+    # Strings and integers (MCP) or null (JSON-RPC); true and false are not integers here
+    return id is None or isinstance(id, str) or (isinstance(id, int) and not isinstance(id, bool))
+
+
+class Server:
+    """Dispatches JSON-RPC requests to handlers registered per request schema."""
+
+    def __init__(self, info: Dict[str, Any], options: Optional[Dict[str, Any]] = None, max_in_flight: int = None):
+        self.info = info
+        self.capabilities = (options or {}).get("capabilities", {})
+        self.max_in_flight = max_in_flight or MAX_IN_FLIGHT
+        self.request_handlers: Dict[str, Any] = {}
+        self.onerror: Optional[Callable[[Exception], None]] = None
+        self._transport = None
+        self._running: Dict[Any, asyncio.Task] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def set_request_handler(self, schema, handler: Callable[[Any], Awaitable[Union[Dict[str, Any], bytes]]]):
+        self.request_handlers[schema.method] = (schema, handler)
+
+    async def connect(self, transport):
+        """Serve requests from `transport` until its input ends."""
+        self._transport = transport
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        await transport.open()
+        pending = set()
+        try:
+            while True:
+                raw = await transport.read()
+                if raw is None:
+                    break
+                # Keep reading while requests run, so cancellations arrive in time
+                task = asyncio.ensure_future(self._receive(raw))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        finally:
+            for task in pending:
+                task.cancel()
+            await transport.close()
+
+    async def _receive(self, raw: bytes):
+        try:
+            message = loads(raw)
+        except ValueError as e:
+            await self._send(_error(None, ErrorCode.ParseError, f"Parse error: {e}"))
+            return
+        if isinstance(message, list):
+            if not message:
+                await self._send(_error(None, ErrorCode.InvalidRequest, "Empty batch"))
+                return
+            # The replies to a batch go out together, as one array
+            responses = await asyncio.gather(*(self._handle(item) for item in message))
+            responses = [response for response in responses if response is not None]
+            if responses:
+                await self._send(responses)
+            return
+        response = await self._handle(message)
+        if response is not None:
+            await self._send(response)
+
+    async def _send(self, payload):
+        if isinstance(payload, list):
+            body = b"[" + b",".join(part if isinstance(part, bytes) else dumpb(part) for part in payload) + b"]"
+        else:
+            body = payload if isinstance(payload, bytes) else dumpb(payload)
+        await self._transport.write(body)
+
+    async def _handle(self, message) -> Union[Dict[str, Any], bytes, None]:
+        """The response to one message, or None for notifications and cancelled requests.
+
+        A handler may return bytes holding an already encoded result, which
+        is then embedded as is.
+        """
+        if not isinstance(message, dict) or message.get("jsonrpc") != "2.0":
+            id = message.get("id") if isinstance(message, dict) else None
+            return _error(id, ErrorCode.InvalidRequest, "Invalid request")
+        method = message.get("method")
+        if not isinstance(method, str):
+            if "result" in message or "error" in message:
+                return None  # a client reply; this server sends no requests
+            return _error(message.get("id"), ErrorCode.InvalidRequest, "Invalid request")
+        if "id" not in message:
+            if method == "notifications/cancelled":
+                self._cancel((message.get("params") or {}).get("requestId"))
+            return None
+
+        id = message["id"]
+        if not _valid_id(id):
+            return _error(None, ErrorCode.InvalidRequest, "Request id must be a string, an integer or null")
+        task = asyncio.ensure_future(self._dispatch(method, message.get("params")))
+        self._running[id] = task
+        try:
+            # wait() rather than await, so only this request's own cancellation is swallowed
+            await asyncio.wait({task})
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            if self._running.get(id) is task:
+                del self._running[id]
+        if task.cancelled():
+            return None  # cancelled requests get no response
+        error = task.exception()
+        if error is None:
+            result = task.result()
+            if isinstance(result, bytes):
+                return b'{"jsonrpc":"2.0","id":%s,"result":%s}' % (dumpb(id), result)
+            return {"jsonrpc": "2.0", "id": id, "result": result}
+        if isinstance(error, McpError):
+            return _error(id, error.code, error.message)
+        if self.onerror is not None:
+            self.onerror(error)
+        return _error(id, ErrorCode.InternalError, str(error))
+
+    def _cancel(self, id):
+        task = self._running.get(id) if _valid_id(id) else None
+        if task is not None:
+            logger.info(f"Cancelling request {id}")
+            task.cancel()
+
+    async def _dispatch(self, method: str, params) -> Dict[str, Any]:
+        if method == "initialize":
+            return {
+                "protocolVersion": (params or {}).get("protocolVersion", PROTOCOL_VERSION),
+                "capabilities": self.capabilities,
+                "serverInfo": self.info,
+            }
+        if method == "ping":
+            return {}
+        if method not in self.request_handlers:
+            raise McpError(ErrorCode.MethodNotFound, f"Method not found: {method}")
+        if params is not None and not isinstance(params, dict):
+            raise McpError(ErrorCode.InvalidParams, "params must be an object")
+        schema, handler = self.request_handlers[method]
+        async with self._slots:
+            return await handler(schema(params))
@@ -0,0 +1,144 @@
+"""
+Metadata filters
+----------------
+Fragments may carry a `fragment_type`, a list of `tags` and a `date`. A
+query filter selects fragments by any of those before vectors are scored:
+
+    {"fragment_type": "quote" | ["quote", "definition"],
+     "tags": ["biology", "review"],          # at least one of them
+     "date_from": "2020-01-01", "date_to": "2024-12-31"}
+
+Local backends keep a MetadataIndex of posting lists and a date column per
+partition, so a filtered query only scores the rows that match; Pinecone
+receives the equivalent metadata filter.
+"""
+
+import datetime
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+import numpy as np
+
+FILTER_FIELDS = ("fragment_type", "tags")
+_NO_DATE = -1
+
+
+def _date_value(value) -> int:
+    """YYYYMMDD integer of an ISO date (or datetime) string, for range filters."""
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        day = value
+    else:
+        day = datetime.date.fromisoformat(str(value)[:10])
+    return day.year * 10000 + day.month * 100 + day.day
+
+
+def filterable_metadata(metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """The filterable fields of user metadata, normalized for storage."""
+    fields: Dict[str, Any] = {}
+    if not metadata:
+        return fields
+    if metadata.get("fragment_type"):
+        fields["fragment_type"] = str(metadata["fragment_type"])
+    tags = metadata.get("tags")
+    if tags:
+        fields["tags"] = [str(tag) for tag in ([tags] if isinstance(tags, str) else tags)]
+    if metadata.get("date"):
+        fields["date"] = str(metadata["date"])[:10]
+        fields["date_value"] = _date_value(metadata["date"])
+    return fields
+
+
+def parse_filter(filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Canonical form of a query filter, or None when it selects everything."""
+    if not filters:
+        return None
+    unknown = set(filters) - {"fragment_type", "tags", "date_from", "date_to"}
+    if unknown:
+        raise ValueError(f"Unknown filter fields: {', '.join(sorted(unknown))}")
+    parsed: Dict[str, Any] = {}
+    for field in FILTER_FIELDS:
+        values = filters.get(field)
+        if values:
+            parsed[field] = sorted({str(value) for value in ([values] if isinstance(values, str) else values)})
+    for bound in ("date_from", "date_to"):
+        if filters.get(bound):
+            parsed[bound] = _date_value(filters[bound])
+    return parsed or None
+
+
+def pinecone_filter(parsed: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """The Pinecone metadata filter equivalent to a parsed filter."""
+    if not parsed:
+        return None
+    result: Dict[str, Any] = {field: {"$in": parsed[field]} for field in FILTER_FIELDS if field in parsed}
+    dates = {}
+    if "date_from" in parsed:
+        dates["$gte"] = parsed["date_from"]
+    if "date_to" in parsed:
+        dates["$lte"] = parsed["date_to"]
+    if dates:
+        result["date_value"] = dates
+    return result
+
+
+class MetadataIndex:
+    """Posting lists of (field, value) -> rows plus a date column.
+
+    Rows are positions in the owner's vector matrix; owners that move rows
+    (swap-remove) report it through `move`.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.postings: Dict[Tuple[str, str], Set[int]] = {}
+        self.dates = np.full(capacity, _NO_DATE, dtype=np.int64)
+
+    def _terms(self, metadata: Dict[str, Any]) -> Iterable[Tuple[str, str]]:
+        if metadata.get("fragment_type"):
+            yield "fragment_type", str(metadata["fragment_type"])
+        for tag in metadata.get("tags") or ():
+            yield "tags", str(tag)
+
+    def add(self, row: int, metadata: Dict[str, Any]):
+        for term in self._terms(metadata):
+            self.postings.setdefault(term, set()).add(row)
+        if row >= len(self.dates):
+            dates = np.full(max(2 * len(self.dates), row + 1), _NO_DATE, dtype=np.int64)
+            dates[: len(self.dates)] = self.dates
+            self.dates = dates
+        self.dates[row] = metadata.get("date_value", _NO_DATE)
+
+    def remove(self, row: int, metadata: Dict[str, Any]):
+        for term in self._terms(metadata):
+            rows = self.postings.get(term)
+            if rows is not None:
+                rows.discard(row)
+                if not rows:
+                    del self.postings[term]
+        self.dates[row] = _NO_DATE
+
+    def move(self, source: int, target: int, metadata: Dict[str, Any]):
+        self.remove(source, metadata)
+        self.add(target, metadata)
+
+    def rows(self, parsed: Dict[str, Any], size: int) -> np.ndarray:
+        """Sorted rows below `size` that match a parsed filter."""
+        candidates: Optional[Set[int]] = None
+        for field in FILTER_FIELDS:
+            if field not in parsed:
+                continue
+            matching = set().union(*(self.postings.get((field, value), ()) for value in parsed[field]))
+            candidates = matching if candidates is None else candidates & matching
+            if not candidates:
+                return np.empty(0, dtype=np.int64)
+        if candidates is None:
+            rows = np.arange(size, dtype=np.int64)
+        else:
+            rows = np.fromiter(sorted(row for row in candidates if row < size), dtype=np.int64)
+        if "date_from" in parsed or "date_to" in parsed:
+            dates = self.dates[rows]
+            keep = dates != _NO_DATE
+            if "date_from" in parsed:
+                keep &= dates >= parsed["date_from"]
+            if "date_to" in parsed:
+                keep &= dates <= parsed["date_to"]
+            rows = rows[keep]
+        return rows
@@ -0,0 +1,205 @@
+"""
+Metrics
+-------
+Dependency-free counters and histograms rendered in the Prometheus text
+exposition format. Tools record request counts, errors and latency; provider
+calls (embed, upsert, query, fetch) record counts, errors, batch sizes and
+durations; collectors registered with `REGISTRY.collector` report values
+owned elsewhere, such as embedding cache hit counts.
+"""
+
+import bisect
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 96, 128, 256, 512, 1024)
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield self.name, _labels(self.labelnames, labels), value
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {",".join(labels): value for labels, value in self._values.items()}
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        with self._lock:
+            items = [(labels, list(state)) for labels, state in self._values.items()]
+        for labels, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                yield self.name + "_bucket", _labels(self.labelnames + ("le",), labels + (repr(float(bound)),)), cumulative
+            yield self.name + "_bucket", _labels(self.labelnames + ("le",), labels + ("+Inf",)), state[-1]
+            yield self.name + "_sum", _labels(self.labelnames, labels), state[-2]
+            yield self.name + "_count", _labels(self.labelnames, labels), state[-1]
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                ",".join(labels): {"count": state[-1], "sum": round(state[-2], 6)}
+                for labels, state in self._values.items()
+            }
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: List[Tuple[str, str, str, str, Callable[[], Dict[str, float]]]] = []
+
+    def counter(self, name, help, labelnames=()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, name: str, help: str, kind: str, label: str, collect: Callable[[], Dict[str, float]]):
+        """Report values computed at scrape time; `collect` returns {label value: number}."""
+        self._collectors.append((name, help, kind, label, collect))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+        for name, help, kind, label, collect in self._collectors:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in collect().items():
+                lines.append(f"{name}{_labels((label,), (key,))} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """All metrics as a JSON-serializable dictionary."""
+        result = {metric.name: metric.snapshot() for metric in self._metrics}
+        for name, _, _, _, collect in self._collectors:
+            result[name] = collect()
+        return result
+
+
+REGISTRY = Registry()
+
+TOOL_REQUESTS = REGISTRY.counter("synthia_tool_requests_total", "Tool calls received.", ["tool"])
+TOOL_ERRORS = REGISTRY.counter("synthia_tool_errors_total", "Tool calls that raised.", ["tool"])
+TOOL_LATENCY = REGISTRY.histogram("synthia_tool_latency_seconds", "Tool call latency.", ["tool"])
+PROVIDER_CALLS = REGISTRY.counter("synthia_provider_calls_total", "Calls to external providers.", ["provider", "operation"])
+PROVIDER_ERRORS = REGISTRY.counter("synthia_provider_errors_total", "Provider calls that raised.", ["provider", "operation"])
+PROVIDER_LATENCY = REGISTRY.histogram(
+    "synthia_provider_latency_seconds", "Provider call latency.", ["provider", "operation"]
+)
+PROVIDER_BATCH_SIZE = REGISTRY.histogram(
+    "synthia_provider_batch_size", "Items per provider call.", ["provider", "operation"], buckets=BATCH_BUCKETS
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@contextmanager
+def track_tool(tool: str):
+    """Count a tool call and record its latency and failure."""
+    TOOL_REQUESTS.inc(tool)
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        TOOL_ERRORS.inc(tool)
+        raise
+    finally:
+        TOOL_LATENCY.observe(time.perf_counter() - started, tool)
+
+
+@contextmanager
+def track_provider(provider: str, operation: str, batch_size: int = 1):
+    """Count a provider call and record its batch size, latency and failure."""
+    PROVIDER_CALLS.inc(provider, operation)
+    PROVIDER_BATCH_SIZE.observe(batch_size, provider, operation)
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        PROVIDER_ERRORS.inc(provider, operation)
+        raise
+    finally:
+        PROVIDER_LATENCY.observe(time.perf_counter() - started, provider, operation)
+
+
+def timed_tool(tool: str):
+    """Decorator form of track_tool for sync and async functions."""
+
+    def decorate(function):
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                with track_tool(tool):
+                    return await function(*args, **kwargs)
+
+        else:
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with track_tool(tool):
+                    return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
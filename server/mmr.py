@@ -0,0 +1,72 @@
+"""
+Maximal Marginal Relevance
+--------------------------
+Re-ranks a pool of candidate fragments so the top k are both relevant to the
+query and different from each other. Each step picks the candidate with the
+best
+
+    lambda_mult * relevance - (1 - lambda_mult) * max similarity to those already picked
+
+All pairwise similarities come from one matrix product, and each step
+updates the running "max similarity" vector with a single `np.maximum`, so
+the cost is O(pool² · d) once plus O(k · pool) for the selection.
+"""
+
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def unit_rows(vectors: np.ndarray) -> np.ndarray:
+    """`vectors` with every non-zero row scaled to unit length."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def mmr(
+    query: Optional[Sequence[float]],
+    vectors: np.ndarray,
+    k: int,
+    lambda_mult: float = 0.5,
+    relevance: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Pick `k` rows of `vectors` by Maximal Marginal Relevance.
+
+    `relevance` is each row's similarity to the query; when omitted it is the
+    cosine similarity to `query`. lambda_mult=1 ranks by relevance alone,
+    lambda_mult=0 by diversity alone. Returns (rows, mmr_scores) in pick order.
+    """
+    if not 0.0 <= lambda_mult <= 1.0:
+        raise ValueError(f"lambda_mult must be between 0 and 1, got {lambda_mult}")
+    vectors = np.asarray(vectors, dtype=np.float32)
+    size = len(vectors)
+    k = min(int(k), size)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+
+    unit = unit_rows(vectors.reshape(size, -1))
+    if relevance is None:
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(query)
+        relevance = unit @ (query / norm if norm > 0 else query)
+    relevance = np.asarray(relevance, dtype=np.float32)
+    similarity = unit @ unit.T
+
+    weighted = lambda_mult * relevance
+    rows = np.empty(k, dtype=np.intp)
+    scores = np.empty(k, dtype=np.float32)
+    # The first pick has nothing to be redundant with
+    first = int(np.argmax(relevance))
+    rows[0], scores[0] = first, weighted[first]
+    redundancy = similarity[first].copy()
+    picked = np.zeros(size, dtype=bool)
+    picked[first] = True
+    for step in range(1, k):
+        marginal = weighted - (1.0 - lambda_mult) * redundancy
+        marginal[picked] = -np.inf
+        best = int(np.argmax(marginal))
+        rows[step], scores[step] = best, marginal[best]
+        picked[best] = True
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return rows, scores
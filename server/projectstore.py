@@ -0,0 +1,396 @@
+"""
+Project store
+-------------
+Durable SQLite storage for projects, their fragments, the sources those
+fragments cite and the citations linking them. The database runs in WAL
+mode so readers never wait for the writer; connections come from a small
+pool and keep their prepared statements cached (every statement is a
+constant string). Writes run in explicit transactions, and concurrent
+single-fragment saves are coalesced by a MicroBatcher into one transaction
+per batch.
+
+Tables are clustered by (project_id, id), so listing a project's fragments
+is an index range scan. Fragment ids are derived from the content, the same
+way as the ids in the vector index, and are stable across processes. Every
+source write that changes a record gives it the project's next `revision`,
+so readers can fetch just the sources changed since a revision they saw.
+"""
+
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from batcher import MicroBatcher
+from serialize import dumps, loads
+
+DEFAULT_PATH = os.getenv("PROJECT_DB_PATH", "projects.sqlite3")
+POOL_SIZE = int(os.getenv("PROJECT_DB_POOL_SIZE", 4))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT '',
+    template TEXT NOT NULL DEFAULT 'default',
+    created_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS fragments (
+    project_id TEXT NOT NULL REFERENCES projects (id) ON DELETE CASCADE,
+    id TEXT NOT NULL,
+    content TEXT NOT NULL,
+    fragment_type TEXT NOT NULL DEFAULT 'mixed',
+    metadata TEXT NOT NULL DEFAULT '{}',
+    created_at REAL NOT NULL,
+    PRIMARY KEY (project_id, id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sources (
+    project_id TEXT NOT NULL REFERENCES projects (id) ON DELETE CASCADE,
+    id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    year INTEGER,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    revision INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (project_id, id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS citations (
+    project_id TEXT NOT NULL,
+    fragment_id TEXT NOT NULL,
+    source_id TEXT NOT NULL,
+    locator TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (project_id, fragment_id, source_id),
+    FOREIGN KEY (project_id, fragment_id) REFERENCES fragments (project_id, id) ON DELETE CASCADE,
+    FOREIGN KEY (project_id, source_id) REFERENCES sources (project_id, id) ON DELETE CASCADE
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS citations_by_source ON citations (project_id, source_id);
+CREATE INDEX IF NOT EXISTS sources_by_revision ON sources (project_id, revision);
+"""
+
+_INSERT_PROJECT = (
+    "INSERT INTO projects (id, name, description, template, created_at) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT (id) DO NOTHING"
+)
+_ENSURE_PROJECT = "INSERT INTO projects (id, name, created_at) VALUES (?, ?, ?) ON CONFLICT (id) DO NOTHING"
+_UPSERT_FRAGMENT = (
+    "INSERT INTO fragments (project_id, id, content, fragment_type, metadata, created_at) VALUES (?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (project_id, id) DO UPDATE SET fragment_type = excluded.fragment_type, metadata = excluded.metadata"
+)
+# Writes are serialized, so max(revision) + 1 is unique within the project
+_UPSERT_SOURCE = (
+    "INSERT INTO sources (project_id, id, title, year, data, updated_at, revision) VALUES (?, ?, ?, ?, ?, ?, "
+    "(SELECT coalesce(max(revision), 0) + 1 FROM sources WHERE project_id = ?1)) "
+    "ON CONFLICT (project_id, id) DO UPDATE SET title = excluded.title, year = excluded.year, "
+    "data = excluded.data, updated_at = excluded.updated_at, revision = excluded.revision "
+    "WHERE data != excluded.data"
+)
+_INSERT_CITATION = (
+    "INSERT INTO citations (project_id, fragment_id, source_id, locator) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (project_id, fragment_id, source_id) DO UPDATE SET locator = excluded.locator"
+)
+_FRAGMENT_COLUMNS = "id, content, fragment_type, metadata, created_at"
+_SOURCE_COLUMNS = "id, data, updated_at, revision"
+
+
+def project_id(name: str) -> str:
+    """Project id derived from its name."""
+    return f"proj_{name.lower().replace(' ', '_')}"
+
+
+def fragment_id(content: str) -> str:
+    """Content-derived fragment id, identical to the id the vector index uses."""
+    return str(uuid.uuid5(uuid.NAMESPACE_DNS, content))
+
+
+def source_id(source: Dict[str, Any]) -> str:
+    """Stable id of a source: its DOI, or else its normalized title, year and first author."""
+    doi = str(source.get("doi") or "").strip().lower()
+    if doi:
+        key = "doi:" + re.sub(r"^(https?://(dx\.)?doi\.org/|doi:)", "", doi)
+    else:
+        authors = source.get("authors") or []
+        first = authors[0] if isinstance(authors, list) and authors else authors
+        parts = (source.get("title"), source.get("year"), first)
+        key = "|".join(" ".join(str(part or "").lower().split()) for part in parts)
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, key))
+
+
+def _fragment(row) -> Dict[str, Any]:
+    id, content, fragment_type, metadata, created_at = row
+    return {
+        "id": id,
+        "content": content,
+        "fragment_type": fragment_type,
+        "metadata": loads(metadata),
+        "created_at": created_at,
+    }
+
+
+def _source(row) -> Dict[str, Any]:
+    id, data, updated_at, revision = row
+    return {**loads(data), "id": id, "updated_at": updated_at, "revision": revision}
+
+
+def _source_rows(project_id: str, sources: Sequence[Dict[str, Any]], now: float) -> List[Tuple]:
+    rows = []
+    for source in sources:
+        source = {key: value for key, value in source.items() if key not in ("id", "updated_at", "revision")}
+        year = source.get("year")
+        rows.append((
+            project_id,
+            source_id(source),
+            str(source.get("title") or ""),
+            int(year) if str(year or "").isdigit() else None,
+            dumps(source),
+            now,
+        ))
+    return rows
+
+
+class ProjectStore:
+    """Projects, fragments, sources and citations in one SQLite database."""
+
+    def __init__(self, path: str = DEFAULT_PATH, pool_size: int = POOL_SIZE, batch_size: int = 512):
+        self.path = path
+        # Every connection to ":memory:" is a separate database, so share one
+        self.pool_size = 1 if path == ":memory:" else max(1, pool_size)
+        self._pool: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        self._connections: List[sqlite3.Connection] = []
+        self._write_lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        with self._connection() as db:
+            columns = [row[1] for row in db.execute("PRAGMA table_info(sources)")]
+            if columns and "revision" not in columns:
+                db.execute("ALTER TABLE sources ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+            db.executescript(SCHEMA)
+        self._saver = MicroBatcher(
+            self._save_requests, max_batch_size=batch_size, max_wait=0.0005, name="fragment-saver"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, cached_statements=256)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("PRAGMA foreign_keys=ON")
+        db.execute("PRAGMA busy_timeout=5000")
+        return db
+
+    @contextmanager
+    def _connection(self):
+        try:
+            db = self._pool.get_nowait()
+        except queue.Empty:
+            with self._open_lock:
+                db = self._connect() if len(self._connections) < self.pool_size else None
+                if db is not None:
+                    self._connections.append(db)
+            if db is None:
+                db = self._pool.get()
+        try:
+            yield db
+        finally:
+            self._pool.put(db)
+
+    @contextmanager
+    def _transaction(self):
+        # One writer at a time; WAL lets readers continue meanwhile
+        with self._write_lock, self._connection() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def close(self):
+        for db in self._connections:
+            db.close()
+        self._connections.clear()
+
+    # Projects
+
+    def create_project(self, name: str, description: str = "", template: str = "default") -> Dict[str, Any]:
+        """Create the project named `name`; status is "exists" if it already was."""
+        id = project_id(name)
+        with self._transaction() as db:
+            row = (id, name, description or "", template or "default", time.time())
+            created = db.execute(_INSERT_PROJECT, row).rowcount
+            template = db.execute("SELECT template FROM projects WHERE id = ?", (id,)).fetchone()[0]
+        return {"project_id": id, "status": "initialized" if created else "exists", "template": template}
+
+    def get_project(self, id: str) -> Optional[Dict[str, Any]]:
+        with self._connection() as db:
+            row = db.execute(
+                "SELECT id, name, description, template, created_at FROM projects WHERE id = ?", (id,)
+            ).fetchone()
+            if row is None:
+                return None
+            count = db.execute("SELECT count(*) FROM fragments WHERE project_id = ?", (id,)).fetchone()[0]
+        keys = ("project_id", "name", "description", "template", "created_at")
+        return {**dict(zip(keys, row)), "fragment_count": count}
+
+    # Fragments
+
+    def save_fragments(
+        self, project_id: str, fragments: Iterable[Tuple[str, str, Optional[Dict[str, Any]]]]
+    ) -> List[str]:
+        """Save (content, fragment_type, metadata) triples in one transaction, returning their ids.
+
+        The project is created if needed. Saving existing content again
+        updates its type and metadata.
+        """
+        return self._save_requests([(project_id, content, kind, metadata) for content, kind, metadata in fragments])
+
+    def save_fragment(
+        self, project_id: str, content: str, fragment_type: str = "mixed", metadata: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """Save one fragment; concurrent calls share a transaction."""
+        return self._saver.submit((project_id, content, fragment_type, metadata)).result()
+
+    def save_cited_fragment(
+        self,
+        project_id: str,
+        content: str,
+        fragment_type: str = "mixed",
+        metadata: Optional[Dict[str, Any]] = None,
+        sources: Sequence[Dict[str, Any]] = (),
+    ) -> Tuple[str, List[str]]:
+        """Save a fragment with the sources it cites, all or nothing; returns (fragment id, source ids)."""
+        now = time.time()
+        id = fragment_id(content)
+        rows = _source_rows(project_id, sources, now)
+        with self._transaction() as db:
+            db.execute(_ENSURE_PROJECT, (project_id, project_id, now))
+            db.execute(
+                _UPSERT_FRAGMENT, (project_id, id, content, fragment_type or "mixed", dumps(metadata or {}), now)
+            )
+            db.executemany(_UPSERT_SOURCE, rows)
+            db.executemany(_INSERT_CITATION, [(project_id, id, row[1], "") for row in rows])
+        return id, [row[1] for row in rows]
+
+    def _save_requests(self, requests: Sequence[Tuple[str, str, str, Optional[Dict[str, Any]]]]) -> List[str]:
+        now = time.time()
+        rows = [
+            (project, fragment_id(content), content, fragment_type or "mixed", dumps(metadata or {}), now)
+            for project, content, fragment_type, metadata in requests
+        ]
+        with self._transaction() as db:
+            db.executemany(_ENSURE_PROJECT, [(project, project, now) for project in {row[0] for row in rows}])
+            db.executemany(_UPSERT_FRAGMENT, rows)
+        return [row[1] for row in rows]
+
+    def get_fragments(self, project_id: str, ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """{id: fragment} for the ids that exist in the project."""
+        result = {}
+        with self._connection() as db:
+            for start in range(0, len(ids), 500):
+                chunk = list(ids[start : start + 500])
+                rows = db.execute(
+                    f"SELECT {_FRAGMENT_COLUMNS} FROM fragments WHERE project_id = ? "
+                    f"AND id IN ({', '.join('?' * len(chunk))})",
+                    [project_id, *chunk],
+                )
+                result.update((row[0], _fragment(row)) for row in rows)
+        return result
+
+    def list_fragments(self, project_id: str, limit: int = 100, after: Optional[str] = None) -> List[Dict[str, Any]]:
+        """A page of the project's fragments in id order; pass the last id as `after` for the next one."""
+        with self._connection() as db:
+            rows = db.execute(
+                f"SELECT {_FRAGMENT_COLUMNS} FROM fragments WHERE project_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (project_id, after or "", int(limit)),
+            ).fetchall()
+        return [_fragment(row) for row in rows]
+
+    def delete_fragments(self, project_id: str, ids: Sequence[str]) -> int:
+        with self._transaction() as db:
+            return db.executemany(
+                "DELETE FROM fragments WHERE project_id = ? AND id = ?", [(project_id, id) for id in ids]
+            ).rowcount
+
+    # Sources and citations
+
+    def add_sources(self, project_id: str, sources: Sequence[Dict[str, Any]]) -> List[str]:
+        """Save source records (title, authors, year, venue, doi, ...) and return their ids.
+
+        Saving a source again replaces its record; `updated_at` and
+        `revision` change only if some field did.
+        """
+        now = time.time()
+        rows = _source_rows(project_id, sources, now)
+        with self._transaction() as db:
+            db.execute(_ENSURE_PROJECT, (project_id, project_id, now))
+            db.executemany(_UPSERT_SOURCE, rows)
+        return [row[1] for row in rows]
+
+    def list_sources(self, project_id: str, ids: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """The project's sources (or the given ones) in id order."""
+        with self._connection() as db:
+            if ids is None:
+                rows = db.execute(
+                    f"SELECT {_SOURCE_COLUMNS} FROM sources WHERE project_id = ? ORDER BY id", (project_id,)
+                ).fetchall()
+            else:
+                rows = [
+                    row
+                    for id in ids
+                    for row in db.execute(
+                        f"SELECT {_SOURCE_COLUMNS} FROM sources WHERE project_id = ? AND id = ?", (project_id, id)
+                    )
+                ]
+        return [_source(row) for row in rows]
+
+    def sources_since(self, project_id: str, revision: int = 0) -> List[Dict[str, Any]]:
+        """The project's sources added or changed after `revision`, oldest change first."""
+        with self._connection() as db:
+            rows = db.execute(
+                f"SELECT {_SOURCE_COLUMNS} FROM sources WHERE project_id = ? AND revision > ? ORDER BY revision",
+                (project_id, int(revision)),
+            ).fetchall()
+        return [_source(row) for row in rows]
+
+    def cite(self, project_id: str, fragment_id: str, source_ids: Sequence[str], locator: str = "") -> int:
+        """Record that a fragment cites the given sources."""
+        with self._transaction() as db:
+            db.executemany(_INSERT_CITATION, [(project_id, fragment_id, id, locator or "") for id in source_ids])
+        return len(source_ids)
+
+    def citations(self, project_id: str, fragment_ids: Optional[Sequence[str]] = None) -> List[Dict[str, str]]:
+        """(fragment_id, source_id, locator) links of the project, or of the given fragments."""
+        with self._connection() as db:
+            if fragment_ids is None:
+                rows = db.execute(
+                    "SELECT fragment_id, source_id, locator FROM citations WHERE project_id = ? ORDER BY fragment_id",
+                    (project_id,),
+                ).fetchall()
+            else:
+                rows = [
+                    row
+                    for id in fragment_ids
+                    for row in db.execute(
+                        "SELECT fragment_id, source_id, locator FROM citations "
+                        "WHERE project_id = ? AND fragment_id = ?",
+                        (project_id, id),
+                    )
+                ]
+        return [{"fragment_id": f, "source_id": s, "locator": locator} for f, s, locator in rows]
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def default_store() -> ProjectStore:
+    """The process-wide store at PROJECT_DB_PATH, opened on first use."""
+    global _default_store
+    if _default_store is None:
+        with _default_lock:
+            if _default_store is None:
+                _default_store = ProjectStore()
+    return _default_store
@@ -0,0 +1,138 @@
+"""
+Quantized vector codes
+----------------------
+Compact representations of fragment vectors used to pick search candidates
+before rescoring them against the full-precision float32 vectors:
+
+    int8    each vector scaled by its largest component into [-127, 127];
+            scanned in cache-sized blocks
+    binary  one sign bit per dimension; scanned with XOR and popcount, i.e.
+            Hamming distance
+
+The codes are kept in addition to the float32 vectors, which the rescoring
+needs, so they add a quarter (int8) or a thirty-second (binary) to a store's
+size rather than saving memory. Only the memory-mapped store leaves the
+float32 rows on disk, paging in just the rescored ones.
+
+On 100k x 1024 synthetic vectors, binary scans run about 3x faster than
+float32 ones; int8 scans are no faster, as NumPy has no int8 BLAS kernel.
+OVERSAMPLE holds how many candidates per requested match each mode rescores
+by default. These are the smallest values tried that kept recall@10 at 0.95
+or more, on both tightly and loosely clustered data.
+"""
+
+from typing import Optional
+
+import numpy as np
+
+MODES = ("int8", "binary")
+
+# Candidates rescored per requested match (recall@10: int8 1.0, binary 0.985)
+OVERSAMPLE = {"int8": 4, "binary": 320}
+
+# Rows converted to float32 at a time when scanning int8 codes; small enough
+# for the block to stay in cache, large enough to amortize the BLAS call.
+INT8_BLOCK = 256
+
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:  # NumPy < 2.0
+    _POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(array):
+        return _POPCOUNT[array.view(np.uint8)].reshape(array.shape[:-1] + (-1,))
+
+
+def check_mode(mode: Optional[str]) -> Optional[str]:
+    if mode in (None, "", "none", "float32"):
+        return None
+    if mode not in MODES:
+        raise ValueError(f"Unknown quantization mode: {mode}")
+    return mode
+
+
+def _packed_width(dimension: int) -> int:
+    """Bytes per binary code, padded to whole 64-bit words."""
+    return ((dimension + 63) // 64) * 8
+
+
+class QuantizedCodes:
+    """Quantized codes for the rows of a vector matrix, in the same row order."""
+
+    def __init__(self, mode: str, dimension: int, data: np.ndarray, norms: Optional[np.ndarray] = None):
+        self.mode = mode
+        self.dimension = dimension
+        self.data = data
+        self.norms = norms  # int8 only: L2 norm of each code
+
+    @classmethod
+    def empty(cls, mode: str, dimension: int, capacity: int) -> "QuantizedCodes":
+        if mode == "int8":
+            return cls(mode, dimension, np.zeros((capacity, dimension), np.int8), np.zeros(capacity, np.float32))
+        return cls(mode, dimension, np.zeros((capacity, _packed_width(dimension)), np.uint8))
+
+    @classmethod
+    def encode(cls, mode: str, vectors: np.ndarray) -> "QuantizedCodes":
+        vectors = np.asarray(vectors, dtype=np.float32)
+        codes = cls.empty(mode, vectors.shape[1], len(vectors))
+        codes.assign(slice(None), vectors)
+        return codes
+
+    def reserve(self, capacity: int):
+        """Grow to `capacity` rows, keeping existing codes."""
+        data = np.zeros((capacity,) + self.data.shape[1:], self.data.dtype)
+        data[: len(self.data)] = self.data
+        self.data = data
+        if self.norms is not None:
+            norms = np.zeros(capacity, np.float32)
+            norms[: len(self.norms)] = self.norms
+            self.norms = norms
+
+    def assign(self, rows, vectors: np.ndarray):
+        """Encode `vectors` into `rows` (an index, slice or index array)."""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimension)
+        if self.mode == "int8":
+            scale = np.abs(vectors).max(axis=1, keepdims=True)
+            scale[scale == 0] = 1.0
+            codes = np.round(vectors / scale * 127.0).astype(np.int8)
+            self.data[rows] = codes.reshape(self.data[rows].shape)
+            self.norms[rows] = np.linalg.norm(codes.astype(np.float32), axis=1).reshape(self.norms[rows].shape)
+        else:
+            packed = np.zeros((len(vectors), self.data.shape[1]), np.uint8)
+            bits = np.packbits(vectors > 0, axis=1)
+            packed[:, : bits.shape[1]] = bits
+            self.data[rows] = packed.reshape(self.data[rows].shape)
+
+    def move(self, source: int, target: int):
+        self.data[target] = self.data[source]
+        if self.norms is not None:
+            self.norms[target] = self.norms[source]
+
+    def scores(self, query: np.ndarray, size: int) -> np.ndarray:
+        """Approximate similarity of `query` to the first `size` rows; higher is closer."""
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        if self.mode == "int8":
+            out = np.empty(size, np.float32)
+            block = np.empty((min(INT8_BLOCK, size), self.dimension), np.float32)
+            for start in range(0, size, INT8_BLOCK):
+                stop = min(start + INT8_BLOCK, size)
+                np.copyto(block[: stop - start], self.data[start:stop])
+                np.dot(block[: stop - start], query, out=out[start:stop])
+            norms = self.norms[:size]
+            np.divide(out, norms, out=out, where=norms > 0)
+            return out
+        encoded = QuantizedCodes.encode("binary", query[None, :]).data[0]
+        words = self.data[:size].view(np.uint64)
+        distances = _popcount(words ^ encoded.view(np.uint64)).sum(axis=1, dtype=np.int32)
+        return (self.dimension - 2 * distances).astype(np.float32)
+
+    def candidates(self, query: np.ndarray, size: int, count: int, live: Optional[np.ndarray] = None) -> np.ndarray:
+        """Rows of the `count` best approximate matches among the first `size` rows."""
+        scores = self.scores(query, size)
+        if live is not None:
+            scores[live[:size] == 0] = -np.inf
+        if count < size:
+            rows = np.argpartition(-scores, count - 1)[:count]
+        else:
+            rows = np.arange(size)
+        return rows[np.isfinite(scores[rows])]
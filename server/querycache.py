@@ -0,0 +1,103 @@
+"""
+Query result cache
+------------------
+Bounded LRU of QueryFragment results with a time-to-live. Every write to a
+namespace bumps that namespace's generation; entries remember the
+generations of the namespaces they searched and are ignored once one has
+moved on, so a search never returns results that predate an upload or
+delete, and a write to one project leaves the others' results cached.
+
+Generation counters only see this process's writes. When the store can
+report a version per namespace (the mmap backend's manifest version, which
+every worker sharing the files sees), it is part of the generation too, so
+a write in another worker invalidates results here as well. Otherwise such
+writes are only picked up once `ttl` expires.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Sequence, Tuple
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse runs of whitespace so trivially different prompts share an entry."""
+    return " ".join(str(prompt).split())
+
+
+class QueryCache:
+    """LRU of query results, expired by `ttl` seconds and by per-namespace write generation.
+
+    `version(namespace)` returns the store's own version of a namespace, or
+    None when the store keeps none.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 1024,
+        ttl: float = 60.0,
+        version: Optional[Callable[[str], Optional[Hashable]]] = None,
+    ):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.version = version
+        self._generations: Dict[str, int] = {}
+        # key -> (value, namespaces, generation, expiry)
+        self._entries: "OrderedDict[Hashable, Tuple[Any, Tuple[str, ...], Hashable, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0 and self.ttl > 0
+
+    def generation(self, namespaces: Sequence[str]) -> Hashable:
+        """The current generation of `namespaces`; read it before searching them."""
+        namespaces = tuple(namespaces)
+        versions = tuple(self.version(namespace) for namespace in namespaces) if self.version else ()
+        with self._lock:
+            local = tuple(self._generations.get(namespace, 0) for namespace in namespaces)
+        return local, versions
+
+    def bump(self, namespace: str) -> None:
+        """Invalidate the cached results that searched `namespace`; call after each write to it."""
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            for key in [key for key, entry in self._entries.items() if namespace in entry[1]]:
+                del self._entries[key]
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+        value, namespaces, generation, expires = entry
+        if expires <= time.monotonic() or generation != self.generation(namespaces):
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+                self.stats["stale"] += 1
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+        return value
+
+    def put(self, key: Hashable, value: Any, namespaces: Sequence[str], generation: Hashable) -> None:
+        """Cache `value` if no write to `namespaces` happened since `generation` was read."""
+        if not self.enabled:
+            return
+        namespaces = tuple(namespaces)
+        if generation != self.generation(namespaces):
+            return
+        with self._lock:
+            self._entries[key] = (value, namespaces, generation, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def __len__(self):
+        return len(self._entries)
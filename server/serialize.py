@@ -0,0 +1,59 @@
+"""
+Serialization
+-------------
+Compact JSON for every tool response: no indentation or spaces between
+separators, and NumPy arrays and scalars encoded directly rather than going
+through `tolist()` first. Uses orjson when it is installed and falls back to
+the standard library encoder otherwise.
+"""
+
+import json
+from typing import Any, Dict
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised only without orjson
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    # NumPy values (and anything else exposing tolist/item) the encoder does not know
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if hasattr(value, "item"):
+        return value.item()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumpb(value: Any) -> bytes:
+        """Compact UTF-8 JSON bytes of `value`."""
+        return orjson.dumps(value, default=_default, option=_OPTIONS)
+
+    def dumps(value: Any) -> str:
+        """Compact JSON text of `value`."""
+        return orjson.dumps(value, default=_default, option=_OPTIONS).decode("utf-8")
+
+    loads = orjson.loads
+
+else:
+    _encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, default=_default)
+
+    def dumps(value: Any) -> str:
+        """Compact JSON text of `value`."""
+        return _encoder.encode(value)
+
+    def dumpb(value: Any) -> bytes:
+        """Compact UTF-8 JSON bytes of `value`."""
+        return _encoder.encode(value).encode("utf-8")
+
+    loads = json.loads
+
+
+def text_content(payload: Any) -> Dict[str, Any]:
+    """An MCP tool result carrying `payload` as one compact JSON text item."""
+    return {"content": [{"type": "text", "text": dumps(payload)}]}
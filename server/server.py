@@ -1,161 +1,903 @@
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-import requests
+# Heavy modules (numpy, cohere, pinecone, FastAPI) and the provider clients
+# are loaded on first use so the MCP stdio transport starts immediately.
 import json
 from dotenv import load_dotenv
 import os
-import cohere
-from pinecone import (
-    Pinecone
-)
+import sys
+import threading
 from mcp.server.fastmcp import FastMCP
+from mcp.types import TextContent
+import functools
 import uuid
-from sklearn.metrics.pairwise import cosine_similarity
-import json
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI, Body
-from pydantic import BaseModel
+from embedcache import EmbeddingCache
+from batcher import MicroBatcher
+from ingest import ingest_file
+from concurrency import (
+    BlockingExecutor, ClientDisconnected, ExecutorBusy, SingleFlight, check_cancelled, run_until_disconnected
+)
+from querycache import QueryCache, normalize_prompt
+from metrics import CONTENT_TYPE, REGISTRY, timed_tool, track_provider, track_tool
+from serialize import dumpb, dumps
+import asyncio
 
 load_dotenv()
 
 COHERE_API_KEY = os.getenv('COHERE_API_KEY')
 PINECONE_API_KEY = os.getenv('PINECONE_API_KEY')
 
-pc = Pinecone(api_key=PINECONE_API_KEY)
-co = cohere.Client(COHERE_API_KEY)
-namespace="mcp-namespace"
+# "pinecone" (default), "local" for the in-process NumPy store, "ivf" for
+# the approximate index (tuned by ANN_NLIST / ANN_NPROBE) or "mmap" for the
+# persistent memory-mapped store at FRAGMENT_STORE_PATH
+VECTOR_BACKEND = os.getenv('VECTOR_BACKEND', 'pinecone')
+FRAGMENT_STORE_PATH = os.getenv('FRAGMENT_STORE_PATH', 'fragment_store')
+# Default for QueryFragment's quantization: "int8", "binary" or unset for
+# full precision (local backends only)
+QUERY_QUANTIZATION = os.getenv('QUERY_QUANTIZATION') or None
+ANN_NLIST = int(os.getenv('ANN_NLIST', 0)) or None
+ANN_NPROBE = int(os.getenv('ANN_NPROBE', 16))
+
+namespace="mcp-namespace"  # fragments uploaded without a project_id
 index = "mcp-index-name"
-idx = pc.Index(index)
+EMBED_MODEL = "embed-english-v3.0"
+EMBED_BATCH_SIZE = 96  # Cohere accepts at most 96 texts per embed call
+UPSERT_BATCH_SIZE = 100
+# Concurrent single uploads are coalesced for up to UPLOAD_BATCH_WINDOW_MS
+UPLOAD_BATCH_WINDOW_MS = float(os.getenv('UPLOAD_BATCH_WINDOW_MS', 10))
+# Routes run provider calls on a pool of PROVIDER_WORKERS threads and give
+# up after PROVIDER_TIMEOUT seconds
+PROVIDER_WORKERS = int(os.getenv('PROVIDER_WORKERS', 16))
+PROVIDER_TIMEOUT = float(os.getenv('PROVIDER_TIMEOUT', 30))
+# Embeddings are cached in memory (up to EMBED_CACHE_MB of float32 vectors)
+# and on disk (EMBED_CACHE_PATH, empty to disable, keeping the
+# EMBED_CACHE_ROWS most recently written)
+embed_cache = EmbeddingCache(
+    os.getenv('EMBED_CACHE_PATH', 'embedding_cache.sqlite3') or None,
+    max_bytes=int(float(os.getenv('EMBED_CACHE_MB', 64)) * (1 << 20)),
+    max_rows=int(os.getenv('EMBED_CACHE_ROWS', 100000)),
+)
+# QueryFragment results are reused for QUERY_CACHE_TTL seconds unless a
+# write to a searched namespace happens first (QUERY_CACHE_SIZE=0 disables
+# the cache). Writes by other workers are seen at once with the mmap
+# backend, whose version is shared through its files, and after the TTL
+# otherwise.
+query_cache = QueryCache(
+    capacity=int(os.getenv('QUERY_CACHE_SIZE', 1024)),
+    ttl=float(os.getenv('QUERY_CACHE_TTL', 60)),
+    version=lambda namespace: get_store().version(namespace),
+)
+REGISTRY.collector(
+    "synthia_embed_cache_events_total", "Embedding cache lookups and evictions.", "counter", "event",
+    lambda: dict(embed_cache.stats),
+)
+REGISTRY.collector(
+    "synthia_query_cache_events_total", "Query result cache lookups and evictions.", "counter", "event",
+    lambda: dict(query_cache.stats),
+)
+# Concurrent identical embeds and searches share one provider call
+embed_flight = SingleFlight()
+query_flight = SingleFlight()
+REGISTRY.collector(
+    "synthia_singleflight_total", "Provider calls made (calls) and joined by concurrent callers (shared).",
+    "counter", "kind",
+    lambda: {
+        f"{name}_{kind}": count
+        for name, flight in (("embed", embed_flight), ("query", query_flight))
+        for kind, count in flight.stats.items()
+    },
+)
+
+# Uploads and ingested chunks are screened for near-duplicates (MinHash/LSH
+# Jaccard similarity >= DEDUPE_THRESHOLD) before they are embedded.
+# DEDUPE_MODE "flag" (default) stores them and reports the match, "skip"
+# drops them and "off" disables screening. DEDUPE_INDEX_PATH persists the
+# signatures, so the index lasts as long as the fragments it describes: it
+# defaults to dedupe_index.sqlite3 for the persistent backends (pinecone,
+# mmap) and to memory only for the in-process ones (local, ivf), whose
+# fragments are gone after a restart anyway. Set it empty to keep it in memory.
+DEDUPE_MODE = os.getenv('DEDUPE_MODE', 'flag').lower()
+DEDUPE_THRESHOLD = float(os.getenv('DEDUPE_THRESHOLD', 0.8))
+DEDUPE_INDEX_PATH = os.getenv(
+    'DEDUPE_INDEX_PATH', 'dedupe_index.sqlite3' if VECTOR_BACKEND in ('pinecone', 'mmap') else ''
+) or None
+
+# Provider clients, created by get_cohere() / get_store() on first use.
+# Assigning these directly (e.g. to fakes) bypasses the lazy setup.
+co = None
+store = None
+_init_lock = threading.Lock()
+
+def get_cohere():
+    global co
+    if co is None:
+        with _init_lock:
+            if co is None:
+                import cohere
+                co = cohere.Client(COHERE_API_KEY)
+    return co
+
+def get_store():
+    global store
+    if store is None:
+        with _init_lock:
+            if store is None:
+                from vectorstore import create_store
+                if VECTOR_BACKEND == "pinecone":
+                    from pinecone import Pinecone
+                    pc = Pinecone(api_key=PINECONE_API_KEY)
+                    store = create_store(VECTOR_BACKEND, index=pc.Index(index))
+                else:
+                    store = create_store(VECTOR_BACKEND, nlist=ANN_NLIST, nprobe=ANN_NPROBE, path=FRAGMENT_STORE_PATH)
+    return store
+
+def project_namespace(project_id=None):
+    """Each project's fragments live in their own namespace (Pinecone
+    namespace or local partition), so its queries never scan other projects."""
+    return str(project_id) if project_id else namespace
+
+# Near-duplicate indexes, per namespace, created by get_dedupe_index()
+dedupe_indexes = {}
+
+def get_dedupe_index(namespace=namespace):
+    dedupe_index = dedupe_indexes.get(namespace)
+    if dedupe_index is None:
+        with _init_lock:
+            dedupe_index = dedupe_indexes.get(namespace)
+            if dedupe_index is None:
+                from dedupe import MinHashIndex
+                dedupe_index = dedupe_indexes[namespace] = MinHashIndex(
+                    DEDUPE_THRESHOLD, path=DEDUPE_INDEX_PATH, name=namespace
+                )
+    return dedupe_index
 
-# Initialize MCP & FastAPI
+def _near_duplicates(texts, namespace=namespace):
+    """Screens {id: text} in order, returning {id: [{"id", "similarity"}]} of
+    stored near-duplicates and indexing each text."""
+    if DEDUPE_MODE == "off" or not texts:
+        return {id: [] for id in texts}
+    screened = get_dedupe_index(namespace).screen_many(texts, keep_duplicates=DEDUPE_MODE != "skip")
+    return {
+        id: [{"id": match, "similarity": round(similarity, 4)} for match, similarity in matches]
+        for id, matches in screened.items()
+    }
+
+def ScreenChunk(chunk, namespace=namespace):
+    """Ingest screen: drops (skip mode) or annotates (flag mode) near-duplicate chunks."""
+    id = str(uuid.uuid5(uuid.NAMESPACE_DNS, chunk["text"]))
+    matches = _near_duplicates({id: chunk["text"]}, namespace)[id]
+    if not matches:
+        return chunk
+    if DEDUPE_MODE == "skip":
+        return None
+    return dict(chunk, near_duplicate_of=matches[0]["id"])
+
+# Fragment ids known to be stored, per namespace, with the store version
+# they were seen at. Uploads skip embedding paragraphs whose id is here and
+# ask the store only about the rest. The set is dropped whenever the
+# store's version of the namespace changes, so a delete made through
+# another worker of a shared (mmap) store is seen; backends without a
+# version only see this process's deletes.
+known_ids = {}
+
+def _known_ids(namespace=namespace):
+    version = get_store().version(namespace)
+    entry = known_ids.get(namespace)
+    if entry is None or entry[0] != version:
+        entry = known_ids[namespace] = (version, set())
+    return entry[1]
+
+def PineconeExisting(ids, namespace=namespace):
+    """Returns the set of known ids among `ids`, checking unseen ones with one store call."""
+    known = _known_ids(namespace)
+    unseen = [id for id in dict.fromkeys(ids) if id not in known]
+    if unseen:
+        with track_provider(VECTOR_BACKEND, "exists", len(unseen)):
+            known.update(get_store().exists(unseen, namespace=namespace))
+    return {id for id in ids if id in known}
+
+# Initialize MCP; the FastAPI app is built by create_app() when needed
 mcp = FastMCP("Synthia")
-app = FastAPI()
-
-# Add CORS middleware configuration
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000"],  # Allow requests from your React app
-    allow_credentials=True,
-    allow_methods=["*"],  # Allow all HTTP methods (including OPTIONS)
-    allow_headers=["*"],  # Allow all headers
-)
 
-# Define Pydantic models for request validation
-class ParagraphRequest(BaseModel):
-    paragraph: str
+def tool():
+    """Registers the decorated function as an MCP tool whose result goes out as
+    one compact JSON text item; FastMCP's own conversion would pretty-print it
+    and turn NumPy values into their str(). The function itself is returned
+    unchanged for the HTTP routes, the bridge and direct callers."""
+    def register(func):
+        @functools.wraps(func)
+        def encoded(*args, **kwargs):
+            return TextContent(type="text", text=dumps(func(*args, **kwargs)))
+        mcp.add_tool(encoded)
+        return func
+    return register
 
-class PromptRequest(BaseModel):
-    prompt: str
+executor = BlockingExecutor(max_workers=PROVIDER_WORKERS, timeout=PROVIDER_TIMEOUT)
 
-class ContributionRequest(BaseModel):
-    paper: str
-    fragmentList: list
+def _fragment_metadata(data):
+    # The text and the filterable fields (fragment_type, tags, date) are
+    # stored as top-level metadata so every backend can return and index them
+    from metafilter import filterable_metadata
 
-def PineconeUpsert(id, vector, data):
-    output = idx.upsert(
-        vectors=[
-            (id, vector, {"metadata_key": str(data)})
-        ],
-        namespace=namespace
-    )
+    metadata = {"metadata_key": str(data)}
+    if isinstance(data, dict):
+        metadata.update(filterable_metadata(data))
+        if "text" in data:
+            metadata["text"] = str(data["text"])
+    return metadata
+
+def PineconeUpsert(id, vector, data, namespace=namespace):
+    with track_provider(VECTOR_BACKEND, "upsert"):
+        upserted_count = get_store().upsert(
+            [(id, vector, _fragment_metadata(data))],
+            namespace=namespace
+        )
+    _known_ids(namespace).add(id)
+    query_cache.bump(namespace)
     
     # Return a JSON-serializable response
     return {
         "status": "success",
-        "upserted_count": output.get("upserted_count", 0),
+        "upserted_count": upserted_count,
         "namespace": namespace,
         "id": id
     }
 
-def PineconeQuery(vector, top_k=5):
-    return idx.query(
-        vector=vector,
-        top_k=top_k,
-        namespace=namespace,
-        include_values=False,
-        include_metadata=True
-    )
+def PineconeUpsertBatch(items, namespace=namespace):
+    """Upserts (id, vector, data) triples in UPSERT_BATCH_SIZE chunks."""
+    upserted_count = 0
+    for start in range(0, len(items), UPSERT_BATCH_SIZE):
+        batch = items[start:start + UPSERT_BATCH_SIZE]
+        with track_provider(VECTOR_BACKEND, "upsert", len(batch)):
+            upserted_count += get_store().upsert(
+                [(id, vector, _fragment_metadata(data)) for id, vector, data in batch],
+                namespace=namespace
+            )
+        _known_ids(namespace).update(id for id, _, _ in batch)
+    query_cache.bump(namespace)
+    return {
+        "status": "success",
+        "upserted_count": upserted_count,
+        "namespace": namespace
+    }
 
-def EmbedParagraph(text):
+def PineconeDelete(ids, namespace=namespace):
+    with track_provider(VECTOR_BACKEND, "delete", len(ids)):
+        deleted_count = get_store().delete([str(id) for id in ids], namespace=namespace)
+    _known_ids(namespace).difference_update(str(id) for id in ids)
+    if DEDUPE_MODE != "off":
+        get_dedupe_index(namespace).remove(str(id) for id in ids)
+    query_cache.bump(namespace)
+    return {
+        "status": "success",
+        "deleted_count": deleted_count,
+        "namespace": namespace
+    }
+
+def PineconeQuery(
+    vector, top_k=5, quantization=None, namespace=namespace, filter=None, include_metadata=False, include_values=False
+):
+    with track_provider(VECTOR_BACKEND, "query"):
+        return get_store().query(
+            vector=vector,
+            top_k=top_k,
+            namespace=namespace,
+            include_values=include_values,
+            include_metadata=include_metadata,
+            quantization=quantization,
+            filter=filter
+        )
+
+def EmbedParagraph(text, input_type="search_query"):
     try:
-        response = co.embed(
+        cached = embed_cache.get(EMBED_MODEL, input_type, str(text))
+        if cached is not None:
+            return cached
+
+        return embed_flight.do((input_type, str(text)), _embed_one, text, input_type)
+
+    except Exception as e:
+        return [e]
+
+def _embed_one(text, input_type):
+    with track_provider("cohere", "embed"):
+        response = get_cohere().embed(
             texts=[str(text)],  # Pass the text as a list
-            model="embed-english-v3.0",  # Use the English embedding model
-            input_type="search_query"  # Optional: Specify the input type
+            model=EMBED_MODEL,  # Use the English embedding model
+            input_type=input_type  # Optional: Specify the input type
         )
-        if 'embeddings' in response.__dict__ and len(response.embeddings) > 0:
-            embeddings = response.embeddings[0]  # Extract the first embedding
-            
-            # Extract the embeddings from the response
-            embeddings = response.embeddings[0]  # Get the first (and only) embedding
-            return embeddings
-        
+    if 'embeddings' in response.__dict__ and len(response.embeddings) > 0:
+        # Extract the embeddings from the response
+        embeddings = response.embeddings[0]  # Get the first (and only) embedding
+        embed_cache.put(EMBED_MODEL, input_type, str(text), embeddings)
+        return embeddings
+
+    else:
+        raise ValueError("No embeddings found in the response")
+
+def EmbedParagraphs(texts, input_type="search_query"):
+    """Embeds many texts, sending cache misses to co.embed in EMBED_BATCH_SIZE batches."""
+    texts = [str(text) for text in texts]
+    embeddings = {}
+    missing = []
+    for text in dict.fromkeys(texts):
+        cached = embed_cache.get(EMBED_MODEL, input_type, text)
+        if cached is None:
+            missing.append(text)
         else:
-            raise ValueError("No embeddings found in the response")
+            embeddings[text] = cached
 
-    except Exception as e:
-        return [e]
+    for start in range(0, len(missing), EMBED_BATCH_SIZE):
+        check_cancelled()
+        batch = missing[start:start + EMBED_BATCH_SIZE]
+        with track_provider("cohere", "embed", len(batch)):
+            response = get_cohere().embed(texts=batch, model=EMBED_MODEL, input_type=input_type)
+        if len(response.embeddings) != len(batch):
+            raise ValueError("Embedding response does not match the number of texts")
+        embed_cache.put_many(EMBED_MODEL, input_type, zip(batch, response.embeddings))
+        embeddings.update(zip(batch, response.embeddings))
 
-@mcp.tool()
-def UploadFragment(paragraph):
-    print(paragraph)
-    embedding = EmbedParagraph(paragraph)
-    id = str(uuid.uuid5(uuid.NAMESPACE_DNS, paragraph))
-    result = PineconeUpsert(id, embedding, {"text": paragraph})
-    
-    # Return a JSON-serializable response
+    return [embeddings[text] for text in texts]
+
+def _upload_paragraphs(paragraphs, namespace=namespace, metadata=None, include_embeddings=False):
+    """Embeds and upserts a batch of paragraphs, returning one result per paragraph.
+
+    The id is derived from the text, so a paragraph whose id is already
+    stored is unchanged and is neither embedded nor upserted again, unless
+    it comes with metadata (metadata[i] for paragraphs[i]), which is then
+    rewritten; its embedding is usually served by the cache. Results carry
+    the embedding only with include_embeddings.
+    """
+    metadata = metadata or [None] * len(paragraphs)
+    ids = [str(uuid.uuid5(uuid.NAMESPACE_DNS, paragraph)) for paragraph in paragraphs]
+    existing = PineconeExisting([id for id, extra in zip(ids, metadata) if not extra], namespace)
+    new = {id: paragraph for id, paragraph in zip(ids, paragraphs) if id not in existing}
+    extras = {id: extra for id, extra in zip(ids, metadata) if extra}
+    # Screened one by one so a near-copy later in the batch matches an earlier one
+    near_duplicates = _near_duplicates(new, namespace)
+    if DEDUPE_MODE == "skip":
+        new = {id: paragraph for id, paragraph in new.items() if not near_duplicates[id]}
+    embeddings = {}
+    if new:
+        try:
+            embeddings = dict(zip(new, EmbedParagraphs(list(new.values()))))
+            check_cancelled()
+            PineconeUpsertBatch(
+                [(id, embeddings[id], {**extras.get(id, {}), "text": paragraph}) for id, paragraph in new.items()],
+                namespace
+            )
+        except Exception:
+            if DEDUPE_MODE != "off":
+                get_dedupe_index(namespace).remove(new)
+            raise
+
+    results = []
+    for id in ids:
+        if id in existing:
+            results.append({"status": "unchanged", "message": "Fragment already uploaded", "id": id})
+            continue
+        if id not in new:
+            results.append({
+                "status": "duplicate",
+                "message": "Near-duplicate of a stored fragment",
+                "id": id,
+                "near_duplicates": near_duplicates[id]
+            })
+            continue
+        result = {"status": "success", "message": "Fragment uploaded successfully", "id": id}
+        if include_embeddings:
+            result["embedding"] = embeddings[id]  # the serializer encodes arrays as they are
+        if near_duplicates.get(id):
+            result["near_duplicates"] = near_duplicates[id]
+        results.append(result)
+    return results
+
+def _check_metadata(metadata):
+    """Raises ValueError or TypeError for metadata that cannot be stored (e.g. an
+    invalid date, or tags that are not a list)."""
+    from metafilter import filterable_metadata
+
+    if metadata is not None and not isinstance(metadata, dict):
+        raise ValueError("metadata must be an object")
+    filterable_metadata(metadata)
+
+def _upload_requests(requests):
+    """Micro-batcher handler: (paragraph, namespace, metadata, include_embedding)
+    requests, uploaded per namespace.
+
+    Failures stay with the requests they belong to: an invalid request gets
+    its own error, and a provider error fails only its namespace's group.
+    """
+    groups = {}
+    results = [None] * len(requests)
+    for position, (paragraph, namespace, metadata, include_embedding) in enumerate(requests):
+        try:
+            _check_metadata(metadata)
+        except (ValueError, TypeError) as e:
+            results[position] = e
+            continue
+        groups.setdefault(namespace, []).append((position, paragraph, metadata, include_embedding))
+    for namespace, group in groups.items():
+        try:
+            uploaded = _upload_paragraphs(
+                [paragraph for _, paragraph, _, _ in group],
+                namespace,
+                [metadata for _, _, metadata, _ in group],
+                include_embeddings=any(include for _, _, _, include in group)
+            )
+        except Exception as e:
+            for position, _, _, _ in group:
+                results[position] = e
+            continue
+        for (position, _, _, include_embedding), result in zip(group, uploaded):
+            if not include_embedding:
+                result.pop("embedding", None)
+            results[position] = result
+    return results
+
+def submit_upload(paragraph, namespace=namespace, metadata=None, include_embedding=False):
+    """Validates one upload and queues it on the upload batcher, returning its future."""
+    _check_metadata(metadata)  # rejected here, before it can share a batch with other callers
+    return upload_batcher.submit((paragraph, namespace, metadata, bool(include_embedding)))
+
+upload_batcher = MicroBatcher(
+    _upload_requests,
+    max_batch_size=EMBED_BATCH_SIZE,
+    max_wait=UPLOAD_BATCH_WINDOW_MS / 1000.0,
+    name="upload-batcher",
+)
+
+@tool()
+@timed_tool("UploadFragment")
+def UploadFragment(paragraph, project_id=None, metadata=None, include_embedding=False):
+    """Uploads one paragraph to the project's partition.
+
+    metadata may set fragment_type, tags and date (ISO), which QueryFragment
+    can filter on. include_embedding returns the computed embedding as well.
+    """
+    # Concurrent uploads share one embed and one upsert call via the batcher
+    return submit_upload(paragraph, project_namespace(project_id), metadata, include_embedding).result()
+
+@tool()
+@timed_tool("UploadFragments")
+def UploadFragments(paragraphs, project_id=None, metadata=None, include_embeddings=False):
+    """Uploads many paragraphs with batched embed and upsert calls; metadata applies to all."""
+    _check_metadata(metadata)
+    results = []
+    for start in range(0, len(paragraphs), EMBED_BATCH_SIZE):
+        check_cancelled()
+        batch = paragraphs[start:start + EMBED_BATCH_SIZE]
+        results.extend(_upload_paragraphs(
+            batch, project_namespace(project_id), [metadata] * len(batch), include_embeddings
+        ))
+    unchanged_count = sum(result["status"] == "unchanged" for result in results)
+    duplicate_count = sum(result["status"] == "duplicate" for result in results)
     return {
         "status": "success",
-        "message": "Fragment uploaded successfully",
-        "id": id,
-        "embedding": embedding.tolist() if hasattr(embedding, "tolist") else embedding,
-        "pinecone_result": str(result)  # Convert result to a string if it's not JSON-serializable
+        "uploaded_count": len(results) - unchanged_count - duplicate_count,
+        "unchanged_count": unchanged_count,
+        "duplicate_count": duplicate_count,
+        "results": results
     }
     
-@mcp.tool()
-def QueryFragment(prompt):
+def ingest_document(path, namespace=namespace, **options):
+    """ingest_file() into `namespace`, screening chunks for near-duplicates.
+
+    A chunk's signature enters the dedupe index when it is screened, so later
+    chunks of the document match it; if the ingest fails, the signatures of
+    the chunks it indexed but never upserted are removed again.
+    """
+    index = get_dedupe_index(namespace) if DEDUPE_MODE != "off" else None
+    pending = set()  # ids indexed by this ingest and not upserted yet
+
+    def screen(chunk):
+        id = str(uuid.uuid5(uuid.NAMESPACE_DNS, chunk["text"]))
+        known = index is not None and id in index
+        screened = ScreenChunk(chunk, namespace)
+        if index is not None and not known and id in index:
+            pending.add(id)
+        return screened
+
+    def upsert(items):
+        result = PineconeUpsertBatch(items, namespace)
+        pending.difference_update(id for id, _, _ in items)
+        return result
+
+    options.setdefault("batch_size", EMBED_BATCH_SIZE)
+    try:
+        return ingest_file(path, embed=EmbedParagraphs, upsert=upsert, screen=screen, **options)
+    except BaseException:
+        if pending:
+            index.remove(pending)
+        raise
+
+@tool()
+@timed_tool("IngestDocument")
+def IngestDocument(path, max_chars=1500, overlap=200, project_id=None):
+    """Chunks, embeds and upserts a whole text, markdown or LaTeX document."""
+    return ingest_document(path, project_namespace(project_id), max_chars=int(max_chars), overlap=int(overlap))
+
+@tool()
+@timed_tool("DedupeReport")
+def DedupeReport(paragraphs=None, threshold=None, project_id=None):
+    """Groups near-duplicate fragments.
+
+    Reports on the given paragraphs, or, when none are given, on the
+    namespace's near-duplicate index as this process sees it: every
+    fragment screened here, plus those loaded from DEDUPE_INDEX_PATH when
+    the index was opened. Fragments another worker screens later are not
+    included until this process restarts.
+    """
+    from dedupe import dedupe_report
+
+    if paragraphs:
+        texts = [(str(uuid.uuid5(uuid.NAMESPACE_DNS, paragraph)), paragraph) for paragraph in paragraphs]
+        return dedupe_report(texts, threshold=float(threshold or DEDUPE_THRESHOLD))
+    return get_dedupe_index(project_namespace(project_id)).report()
+
+@tool()
+@timed_tool("DeleteFragments")
+def DeleteFragments(fragmentList, project_id=None):
+    """Deletes fragments by id."""
+    return PineconeDelete(fragmentList, project_namespace(project_id))
+
+@tool()
+@timed_tool("QueryFragment")
+def QueryFragment(prompt, quantization=None, top_k=5, project_id=None, filters=None, include_metadata=False):
+    """Finds the fragments most similar to the prompt.
+
+    Only the partitions of project_id (one id or a list) are searched, and
+    filters ({"fragment_type", "tags", "date_from", "date_to"}) select the
+    fragments to score before any similarity is computed.
+    quantization ("int8" or "binary") scans compact codes before rescoring
+    the best candidates at full precision. Matches are {"id", "score"};
+    include_metadata adds each fragment's metadata. Repeated searches are
+    answered from the query cache until a write invalidates it; those
+    responses have "cached": true.
+    """
+    quantization = quantization or QUERY_QUANTIZATION
+    projects = project_id if isinstance(project_id, (list, tuple)) else [project_id]
+    namespaces = tuple(dict.fromkeys(project_namespace(project) for project in projects))
+    key = (
+        normalize_prompt(prompt), int(top_k), namespaces, quantization,
+        json.dumps(filters, sort_keys=True) if filters else None, bool(include_metadata)
+    )
+    cached = query_cache.get(key)
+    if cached is not None:
+        return {**cached, "cached": True}
+
+    generation = query_cache.generation(namespaces)  # read before searching, so a concurrent write wins
+    # Identical concurrent searches in the same generation share one call
+    result = query_flight.do(
+        (key, generation), _search, prompt, int(top_k), quantization, namespaces, filters, bool(include_metadata)
+    )
+    query_cache.put(key, result, namespaces, generation)
+    return {**result, "cached": False}
+
+def _search(prompt, top_k, quantization, namespaces=(namespace,), filters=None, include_metadata=False):
+    embedding = EmbedParagraph(prompt)
+    if len(namespaces) == 1:
+        return PineconeQuery(embedding, top_k, quantization, namespaces[0], filters, include_metadata)
+    matches = []
+    for namespace in namespaces:
+        for match in PineconeQuery(embedding, top_k, quantization, namespace, filters, include_metadata)["matches"]:
+            matches.append({**match, "namespace": namespace})
+    matches.sort(key=lambda match: -match["score"])
+    return {"matches": matches[:top_k], "namespace": list(namespaces)}
+
+@tool()
+@timed_tool("SuggestFragments")
+def SuggestFragments(prompt, k=5, lambda_mult=0.5, pool_size=50, project_id=None, filters=None):
+    """Suggests k fragments that are relevant to the prompt but not redundant with each other.
+
+    The pool_size fragments most similar to the prompt (within project_id
+    and filters, as in QueryFragment) are re-ranked by Maximal Marginal
+    Relevance: lambda_mult=1 keeps the pure similarity order, lower values
+    trade similarity for diversity. Matches are {"id", "score", "mmr_score",
+    "metadata"} in suggestion order; results are cached like QueryFragment's.
+    """
+    k, pool_size, lambda_mult = int(k), int(pool_size), float(lambda_mult)
+    if k <= 0:
+        raise ValueError("k must be positive")
+    if not 0.0 <= lambda_mult <= 1.0:
+        raise ValueError("lambda_mult must be between 0 and 1")
+    pool_size = max(pool_size, k)
+    projects = project_id if isinstance(project_id, (list, tuple)) else [project_id]
+    namespaces = tuple(dict.fromkeys(project_namespace(project) for project in projects))
+    key = (
+        "suggest", normalize_prompt(prompt), k, lambda_mult, pool_size, namespaces,
+        json.dumps(filters, sort_keys=True) if filters else None
+    )
+    cached = query_cache.get(key)
+    if cached is not None:
+        return {**cached, "cached": True}
+
+    generation = query_cache.generation(namespaces)
+    result = query_flight.do((key, generation), _suggest, prompt, k, lambda_mult, pool_size, namespaces, filters)
+    query_cache.put(key, result, namespaces, generation)
+    return {**result, "cached": False}
+
+def _suggest(prompt, k, lambda_mult, pool_size, namespaces=(namespace,), filters=None):
+    import numpy as np
+    from mmr import mmr
+
     embedding = EmbedParagraph(prompt)
-    return PineconeQuery(embedding)
+    pool = []
+    for namespace in namespaces:
+        pool.extend(PineconeQuery(embedding, pool_size, None, namespace, filters, True, True)["matches"])
+    if len(namespaces) > 1:
+        pool.sort(key=lambda match: -match["score"])
+        del pool[pool_size:]
+    if not pool:
+        return {"matches": [], "namespace": list(namespaces)}
+
+    # One (pool, pool) similarity matrix instead of pairwise Python loops
+    vectors = np.asarray([match["values"] for match in pool], dtype=np.float32)
+    relevance = np.asarray([match["score"] for match in pool], dtype=np.float32)
+    rows, scores = mmr(None, vectors, k, lambda_mult, relevance=relevance)
+    matches = [
+        {
+            "id": pool[row]["id"],
+            "score": pool[row]["score"],
+            "mmr_score": float(score),
+            "metadata": pool[row].get("metadata") or {},
+        }
+        for row, score in zip(rows, scores)
+    ]
+    return {"matches": matches, "namespace": namespaces[0] if len(namespaces) == 1 else list(namespaces)}
   
-@mcp.tool()
-def CalculateContribution(paper, fragmentList): # fragmentList is a list of ids [i1, i2, i3, ...]
-    """Determines the contribution of selected knowledge fragments."""
-    vectors = []
-    for fragment_id in fragmentList:
-        response = idx.fetch(
-            ids=[str(fragment_id)], namespace=namespace
-        )
-        vector = response.vectors[str(fragment_id)]['values']
-        
-        vectors.append(vector)
-    paper_embedding = EmbedParagraph(paper)
-    contributions = cosine_similarity([paper_embedding], vectors)[0]
-    return {fragmentList[i]: contributions[i] for i in range(len(fragmentList))}
+@tool()
+@timed_tool("CalculateContribution")
+def CalculateContribution(paper, fragmentList, attribution=None, top_passages=3, project_id=None): # fragmentList is a list of ids [i1, i2, i3, ...]
+    """Determines the contribution of selected knowledge fragments.
+
+    By default the whole paper is embedded once and each fragment gets one
+    cosine score. attribution="sentence" or "paragraph" splits the paper
+    into passages instead and returns, per fragment, the mean score of its
+    top_passages best-supported passages along with those passages.
+    """
+    import numpy as np
+
+    ids = [str(fragment_id) for fragment_id in fragmentList]
+    with track_provider(VECTOR_BACKEND, "fetch", len(ids)):
+        found, vectors = get_store().fetch_vectors(ids, namespace=project_namespace(project_id))  # one bulk fetch
+    contributions = {fragment_id: {"error": "Fragment not found"} for fragment_id in ids}
+    if not found:
+        return contributions
+
+    norms = np.linalg.norm(vectors, axis=1)
+    norms[norms == 0] = 1.0
+    if attribution:
+        contributions.update(_attribute_passages(paper, found, vectors / norms[:, None], attribution, int(top_passages)))
+        return contributions
+
+    paper_embedding = np.asarray(EmbedParagraph(paper), dtype=np.float32)
+    paper_embedding /= np.linalg.norm(paper_embedding) or 1.0
+    scores = (vectors @ paper_embedding) / norms
+    contributions.update(zip(found, scores.tolist()))
+    return contributions
+
+def _attribute_passages(paper, ids, fragments, granularity, top_passages):
+    """Scores unit-norm fragment vectors against every passage of the paper."""
+    import numpy as np
+    from ingest import split_passages
+
+    passages = split_passages(paper, granularity)
+    if not passages:
+        return {id: {"score": 0.0, "passages": []} for id in ids}
+    # Unchanged passages of an edited draft come from the embedding cache
+    embeddings = np.asarray(EmbedParagraphs(passages), dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1)
+    norms[norms == 0] = 1.0
+    similarity = (embeddings / norms[:, None]) @ fragments.T  # passages x fragments
+
+    k = max(1, min(top_passages, len(passages)))
+    best = np.argpartition(-similarity, k - 1, axis=0)[:k]
+    best_scores = np.take_along_axis(similarity, best, axis=0)
+    order = np.argsort(-best_scores, axis=0)
+    best = np.take_along_axis(best, order, axis=0)
+    best_scores = np.take_along_axis(best_scores, order, axis=0)
+    aggregate = best_scores.mean(axis=0)
+    return {
+        id: {
+            "score": float(aggregate[column]),
+            "passages": [
+                {"index": int(row), "text": passages[row], "score": float(score)}
+                for row, score in zip(best[:, column], best_scores[:, column])
+            ],
+        }
+        for column, id in enumerate(ids)
+    }
+
+@tool()
+def Metrics():
+    """Returns tool latency, provider call and embedding cache metrics."""
+    return REGISTRY.snapshot()
 
 # FastAPI routes
-@app.post("/UploadFragment")
-async def upload_fragment_api(request: ParagraphRequest):
-    return UploadFragment(request.paragraph)
+async def run_request(http_request, awaitable):
+    """Awaits a route's work, abandoning it if the client disconnects, and
+    returns the result as compact JSON (skipping FastAPI's own encoder).
+
+    Abandoned work stops at its next check_cancelled(), between provider calls."""
+    from fastapi import HTTPException, Response
+
+    try:
+        result = await run_until_disconnected(http_request, awaitable)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Provider call timed out")
+    except ExecutorBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ClientDisconnected:
+        return Response(status_code=499)
+    return Response(dumpb(result), media_type="application/json")
+
+def create_app():
+    """Builds the FastAPI app exposing the tools as HTTP routes."""
+    from typing import Literal, Optional, Union
+    from fastapi import FastAPI, HTTPException, Request, Response
+    from fastapi.responses import StreamingResponse
+    from fastapi.middleware.cors import CORSMiddleware
+    from pydantic import BaseModel
+
+    app = FastAPI()
+
+    # Add CORS middleware configuration
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://localhost:3000"],  # Allow requests from your React app
+        allow_credentials=True,
+        allow_methods=["*"],  # Allow all HTTP methods (including OPTIONS)
+        allow_headers=["*"],  # Allow all headers
+    )
+
+    # Define Pydantic models for request validation
+    class ParagraphRequest(BaseModel):
+        paragraph: str
+        project_id: Optional[str] = None
+        metadata: Optional[dict] = None
+        include_embedding: bool = False
+
+    class ParagraphsRequest(BaseModel):
+        paragraphs: list
+        project_id: Optional[str] = None
+        metadata: Optional[dict] = None
+        include_embeddings: bool = False
+
+    class PromptRequest(BaseModel):
+        prompt: str
+        quantization: Optional[str] = None
+        top_k: int = 5
+        project_id: Optional[Union[str, list]] = None
+        filters: Optional[dict] = None
+        include_metadata: bool = False
+
+    class SuggestRequest(BaseModel):
+        prompt: str
+        k: int = 5
+        lambda_mult: float = 0.5
+        pool_size: int = 50
+        project_id: Optional[Union[str, list]] = None
+        filters: Optional[dict] = None
+
+    class ContributionRequest(BaseModel):
+        paper: str
+        fragmentList: list
+        attribution: Optional[str] = None
+        top_passages: int = 3
+        project_id: Optional[str] = None
+
+    class CitationsRequest(BaseModel):
+        project_id: str
+        format: Literal["apa", "mla", "chicago", "ieee"] = "apa"
+        offset: int = 0
+        limit: Optional[int] = None
+        stream: bool = False
+
+    class DeleteRequest(BaseModel):
+        fragmentList: list
+        project_id: Optional[str] = None
 
-@app.post("/QueryFragment")
-async def query_fragment_api(request: PromptRequest):
-    return QueryFragment(request.prompt)
+    class DedupeRequest(BaseModel):
+        paragraphs: Optional[list] = None
+        threshold: Optional[float] = None
+        project_id: Optional[str] = None
 
-@app.post("/CalculateContribution")
-async def calculate_contribution_api(request: ContributionRequest):
-    return CalculateContribution(request.paper, request.fragmentList)
+    @app.post("/UploadFragment")
+    async def upload_fragment_api(request: ParagraphRequest, http_request: Request):
+        # Queued on the batcher directly rather than through UploadFragment, so tracked here
+        with track_tool("UploadFragment"):
+            try:
+                upload = asyncio.wrap_future(submit_upload(
+                    request.paragraph, project_namespace(request.project_id), request.metadata,
+                    request.include_embedding
+                ))
+            except (ValueError, TypeError) as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            return await run_request(http_request, asyncio.wait_for(upload, PROVIDER_TIMEOUT))
+
+    @app.post("/UploadFragments")
+    async def upload_fragments_api(request: ParagraphsRequest, http_request: Request):
+        # Bulk loads may take many provider round trips, so no overall timeout
+        return await run_request(http_request, executor.run(
+            UploadFragments, request.paragraphs, request.project_id, request.metadata, request.include_embeddings,
+            timeout=None
+        ))
+
+    @app.post("/QueryFragment")
+    async def query_fragment_api(request: PromptRequest, http_request: Request):
+        return await run_request(http_request, executor.run(
+            QueryFragment, request.prompt, request.quantization, request.top_k, request.project_id, request.filters,
+            request.include_metadata
+        ))
+
+    @app.post("/SuggestFragments")
+    async def suggest_fragments_api(request: SuggestRequest, http_request: Request):
+        return await run_request(http_request, executor.run(
+            SuggestFragments, request.prompt, request.k, request.lambda_mult, request.pool_size, request.project_id,
+            request.filters
+        ))
+
+    @app.post("/CalculateContribution")
+    async def calculate_contribution_api(request: ContributionRequest, http_request: Request):
+        return await run_request(http_request, executor.run(
+            CalculateContribution, request.paper, request.fragmentList, request.attribution, request.top_passages,
+            request.project_id
+        ))
+
+    @app.post("/GenerateCitations")
+    async def generate_citations_api(request: CitationsRequest, http_request: Request):
+        from citations import default_engine
+
+        engine = default_engine()
+        if request.stream:
+            # One citation per line (NDJSON), produced page by page as the client reads
+            lines = (
+                dumpb(citation) + b"\n"
+                for page in engine.stream(request.project_id, request.format)
+                for citation in page["citations"]
+            )
+            return StreamingResponse(lines, media_type="application/x-ndjson")
+        return await run_request(http_request, executor.run(
+            engine.bibliography, request.project_id, request.format, request.offset, request.limit
+        ))
+
+    @app.post("/DeleteFragments")
+    async def delete_fragments_api(request: DeleteRequest, http_request: Request):
+        return await run_request(http_request, executor.run(DeleteFragments, request.fragmentList, request.project_id))
+
+    @app.post("/DedupeReport")
+    async def dedupe_report_api(request: DedupeRequest, http_request: Request):
+        return await run_request(
+            http_request, executor.run(DedupeReport, request.paragraphs, request.threshold, request.project_id, timeout=None)
+        )
+
+    @app.get("/metrics")
+    async def metrics_api():
+        # Prometheus scrape endpoint
+        return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+    return app
+
+_app = None
+
+def __getattr__(name):
+    # `server.app` (e.g. `uvicorn server:app`) builds the FastAPI app lazily
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 if __name__ == "__main__":
-    import sys
-    import uvicorn
-    
     # Check command line arguments
-    if len(sys.argv) > 1 and sys.argv[1] == "api":
+    if len(sys.argv) > 1 and sys.argv[1].lower() == "api":
+        import uvicorn
+
         # Run as FastAPI
         print("Starting server in FastAPI mode...")
-        uvicorn.run(app, host="0.0.0.0", port=8000)
+        uvicorn.run(create_app(), host="0.0.0.0", port=8000)
     else:
-        # Run as MCP
-        print("Starting server in MCP mode...")
+        # Run as MCP; stdout carries the protocol, so log to stderr
+        print("Starting server in MCP mode...", file=sys.stderr)
         mcp.run(transport='stdio')
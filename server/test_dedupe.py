@@ -0,0 +1,76 @@
+import numpy as np
+
+from dedupe import MinHashIndex, candidate_probability, dedupe_report
+
+THRESHOLD = 0.8
+
+
+def _pairs(similarity, count, size=200, seed=0):
+    """`count` text pairs whose word sets have Jaccard similarity ~`similarity`
+    (one-word shingles, so the set similarity is exact)."""
+    # (size - k) / (size + k) = similarity
+    changed = round(size * (1 - similarity) / (1 + similarity))
+    rng = np.random.default_rng(seed)
+    pairs = []
+    for i in range(count):
+        words = [f"w{i}x{j}" for j in rng.permutation(10 * size)[: size + changed]]
+        pairs.append((" ".join(words[:size]), " ".join(words[: size - changed] + words[size:])))
+    return pairs, (size - changed) / (size + changed)
+
+
+def _index():
+    return MinHashIndex(THRESHOLD, shingle_size=1)
+
+
+def _shares_band(index, a, b):
+    rows = index.rows
+    return any(
+        np.array_equal(a[band * rows : (band + 1) * rows], b[band * rows : (band + 1) * rows])
+        for band in range(index.bands)
+    )
+
+
+def test_bands_favour_recall_at_threshold():
+    index = _index()
+    assert index.bands * index.rows <= 128
+    assert candidate_probability(THRESHOLD, index.bands, index.rows) >= 0.85
+
+
+def test_candidate_recall_at_threshold():
+    index = _index()
+    pairs, similarity = _pairs(THRESHOLD, 400)
+    assert abs(similarity - THRESHOLD) < 0.01
+    found = sum(
+        _shares_band(index, index.hasher.signature(a), index.hasher.signature(b)) for a, b in pairs
+    )
+    assert found / len(pairs) >= 0.8
+
+
+def test_detection_recall_above_threshold():
+    for target, expected in ((0.85, 0.9), (0.9, 0.98)):
+        pairs, _ = _pairs(target, 300, seed=1)
+        detected = 0
+        for i, (a, b) in enumerate(pairs):
+            index = _index()
+            index.add(f"a{i}", a)
+            detected += bool(index.query(b))
+        assert detected / len(pairs) >= expected, target
+
+
+def test_texts_without_words_are_not_duplicates():
+    index = _index()
+    assert index.screen("a", "[1]") == []
+    assert index.screen("b", "[2, 3]", keep_duplicates=False) == []
+    assert len(index) == 0
+    assert dedupe_report([("a", "[1]"), ("b", "[2, 3]")])["duplicate_groups"] == 0
+
+
+def test_screen_many_matches_within_batch_and_persists(tmp_path):
+    path = str(tmp_path / "index.sqlite3")
+    [(a, b)], _ = _pairs(0.95, 1)
+    index = MinHashIndex(THRESHOLD, shingle_size=1, path=path)
+    screened = index.screen_many({"a": a, "b": b, "c": "[1]"}, keep_duplicates=False)
+    assert screened["a"] == [] and screened["c"] == []
+    assert [id for id, _ in screened["b"]] == ["a"]
+    reopened = MinHashIndex(THRESHOLD, shingle_size=1, path=path)
+    assert "a" in reopened and "b" not in reopened and len(reopened) == 1
@@ -0,0 +1,38 @@
+import numpy as np
+
+from embedcache import EmbeddingCache
+
+DIMENSION = 256
+
+
+def _vectors(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [(f"text {i}", rng.standard_normal(DIMENSION).tolist()) for i in range(count)]
+
+
+def test_memory_is_bounded_in_bytes():
+    entry = DIMENSION * 4
+    cache = EmbeddingCache(None, max_bytes=10 * entry)
+    entries = _vectors(25)
+    cache.put_many("model", "search_document", entries)
+
+    assert len(cache) == 10 and cache.nbytes == 10 * entry
+    assert cache.stats["evictions"] == 15
+    assert cache.get("model", "search_document", "text 0") is None
+    vector = cache.get("model", "search_document", "text 24")
+    assert vector.dtype == np.float32 and not vector.flags.writeable
+    np.testing.assert_allclose(vector, entries[24][1], rtol=1e-6)
+
+
+def test_disk_keeps_the_most_recently_written_rows(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    cache = EmbeddingCache(path, max_bytes=0, max_rows=10)
+    entries = _vectors(25)
+    for start in range(0, len(entries), 5):
+        cache.put_many("model", "search_document", entries[start:start + 5])
+    assert cache.stats["disk_evictions"] == 15
+
+    reopened = EmbeddingCache(path, max_bytes=0, max_rows=10)
+    assert reopened.get("model", "search_document", "text 14") is None
+    np.testing.assert_allclose(reopened.get("model", "search_document", "text 15"), entries[15][1], rtol=1e-6)
+    assert reopened.stats["disk_hits"] == 1
@@ -0,0 +1,44 @@
+import asyncio
+
+from jsonrpc import ErrorCode, Server
+from serialize import dumpb, loads
+
+
+class _Transport:
+    """In-memory transport: replays `messages` and collects the replies."""
+
+    def __init__(self, messages):
+        self.messages = [dumpb(message) for message in messages]
+        self.replies = []
+
+    async def open(self):
+        pass
+
+    async def read(self):
+        return self.messages.pop(0) if self.messages else None
+
+    async def write(self, body):
+        self.replies.append(loads(body))
+
+    async def close(self):
+        pass
+
+
+def _serve(messages):
+    transport = _Transport(messages)
+    asyncio.run(Server({"name": "test", "version": "0"}).connect(transport))
+    return transport.replies
+
+
+def test_requests_with_unhashable_or_boolean_ids_are_invalid():
+    replies = _serve([
+        {"jsonrpc": "2.0", "id": {"a": 1}, "method": "ping"},
+        {"jsonrpc": "2.0", "id": [1], "method": "ping"},
+        {"jsonrpc": "2.0", "id": True, "method": "ping"},
+        {"jsonrpc": "2.0", "method": "notifications/cancelled", "params": {"requestId": {"a": 1}}},
+        {"jsonrpc": "2.0", "id": 7, "method": "ping"},
+    ])
+    errors = [reply for reply in replies if "error" in reply]
+    assert len(errors) == 3
+    assert all(reply["id"] is None and reply["error"]["code"] == ErrorCode.InvalidRequest for reply in errors)
+    assert {"jsonrpc": "2.0", "id": 7, "result": {}} in replies
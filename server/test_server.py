@@ -0,0 +1,87 @@
+import os
+
+# server reads its configuration at import; keep caches off disk
+os.environ.setdefault("COHERE_API_KEY", "test")
+os.environ.setdefault("VECTOR_BACKEND", "local")
+os.environ["EMBED_CACHE_PATH"] = ""
+os.environ["DEDUPE_INDEX_PATH"] = ""
+
+import pytest
+
+import server
+from bench import FakeCohere
+from fragstore import MmapStore
+from serialize import loads
+
+
+@pytest.fixture
+def mmap_server(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "co", FakeCohere(16))
+    monkeypatch.setattr(server, "store", MmapStore(str(tmp_path / "fragments")))
+    monkeypatch.setattr(server, "known_ids", {})
+    monkeypatch.setattr(server, "dedupe_indexes", {})
+    server.query_cache.bump(server.namespace)
+    return tmp_path / "fragments"
+
+
+def test_reupload_after_delete_by_another_handle(mmap_server):
+    paragraph = "Fragments deleted by another worker must be uploaded again."
+    first = server.UploadFragment(paragraph)
+    assert first["status"] == "success"
+    assert server.UploadFragment(paragraph)["status"] == "unchanged"
+
+    other = MmapStore(str(mmap_server))
+    assert other.delete([first["id"]], namespace=server.namespace) == 1
+
+    again = server.UploadFragment(paragraph)
+    assert again["status"] == "success"
+    assert server.get_store().exists([first["id"]], namespace=server.namespace) == [first["id"]]
+
+
+def test_mcp_tool_result_is_compact_json(mmap_server):
+    import asyncio
+
+    result = asyncio.run(server.mcp.call_tool("UploadFragment", {"paragraph": "Sent over the wire compactly."}))
+    content = result[0] if isinstance(result, tuple) else result
+    assert len(content) == 1
+    text = content[0].text
+    assert "\n" not in text and '": ' not in text
+    assert loads(text)["status"] == "success"
+
+
+def test_http_upload_fragment_is_counted(mmap_server):
+    from fastapi.testclient import TestClient
+    from metrics import TOOL_REQUESTS
+
+    before = TOOL_REQUESTS.snapshot().get("UploadFragment", 0)
+    with TestClient(server.create_app()) as client:
+        response = client.post("/UploadFragment", json={"paragraph": "Counted like every other route."})
+    assert response.status_code == 200
+    assert TOOL_REQUESTS.snapshot()["UploadFragment"] == before + 1
+
+
+def test_failed_ingest_unindexes_chunks_it_never_upserted(mmap_server, tmp_path, monkeypatch):
+    document = tmp_path / "notes.md"
+    document.write_text("\n\n".join(f"Paragraph {i} about a distinct topic number {i * 7}." for i in range(6)))
+    index = server.get_dedupe_index(server.namespace)
+    upserted = []
+
+    def upsert_then_fail(items, namespace):
+        if upserted:
+            raise RuntimeError("store unavailable")
+        upserted.extend(id for id, _, _ in items)
+        return {"status": "success", "upserted_count": len(items), "namespace": namespace}
+
+    monkeypatch.setattr(server, "PineconeUpsertBatch", upsert_then_fail)
+    with pytest.raises(RuntimeError):
+        server.ingest_document(str(document), server.namespace, max_chars=60, overlap=0, batch_size=2)
+    assert upserted and all(id in index for id in upserted)
+    assert len(index) == len(upserted)
+
+
+def test_http_upload_fragment_rejects_malformed_metadata(mmap_server):
+    from fastapi.testclient import TestClient
+
+    with TestClient(server.create_app()) as client:
+        response = client.post("/UploadFragment", json={"paragraph": "Tagged badly.", "metadata": {"tags": 5}})
+    assert response.status_code == 400
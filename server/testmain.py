@@ -5,12 +5,23 @@ Synthia MCP Server
 A self-contained MCP server implementation without external SDK dependencies.
 """
 
-import json
 import logging
 import sys
 import asyncio
 from typing import Any, Dict, List, Optional
 
+from metrics import REGISTRY
+from serialize import text_content
+from tools import TOOLS, tool
+from jsonrpc import (
+    CallToolRequestSchema,
+    ErrorCode,
+    ListToolsRequestSchema,
+    McpError,
+    Server,
+    StdioServerTransport,
+)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -20,43 +31,6 @@ logging.basicConfig(
 logger = logging.getLogger("synthia_mcp_server")
 
 
-# Mock MCP SDK components
-class Server:
-    def __init__(self, *args, **kwargs):
-        self.request_handlers = {}
-
-    def set_request_handler(self, schema, handler):
-        self.request_handlers[schema.__name__] = handler
-
-    async def connect(self, transport):
-        logger.info("Mock server connected to transport")
-
-
-class StdioServerTransport:
-    pass
-
-
-class CallToolRequestSchema:
-    def __init__(self, name, arguments):
-        self.name = name
-        self.arguments = arguments
-
-
-class ListToolsRequestSchema:
-    pass
-
-
-class McpError(Exception):
-    def __init__(self, code, message):
-        self.code = code
-        self.message = message
-
-
-class ErrorCode:
-    MethodNotFound = "MethodNotFound"
-    InternalError = "InternalError"
-
-
 class SynthiaMcpServer:
     """Synthia MCP Server implementation."""
 
@@ -76,6 +50,7 @@ class SynthiaMcpServer:
         )
 
         # Set up request handlers
+        self.tools = TOOLS.bind(self)
         self.setup_tool_handlers()
 
         # Error handling
@@ -87,103 +62,8 @@ class SynthiaMcpServer:
         self.server.set_request_handler(CallToolRequestSchema, self.handle_call_tool)
 
     async def handle_list_tools(self, request):
-        """Handle ListTools request."""
-        return {
-            "tools": [
-                {
-                    "name": "project-init",
-                    "description": "Initialize a new project with specified configuration",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {
-                            "project_name": {
-                                "type": "string",
-                                "description": "Name of the project",
-                            },
-                            "description": {
-                                "type": "string",
-                                "description": "Brief description of the project",
-                            },
-                            "template": {
-                                "type": "string",
-                                "description": "Project template to use",
-                                "enum": ["default", "research", "development"],
-                            },
-                        },
-                        "required": ["project_name"],
-                    },
-                },
-                {
-                    "name": "suggest-fragment",
-                    "description": "Suggest code or text fragments based on project context",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {
-                            "project_id": {
-                                "type": "string",
-                                "description": "ID of the project",
-                            },
-                            "context": {
-                                "type": "string",
-                                "description": "Context for the suggestion",
-                            },
-                            "fragment_type": {
-                                "type": "string",
-                                "description": "Type of fragment to suggest",
-                                "enum": ["code", "text", "mixed"],
-                            },
-                        },
-                        "required": ["project_id", "context"],
-                    },
-                },
-                {
-                    "name": "save-fragment",
-                    "description": "Save a fragment to a project",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {
-                            "project_id": {
-                                "type": "string",
-                                "description": "ID of the project",
-                            },
-                            "fragment": {
-                                "type": "string",
-                                "description": "Content of the fragment",
-                            },
-                            "fragment_type": {
-                                "type": "string",
-                                "description": "Type of the fragment",
-                                "enum": ["code", "text", "mixed"],
-                            },
-                            "metadata": {
-                                "type": "object",
-                                "description": "Additional metadata for the fragment",
-                            },
-                        },
-                        "required": ["project_id", "fragment"],
-                    },
-                },
-                {
-                    "name": "generate-citations",
-                    "description": "Generate citations for a project",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {
-                            "project_id": {
-                                "type": "string",
-                                "description": "ID of the project",
-                            },
-                            "format": {
-                                "type": "string",
-                                "description": "Citation format",
-                                "enum": ["apa", "mla", "chicago", "ieee"],
-                            },
-                        },
-                        "required": ["project_id"],
-                    },
-                },
-            ]
-        }
+        """Handle ListTools request with the tools/list result encoded once."""
+        return TOOLS.listing_json()
 
     async def handle_call_tool(self, request):
         """Handle CallTool request."""
@@ -191,43 +71,33 @@ class SynthiaMcpServer:
         arguments = request.arguments
 
         try:
-            if tool_name == "project-init":
-                return await self._handle_project_init(arguments)
-            elif tool_name == "suggest-fragment":
-                return await self._handle_suggest_fragment(arguments)
-            elif tool_name == "save-fragment":
-                return await self._handle_save_fragment(arguments)
-            elif tool_name == "generate-citations":
-                return await self._handle_generate_citations(arguments)
-            else:
-                raise McpError(
-                    ErrorCode.MethodNotFound, f"Unknown tool: {tool_name}"
-                )
+            # Validates the arguments against the tool's schema before the handler runs
+            return await self.tools.call(tool_name, arguments)
+        except McpError:
+            raise
         except Exception as e:
             logger.error(f"Error handling tool call {tool_name}: {e}")
             raise McpError(
                 ErrorCode.InternalError, f"Error processing {tool_name}: {str(e)}"
             )
 
+    @tool("metrics")
+    async def _handle_metrics(self, arguments):
+        """Handle metrics tool."""
+        return text_content(REGISTRY.snapshot())
+
+    @tool("project-init")
     async def _handle_project_init(self, arguments):
         """Handle project-init tool."""
         if self.MOCK:
             # Return mock data
-            return {
-                "content": [
-                    {
-                        "type": "text",
-                        "text": json.dumps(
-                            {
-                                "project_id": "proj_mock_project",
-                                "status": "initialized",
-                                "template": "default",
-                            },
-                            indent=2,
-                        ),
-                    }
-                ],
-            }
+            return text_content(
+                {
+                    "project_id": "proj_mock_project",
+                    "status": "initialized",
+                    "template": "default",
+                }
+            )
 
         # Real implementation
         project_name = arguments.get("project_name")
@@ -236,94 +106,73 @@ class SynthiaMcpServer:
 
         logger.info(f"Initializing project: {project_name} with template: {template}")
 
-        return {
-            "content": [
-                {
-                    "type": "text",
-                    "text": json.dumps(
-                        {
-                            "project_id": f"proj_{project_name.lower().replace(' ', '_')}",
-                            "status": "initialized",
-                            "template": template,
-                        },
-                        indent=2,
-                    ),
-                }
-            ],
-        }
+        from projectstore import default_store
+
+        result = await asyncio.to_thread(default_store().create_project, project_name, description, template)
+        return text_content(result)
 
+    @tool("suggest-fragment")
     async def _handle_suggest_fragment(self, arguments):
         """Handle suggest-fragment tool."""
         if self.MOCK:
             # Return mock data
-            return {
-                "content": [
-                    {
-                        "type": "text",
-                        "text": json.dumps(
-                            {
-                                "suggestions": [
-                                    {
-                                        "id": "sugg_1",
-                                        "content": "Mock suggestion based on context",
-                                        "type": "mixed",
-                                        "confidence": 0.85,
-                                    }
-                                ]
-                            },
-                            indent=2,
-                        ),
-                    }
-                ],
-            }
+            return text_content(
+                {
+                    "suggestions": [
+                        {
+                            "id": "sugg_1",
+                            "content": "Mock suggestion based on context",
+                            "type": "mixed",
+                            "confidence": 0.85,
+                        }
+                    ]
+                }
+            )
 
         # Real implementation
         project_id = arguments.get("project_id")
         context = arguments.get("context")
         fragment_type = arguments.get("fragment_type", "mixed")
+        k = arguments.get("k", 5)
+        lambda_mult = arguments.get("lambda", 0.5)
+        pool_size = arguments.get("pool_size", 50)
 
         logger.info(f"Suggesting {fragment_type} fragment for project: {project_id}")
 
-        return {
-            "content": [
-                {
-                    "type": "text",
-                    "text": json.dumps(
-                        {
-                            "suggestions": [
-                                {
-                                    "id": "sugg_1",
-                                    "content": "Example suggestion based on context",
-                                    "type": fragment_type,
-                                    "confidence": 0.85,
-                                }
-                            ]
-                        },
-                        indent=2,
-                    ),
-                }
-            ],
-        }
+        from server import SuggestFragments
+
+        # The project's most similar fragments, re-ranked so the suggestions do not repeat each other
+        filters = {"fragment_type": fragment_type} if fragment_type != "mixed" else None
+        result = await asyncio.to_thread(
+            SuggestFragments, context, k, lambda_mult, pool_size, project_id=project_id, filters=filters
+        )
 
+        return text_content(
+            {
+                "suggestions": [
+                    {
+                        "id": match["id"],
+                        "content": match.get("metadata", {}).get("text", ""),
+                        "type": match.get("metadata", {}).get("fragment_type", fragment_type),
+                        "confidence": round(match["score"], 4),
+                    }
+                    for match in result["matches"]
+                ]
+            }
+        )
+
+    @tool("save-fragment")
     async def _handle_save_fragment(self, arguments):
         """Handle save-fragment tool."""
         if self.MOCK:
             # Return mock data
-            return {
-                "content": [
-                    {
-                        "type": "text",
-                        "text": json.dumps(
-                            {
-                                "fragment_id": "frag_mock_1234",
-                                "status": "saved",
-                                "project_id": "proj_mock_project",
-                            },
-                            indent=2,
-                        ),
-                    }
-                ],
-            }
+            return text_content(
+                {
+                    "fragment_id": "frag_mock_1234",
+                    "status": "saved",
+                    "project_id": "proj_mock_project",
+                }
+            )
 
         # Real implementation
         project_id = arguments.get("project_id")
@@ -333,74 +182,88 @@ class SynthiaMcpServer:
 
         logger.info(f"Saving {fragment_type} fragment to project: {project_id}")
 
-        return {
-            "content": [
-                {
-                    "type": "text",
-                    "text": json.dumps(
-                        {
-                            "fragment_id": f"frag_{hash(fragment) % 10000}",
-                            "status": "saved",
-                            "project_id": project_id,
-                        },
-                        indent=2,
-                    ),
-                }
-            ],
-        }
+        from projectstore import default_store
+        from server import DeleteFragments, UploadFragment
+
+        # Sources the fragment cites are recorded in the project store, not in the vector index
+        metadata = dict(metadata)
+        sources = metadata.pop("sources", None) or []
+        store = default_store()
+
+        # Indexed first: invalid metadata or a provider error then leaves no project-store row behind
+        try:
+            result = await asyncio.to_thread(
+                UploadFragment, fragment, project_id=project_id, metadata={**metadata, "fragment_type": fragment_type}
+            )
+        except (ValueError, TypeError) as e:
+            raise McpError(ErrorCode.InvalidParams, str(e))
+        try:
+            if sources:
+                fragment_id, _ = await asyncio.to_thread(
+                    store.save_cited_fragment, project_id, fragment, fragment_type, metadata, sources
+                )
+            else:
+                fragment_id = await asyncio.to_thread(
+                    store.save_fragment, project_id, fragment, fragment_type, metadata
+                )
+        except Exception:
+            # The store write is all or nothing; un-index the fragment if this call added it
+            if result["status"] == "success":
+                await asyncio.to_thread(DeleteFragments, [result["id"]], project_id)
+            raise
+
+        return text_content(
+            {
+                "fragment_id": fragment_id,
+                "status": "saved" if result["status"] == "success" else result["status"],
+                "project_id": project_id,
+            }
+        )
 
+    @tool("generate-citations")
     async def _handle_generate_citations(self, arguments):
         """Handle generate-citations tool."""
         if self.MOCK:
             # Return mock data
-            return {
-                "content": [
-                    {
-                        "type": "text",
-                        "text": json.dumps(
-                            {
-                                "citations": [
-                                    {
-                                        "id": "cite_1",
-                                        "text": "Mock citation in APA format",
-                                        "format": "apa",
-                                    }
-                                ]
-                            },
-                            indent=2,
-                        ),
-                    }
-                ],
-            }
+            return text_content(
+                {
+                    "citations": [
+                        {
+                            "id": "cite_1",
+                            "text": "Mock citation in APA format",
+                            "format": "apa",
+                        }
+                    ]
+                }
+            )
 
         # Real implementation
         project_id = arguments.get("project_id")
         format = arguments.get("format", "apa")
+        offset = arguments.get("offset", 0)
+        limit = arguments.get("limit")
 
         logger.info(f"Generating {format} citations for project: {project_id}")
 
-        return {
-            "content": [
-                {
-                    "type": "text",
-                    "text": json.dumps(
-                        {
-                            "citations": [
-                                {
-                                    "id": "cite_1",
-                                    "text": "Example citation in requested format",
-                                    "format": format,
-                                }
-                            ]
-                        },
-                        indent=2,
-                    ),
-                }
-            ],
-        }
+        from citations import default_engine
+
+        # Only sources added or changed since the previous call are formatted again
+        result = await asyncio.to_thread(default_engine().bibliography, project_id, format, offset, limit)
+
+        return text_content(result)
 
     async def run(self):
         """Run the MCP server."""
         transport = StdioServerTransport()
-        await self.server.connect(transport)
         logger.info("Synthia MCP server running on stdio")
+        # Serves requests until stdin is closed
+        await self.server.connect(transport)
+
+
+if __name__ == "__main__":
+    # Serves mock data; pass --real to use the fragment index
+    server = SynthiaMcpServer(mock="--real" not in sys.argv)
+    try:
+        asyncio.run(server.run())
+    except KeyboardInterrupt:
+        logger.info("Server shutdown requested")
@@ -0,0 +1,231 @@
+"""
+Tool registry
+-------------
+The MCP tools' names, descriptions and input schemas, declared once and
+shared by main.py and testmain.py. Each schema is compiled into a validator
+when it is declared, so a call with missing or mistyped arguments is
+rejected (InvalidParams) before its handler runs. Handlers are methods
+marked with `@tool(name)`; `TOOLS.bind(server)` maps names to them for
+dict-lookup dispatch, and the tools/list result is encoded once.
+
+    class SynthiaMcpServer:
+        @tool("project-init")
+        async def _handle_project_init(self, arguments): ...
+
+    tools = TOOLS.bind(SynthiaMcpServer())
+    await tools.call("project-init", {"project_name": "Thesis"})
+"""
+
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from jsonrpc import ErrorCode, McpError
+from metrics import track_tool
+from serialize import dumpb
+
+Validator = Callable[[Any, str], None]
+
+_TYPES = {
+    "string": (str,),
+    "object": (dict,),
+    "array": (list, tuple),
+    "boolean": (bool,),
+    "integer": (int,),
+    "number": (int, float),
+}
+
+
+def _invalid(message: str):
+    raise McpError(ErrorCode.InvalidParams, message)
+
+
+def compile_schema(schema: Dict[str, Any]) -> Validator:
+    """A function (value, path) that raises InvalidParams unless `value` matches `schema`.
+
+    Supports the subset the tools use: type, enum, minimum, maximum, properties,
+    required and items.
+    """
+    kind = schema.get("type")
+    types = _TYPES.get(kind) if kind else None
+    if kind and types is None:
+        raise ValueError(f"Unsupported schema type: {kind}")
+    numeric = kind in ("integer", "number")
+    enum = frozenset(schema["enum"]) if "enum" in schema else None
+    allowed = ", ".join(map(str, schema.get("enum", ())))
+    minimum, maximum = schema.get("minimum"), schema.get("maximum")
+    properties = [(name, compile_schema(spec)) for name, spec in schema.get("properties", {}).items()]
+    required = tuple(schema.get("required", ()))
+    items = compile_schema(schema["items"]) if "items" in schema else None
+
+    def validate(value, path):
+        # bool is an int subclass but not a JSON number
+        if types is not None and (not isinstance(value, types) or (numeric and isinstance(value, bool))):
+            _invalid(f"{path} must be of type {kind}")
+        if enum is not None and value not in enum:
+            _invalid(f"{path} must be one of: {allowed}")
+        if minimum is not None and value < minimum:
+            _invalid(f"{path} must be at least {minimum}")
+        if maximum is not None and value > maximum:
+            _invalid(f"{path} must be at most {maximum}")
+        if properties or required:
+            missing = [name for name in required if value.get(name) is None]
+            if missing:
+                _invalid(f"Missing required argument(s): {', '.join(missing)}")
+            for name, check in properties:
+                if value.get(name) is not None:  # null is treated as absent
+                    check(value[name], name if path == "arguments" else f"{path}.{name}")
+        if items is not None:
+            for index, item in enumerate(value):
+                items(item, f"{path}[{index}]")
+
+    return validate
+
+
+def tool(name: str):
+    """Mark a method as the handler of the tool `name`."""
+
+    def mark(function):
+        function.tool_name = name
+        return function
+
+    return mark
+
+
+class BoundTools:
+    """A registry's tools bound to one server's handler methods."""
+
+    def __init__(self, handlers: Dict[str, Any]):
+        self._handlers = handlers
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._handlers
+
+    async def call(self, name: str, arguments: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        entry = self._handlers.get(name)
+        if entry is None:
+            raise McpError(ErrorCode.MethodNotFound, f"Unknown tool: {name}")
+        validate, handler = entry
+        arguments = {} if arguments is None else arguments
+        with track_tool(name):
+            validate(arguments, "arguments")
+            return await handler(arguments)
+
+
+class ToolRegistry:
+    def __init__(self):
+        self._tools: Dict[str, Dict[str, Any]] = {}
+        self._validators: Dict[str, Validator] = {}
+        self._listing: Optional[bytes] = None
+
+    def define(self, name: str, description: str, properties: Dict[str, Any] = None, required: List[str] = ()):
+        """Declare a tool; its input schema is compiled here, once."""
+        schema = {"type": "object", "properties": properties or {}}
+        if required:
+            schema["required"] = list(required)
+        self._tools[name] = {"name": name, "description": description, "inputSchema": schema}
+        self._validators[name] = compile_schema(schema)
+        self._listing = None
+
+    def list_tools(self) -> Dict[str, Any]:
+        return {"tools": list(self._tools.values())}
+
+    def listing_json(self) -> bytes:
+        """The encoded tools/list result, built on first use and reused."""
+        if self._listing is None:
+            self._listing = dumpb(self.list_tools())
+        return self._listing
+
+    def bind(self, server) -> BoundTools:
+        """Dispatch table of `server`'s @tool methods; every declared tool needs one."""
+        methods = {}
+        for attribute in dir(type(server)):
+            name = getattr(getattr(type(server), attribute), "tool_name", None)
+            if name is not None:
+                if name not in self._tools:
+                    raise ValueError(f"{attribute} handles undeclared tool {name!r}")
+                methods[name] = getattr(server, attribute)
+        missing = set(self._tools) - set(methods)
+        if missing:
+            raise ValueError(f"No handler for tool(s): {', '.join(sorted(missing))}")
+        return BoundTools({name: (self._validators[name], methods[name]) for name in self._tools})
+
+
+TOOLS = ToolRegistry()
+
+_PROJECT_ID = {"type": "string", "description": "ID of the project"}
+
+TOOLS.define(
+    "project-init",
+    "Initialize a new project with specified configuration",
+    {
+        "project_name": {"type": "string", "description": "Name of the project"},
+        "description": {"type": "string", "description": "Brief description of the project"},
+        "template": {
+            "type": "string",
+            "description": "Project template to use",
+            "enum": ["default", "research", "development"],
+        },
+    },
+    required=["project_name"],
+)
+TOOLS.define(
+    "suggest-fragment",
+    "Suggest code or text fragments based on project context",
+    {
+        "project_id": _PROJECT_ID,
+        "context": {"type": "string", "description": "Context for the suggestion"},
+        "fragment_type": {
+            "type": "string",
+            "description": "Type of fragment to suggest",
+            "enum": ["code", "text", "mixed"],
+        },
+        "k": {"type": "integer", "description": "Number of suggestions (default 5)", "minimum": 1, "maximum": 100},
+        "lambda": {
+            "type": "number",
+            "description": "Relevance vs diversity: 1 ranks by similarity only, 0 by diversity only (default 0.5)",
+            "minimum": 0,
+            "maximum": 1,
+        },
+        "pool_size": {
+            "type": "integer",
+            "description": "Most similar fragments considered before diversifying (default 50)",
+            "minimum": 1,
+            "maximum": 1000,
+        },
+    },
+    required=["project_id", "context"],
+)
+TOOLS.define(
+    "save-fragment",
+    "Save a fragment to a project",
+    {
+        "project_id": _PROJECT_ID,
+        "fragment": {"type": "string", "description": "Content of the fragment"},
+        "fragment_type": {
+            "type": "string",
+            "description": "Type of the fragment",
+            "enum": ["code", "text", "mixed"],
+        },
+        "metadata": {"type": "object", "description": "Additional metadata for the fragment"},
+    },
+    required=["project_id", "fragment"],
+)
+TOOLS.define(
+    "generate-citations",
+    "Generate citations for a project",
+    {
+        "project_id": _PROJECT_ID,
+        "format": {
+            "type": "string",
+            "description": "Citation format",
+            "enum": ["apa", "mla", "chicago", "ieee"],
+        },
+        "offset": {"type": "integer", "description": "Index of the first citation (default 0)", "minimum": 0},
+        "limit": {
+            "type": "integer",
+            "description": "Most citations to return; the response's next_offset fetches the rest (default all)",
+            "minimum": 1,
+        },
+    },
+    required=["project_id"],
+)
+TOOLS.define("metrics", "Report tool latency and provider call metrics")
@@ -0,0 +1,409 @@
+"""
+Vector store backends
+---------------------
+Backends that hold fragment embeddings for the Synthia server. Every backend
+exposes the same small interface (upsert / query / fetch / delete) and returns
+plain, JSON-serializable dictionaries shaped like Pinecone responses, so the
+tools in server.py do not care where the vectors live.
+"""
+
+import threading
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from metafilter import MetadataIndex, parse_filter, pinecone_filter
+from quantize import OVERSAMPLE, QuantizedCodes, check_mode
+
+DEFAULT_NAMESPACE = "mcp-namespace"
+
+# (id, vector, metadata) triples, the same shape Pinecone's upsert accepts.
+VectorItem = Tuple[str, Sequence[float], Optional[Dict[str, Any]]]
+
+
+class VectorStore:
+    """Interface implemented by every fragment vector backend."""
+
+    def upsert(self, items: Iterable[VectorItem], namespace: str = DEFAULT_NAMESPACE) -> int:
+        """Insert or overwrite vectors, returning the number written."""
+        raise NotImplementedError
+
+    def query(
+        self,
+        vector: Sequence[float],
+        top_k: int = 5,
+        namespace: str = DEFAULT_NAMESPACE,
+        include_values: bool = False,
+        include_metadata: bool = True,
+        quantization: Optional[str] = None,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Return the top_k most similar vectors as {"matches": [...], "namespace": ...}.
+
+        `quantization` ("int8" or "binary") picks candidates by scanning compact
+        codes and rescores them at full precision; backends without local
+        codes ignore it. `filter` (see metafilter) restricts the search to
+        matching fragments before any vector is scored.
+        """
+        raise NotImplementedError
+
+    def fetch(self, ids: Sequence[str], namespace: str = DEFAULT_NAMESPACE) -> Dict[str, Dict[str, Any]]:
+        """Return {id: {"id", "values", "metadata"}} for the ids that exist."""
+        raise NotImplementedError
+
+    def delete(self, ids: Sequence[str], namespace: str = DEFAULT_NAMESPACE) -> int:
+        """Remove vectors by id, returning the number removed."""
+        raise NotImplementedError
+
+    def fetch_vectors(self, ids: Sequence[str], namespace: str = DEFAULT_NAMESPACE) -> Tuple[List[str], np.ndarray]:
+        """Return the ids that exist, in request order, and their vectors as one float32 matrix."""
+        fetched = self.fetch(list(dict.fromkeys(str(id) for id in ids)), namespace=namespace)
+        found = [str(id) for id in ids if str(id) in fetched]
+        if not found:
+            return [], np.empty((0, 0), dtype=np.float32)
+        return found, np.asarray([fetched[id]["values"] for id in found], dtype=np.float32)
+
+    def exists(self, ids: Sequence[str], namespace: str = DEFAULT_NAMESPACE) -> List[str]:
+        """Return the ids that are stored, in request order."""
+        fetched = self.fetch(list(dict.fromkeys(str(id) for id in ids)), namespace=namespace)
+        return [str(id) for id in ids if str(id) in fetched]
+
+    def version(self, namespace: str = DEFAULT_NAMESPACE) -> Optional[Hashable]:
+        """A value that changes with every write to `namespace`, seen by every process
+        sharing the store, or None if the backend keeps none."""
+        return None
+
+
+class PineconeStore(VectorStore):
+    """Backend that forwards every call to a remote Pinecone index."""
+
+    FETCH_BATCH_SIZE = 1000  # Pinecone caps the ids of a single fetch
+
+    def __init__(self, index):
+        self.index = index
+
+    def upsert(self, items, namespace=DEFAULT_NAMESPACE):
+        vectors = [
+            (str(id), vector.tolist() if isinstance(vector, np.ndarray) else list(vector), metadata or {})
+            for id, vector, metadata in items
+        ]
+        if not vectors:
+            return 0
+        output = self.index.upsert(vectors=vectors, namespace=namespace)
+        return output.get("upserted_count", 0)
+
+    def query(
+        self,
+        vector,
+        top_k=5,
+        namespace=DEFAULT_NAMESPACE,
+        include_values=False,
+        include_metadata=True,
+        quantization=None,
+        filter=None,
+    ):
+        options = {}
+        parsed = parse_filter(filter)
+        if parsed:
+            options["filter"] = pinecone_filter(parsed)
+        response = self.index.query(
+            vector=vector.tolist() if isinstance(vector, np.ndarray) else list(vector),
+            top_k=top_k,
+            namespace=namespace,
+            include_values=include_values,
+            include_metadata=include_metadata,
+            **options,
+        )
+        response = response.to_dict() if hasattr(response, "to_dict") else response
+        # Plain, lean matches like the local backends (no empty "values", usage or sparse fields)
+        matches = []
+        for match in response.get("matches", []):
+            plain = {"id": match["id"], "score": match["score"]}
+            if include_values:
+                plain["values"] = match.get("values", [])
+            if include_metadata:
+                plain["metadata"] = match.get("metadata") or {}
+            matches.append(plain)
+        return {"matches": matches, "namespace": response.get("namespace", namespace)}
+
+    def fetch(self, ids, namespace=DEFAULT_NAMESPACE):
+        ids = [str(id) for id in ids]
+        result = {}
+        for start in range(0, len(ids), self.FETCH_BATCH_SIZE):
+            response = self.index.fetch(ids=ids[start : start + self.FETCH_BATCH_SIZE], namespace=namespace)
+            for id, vector in response.vectors.items():
+                values = vector["values"] if isinstance(vector, dict) else vector.values
+                metadata = vector.get("metadata") if isinstance(vector, dict) else vector.metadata
+                result[id] = {"id": id, "values": list(values), "metadata": metadata or {}}
+        return result
+
+    def delete(self, ids, namespace=DEFAULT_NAMESPACE):
+        ids = [str(id) for id in ids]
+        if ids:
+            self.index.delete(ids=ids, namespace=namespace)
+        return len(ids)
+
+
+class _Partition:
+    """Vectors of one namespace, kept in a contiguous float32 matrix."""
+
+    def __init__(self, dimension: int, capacity: int = 1024):
+        self.dimension = dimension
+        self.matrix = np.empty((capacity, dimension), dtype=np.float32)
+        self.norms = np.empty(capacity, dtype=np.float32)
+        self.ids: List[str] = []
+        self.metadata: List[Dict[str, Any]] = []
+        self.rows: Dict[str, int] = {}
+        self.codes: Dict[str, QuantizedCodes] = {}
+        self.index = MetadataIndex(capacity)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _reserve(self, size: int):
+        capacity = self.matrix.shape[0]
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        matrix = np.empty((capacity, self.dimension), dtype=np.float32)
+        norms = np.empty(capacity, dtype=np.float32)
+        matrix[: len(self)] = self.matrix[: len(self)]
+        norms[: len(self)] = self.norms[: len(self)]
+        self.matrix, self.norms = matrix, norms
+        for codes in self.codes.values():
+            codes.reserve(capacity)
+
+    def put(self, id: str, vector: np.ndarray, metadata: Dict[str, Any]):
+        row = self.rows.get(id)
+        if row is None:
+            row = len(self)
+            self._reserve(row + 1)
+            self.ids.append(id)
+            self.metadata.append(metadata)
+            self.rows[id] = row
+        else:
+            self.index.remove(row, self.metadata[row])
+            self.metadata[row] = metadata
+        self.index.add(row, metadata)
+        self.matrix[row] = vector
+        self.norms[row] = np.linalg.norm(vector)
+        for codes in self.codes.values():
+            codes.assign(row, vector)
+
+    def remove(self, id: str) -> bool:
+        row = self.rows.pop(id, None)
+        if row is None:
+            return False
+        last = len(self) - 1
+        self.index.remove(row, self.metadata[row])
+        if row != last:
+            # Move the last row into the hole so the matrix stays contiguous.
+            moved = self.ids[last]
+            self.index.move(last, row, self.metadata[last])
+            self.matrix[row] = self.matrix[last]
+            self.norms[row] = self.norms[last]
+            for codes in self.codes.values():
+                codes.move(last, row)
+            self.ids[row] = moved
+            self.metadata[row] = self.metadata[last]
+            self.rows[moved] = row
+        self.ids.pop()
+        self.metadata.pop()
+        return True
+
+    def quantized(self, mode: str) -> QuantizedCodes:
+        """Codes for `mode`, encoded on first use and maintained on every write."""
+        codes = self.codes.get(mode)
+        if codes is None:
+            codes = QuantizedCodes.empty(mode, self.dimension, self.matrix.shape[0])
+            if len(self):
+                codes.assign(slice(0, len(self)), self.matrix[: len(self)])
+            self.codes[mode] = codes
+        return codes
+
+
+def cosine_scores(vectors: np.ndarray, norms: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Cosine similarity of `query` to each row of `vectors`, given the rows' norms."""
+    denominator = norms * np.linalg.norm(query)
+    scores = np.asarray(vectors @ query, dtype=np.float32)
+    np.divide(scores, denominator, out=scores, where=denominator > 0)
+    scores[denominator == 0] = 0.0
+    return scores
+
+
+def rescore(
+    vectors: np.ndarray,
+    norms: np.ndarray,
+    codes: QuantizedCodes,
+    query: np.ndarray,
+    size: int,
+    top_k: int,
+    oversample: Optional[int] = None,
+    live: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Pick top_k * oversample candidates from `codes`, then rank them at full precision.
+
+    `oversample` defaults to OVERSAMPLE for the codes' mode.
+    Returns (rows, scores) of the best top_k, best first.
+    """
+    oversample = oversample or OVERSAMPLE[codes.mode]
+    rows = codes.candidates(query, size, max(top_k * oversample, top_k), live=live)
+    rows.sort()  # sequential reads from the full-precision matrix
+    scores = cosine_scores(np.asarray(vectors[rows]), np.asarray(norms[rows]), query)
+    best = top_k_indices(scores, top_k)
+    return rows[best], scores[best]
+
+
+def filtered_search(partition: _Partition, parsed: Dict[str, Any], query: np.ndarray, top_k: int):
+    """Exact top_k over only the rows of `partition` that match a parsed filter.
+
+    Returns (rows, scores), best first.
+    """
+    rows = partition.index.rows(parsed, len(partition))
+    if len(rows) == 0:
+        return rows, np.empty(0, dtype=np.float32)
+    scores = cosine_scores(partition.matrix[rows], partition.norms[rows], query)
+    best = top_k_indices(scores, top_k)
+    return rows[best], scores[best]
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Indices of the top_k largest scores, best first."""
+    if top_k >= len(scores):
+        return np.argsort(-scores)
+    candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+class NumpyStore(VectorStore):
+    """In-process backend answering cosine top-k queries with one matrix-vector product."""
+
+    def __init__(self, dimension: Optional[int] = None):
+        self.dimension = dimension
+        self._partitions: Dict[str, _Partition] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return sum(len(partition) for partition in self._partitions.values())
+
+    def _as_vector(self, vector) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32).reshape(-1)
+        if self.dimension is None:
+            self.dimension = array.shape[0]
+        elif array.shape[0] != self.dimension:
+            raise ValueError(f"Vector dimension {array.shape[0]} does not match store dimension {self.dimension}")
+        return array
+
+    def upsert(self, items, namespace=DEFAULT_NAMESPACE):
+        count = 0
+        with self._lock:
+            for id, vector, metadata in items:
+                array = self._as_vector(vector)
+                partition = self._partitions.get(namespace)
+                if partition is None:
+                    partition = self._partitions[namespace] = _Partition(self.dimension)
+                partition.put(str(id), array, dict(metadata or {}))
+                count += 1
+        return count
+
+    def query(
+        self,
+        vector,
+        top_k=5,
+        namespace=DEFAULT_NAMESPACE,
+        include_values=False,
+        include_metadata=True,
+        quantization=None,
+        filter=None,
+        oversample: Optional[int] = None,
+    ):
+        mode = check_mode(quantization)
+        parsed = parse_filter(filter)
+        with self._lock:
+            partition = self._partitions.get(namespace)
+            if partition is None or len(partition) == 0 or top_k <= 0:
+                return {"matches": [], "namespace": namespace}
+            query = self._as_vector(vector)
+            size = len(partition)
+            if parsed:
+                # The filtered subset is scored exactly, without codes
+                rows, scores = filtered_search(partition, parsed, query, top_k)
+            elif mode is None:
+                scores = cosine_scores(partition.matrix[:size], partition.norms[:size], query)
+                rows = top_k_indices(scores, top_k)
+                scores = scores[rows]
+            else:
+                rows, scores = rescore(
+                    partition.matrix, partition.norms, partition.quantized(mode), query, size, top_k, oversample
+                )
+            matches = []
+            for row, score in zip(rows, scores):
+                match = {"id": partition.ids[row], "score": float(score)}
+                if include_values:
+                    match["values"] = partition.matrix[row].copy()
+                if include_metadata:
+                    match["metadata"] = partition.metadata[row]
+                matches.append(match)
+        return {"matches": matches, "namespace": namespace}
+
+    def fetch(self, ids, namespace=DEFAULT_NAMESPACE):
+        result = {}
+        with self._lock:
+            partition = self._partitions.get(namespace)
+            if partition is None:
+                return result
+            for id in ids:
+                row = partition.rows.get(str(id))
+                if row is not None:
+                    result[str(id)] = {
+                        "id": str(id),
+                        "values": partition.matrix[row].tolist(),
+                        "metadata": partition.metadata[row],
+                    }
+        return result
+
+    def delete(self, ids, namespace=DEFAULT_NAMESPACE):
+        with self._lock:
+            partition = self._partitions.get(namespace)
+            if partition is None:
+                return 0
+            return sum(partition.remove(str(id)) for id in ids)
+
+    def fetch_vectors(self, ids, namespace=DEFAULT_NAMESPACE):
+        with self._lock:
+            partition = self._partitions.get(namespace)
+            if partition is None:
+                return [], np.empty((0, self.dimension or 0), dtype=np.float32)
+            found = [str(id) for id in ids if str(id) in partition.rows]
+            rows = [partition.rows[id] for id in found]
+            return found, partition.matrix[rows]
+
+    def exists(self, ids, namespace=DEFAULT_NAMESPACE):
+        with self._lock:
+            partition = self._partitions.get(namespace)
+            if partition is None:
+                return []
+            return [str(id) for id in ids if str(id) in partition.rows]
+
+
+def create_store(backend: str, **options) -> VectorStore:
+    """Build the backend named by `backend` ("pinecone", "local", "ivf" or "mmap")."""
+    backend = (backend or "pinecone").lower()
+    if backend == "pinecone":
+        return PineconeStore(options["index"])
+    if backend in ("local", "numpy"):
+        return NumpyStore(dimension=options.get("dimension"))
+    if backend == "ivf":
+        from ann import IVFStore
+
+        return IVFStore(
+            dimension=options.get("dimension"),
+            nlist=options.get("nlist"),
+            nprobe=options.get("nprobe") or 16,
+        )
+    if backend == "mmap":
+        from fragstore import MmapStore
+
+        return MmapStore(options.get("path") or "fragment_store", dimension=options.get("dimension"))
+    raise ValueError(f"Unknown vector backend: {backend}")